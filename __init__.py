@@ -74,6 +74,7 @@ def nodes_index():
                 ("sdf_primitives.sdf_cylinder", "SvExSdfCylinderNode"),
                 ("sdf_primitives.sdf_rounded_cylinder", "SvExSdfRoundedCylinderNode"),
                 ("sdf_primitives.sdf_capsule", "SvExSdfCapsuleNode"),
+                ("sdf_primitives.sdf_beam_lattice", "SvExSdfBeamLatticeNode"),
                 ("sdf_primitives.sdf_gyroid", "SvExSdfGyroidNode"),
                 ("sdf_primitives.sdf_graded_gyroid", "SvExSdfGradedGyroidNode"),
                 ("sdf_primitives.sdf_functionally_graded_gyroid", "SvExSdfFunctionallyGradedGyroidNode"),
@@ -94,6 +95,7 @@ def nodes_index():
                 ('sdf.sdf_transform', 'SvExSdfTransformNode'),
                 None,
                 ('sdf.sdf_boolean', 'SvExSdfBooleanNode'),
+                ('sdf.sdf_instances', 'SvExSdfInstancesNode'),
                 ('sdf.sdf_blend', 'SvExSdfBlendNode'),
                 ('sdf.sdf_transition_linear', 'SvExSdfLinearTransitionNode'),
                 ('sdf.sdf_transition_radial', 'SvExSdfRadialTransitionNode'),
@@ -108,6 +110,7 @@ def nodes_index():
                 ('sdf.sdf_revolve', 'SvExSdfRevolveNode'),
                 None,
                 ('sdf.sdf_generate', 'SvExSdfGenerateNode'),
+                ('sdf.sdf_export', 'SvExSdfExportNode'),
             ]),
             ("Data", [
                 ("data.spreadsheet", "SvSpreadsheetNode"),
@@ -43,3 +43,12 @@ except ImportError:
     info(sdf_d.message)
     sdf = None
 
+numba_d = ex_dependencies["numba"] = SvDependency("numba", "https://numba.pydata.org/")
+try:
+    import numba
+    numba_d.message = "Numba package is available"
+    numba_d.module = numba
+except ImportError:
+    numba_d.message = "Numba package is not available. SDF evaluation will use NumPy only"
+    info(numba_d.message)
+    numba = None
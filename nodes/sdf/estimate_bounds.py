@@ -23,6 +23,25 @@ class SvExSdfEstimateBoundsNode(bpy.types.Node, SverchCustomTreeNode):
     bl_icon = 'OUTLINER_OB_EMPTY'
     sv_icon = 'SV_BOUNDING_BOX'
 
+    budget : IntProperty(
+        name = "Sample budget",
+        description = "Maximum number of samples of each field, which is not an SDF tree",
+        min = BOUNDS_LATTICE**3,
+        default = BOUNDS_BUDGET,
+        update = updateNode)
+
+    tolerance : FloatProperty(
+        name = "Tolerance",
+        description = "Refinement of bounds stops when they change by less than this fraction of their size",
+        min = 0,
+        default = BOUNDS_TOLERANCE,
+        precision = 6,
+        update = updateNode)
+
+    def draw_buttons(self, context, layout):
+        layout.prop(self, 'budget')
+        layout.prop(self, 'tolerance')
+
     def sv_init(self, context):
         self.inputs.new('SvScalarFieldSocket', "Field")
         self.outputs.new('SvVerticesSocket', "Bounds")
@@ -33,11 +52,12 @@ class SvExSdfEstimateBoundsNode(bpy.types.Node, SverchCustomTreeNode):
 
         fields_s = self.inputs['Field'].sv_get()
         fields_s = ensure_nesting_level(fields_s, 2, data_types=(SvScalarField,))
-        bounds_out = []
-        for fields in fields_s:
-            for field in fields:
-                bounds = estimate_bounds(field)
-                bounds_out.append(bounds)
+        # All fields are refined together
+        fields = [field for fields in fields_s for field in fields]
+        bounds_out = estimate_bounds_many(fields, self.budget, self.tolerance)
+        for i, bounds in enumerate(bounds_out):
+            if bounds is None:
+                raise Exception(f"Can not estimate bounds of field #{i}: no zero level surface found")
 
         self.outputs['Bounds'].sv_set(bounds_out)
 
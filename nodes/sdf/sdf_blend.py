@@ -58,7 +58,7 @@ class SvExSdfBlendNode(bpy.types.Node, SverchCustomTreeNode):
             for sdf1, sdf2, k in zip_long_repeat(*params):
                 sdf1 = scalar_field_to_sdf(sdf1, 0)
                 sdf2 = scalar_field_to_sdf(sdf2, 0)
-                sdf = blend(sdf1, sdf2, k=k)
+                sdf = sdf1.blend(sdf2, k=k)
                 field = SvExSdfScalarField(sdf)
                 new_sdf.append(field)
             if flat_output:
@@ -64,21 +64,17 @@ class SvExSdfBooleanNode(bpy.types.Node, SverchCustomTreeNode):
         layout.prop(self, 'accumulate_nested')
 
     def _accumulate(self, sdfs, k):
-        if self.operation == 'UNION':
-            op = union
-        elif self.operation == 'INTERSECTION':
-            op = intersection
-        else:
-            op = difference
-
         if not sdfs:
             return sdfs
+        if len(sdfs) == 1:
+            return sdfs[0]
 
-        result = sdfs[0]
-        for sdf in sdfs[1:]:
-            result = op(result, sdf, k=k)
-
-        return result
+        if self.operation == 'UNION':
+            return SdfCulledUnion(sdfs, k=k)
+        elif self.operation == 'INTERSECTION':
+            return SdfNaryIntersection(sdfs, k=k)
+        else:
+            return SdfNaryIntersection(sdfs, k=k, subtract=True)
 
     def process(self):
         if not any(socket.is_linked for socket in self.outputs):
@@ -104,11 +100,11 @@ class SvExSdfBooleanNode(bpy.types.Node, SverchCustomTreeNode):
                     sdf1 = scalar_field_to_sdf(sdf1, 0)
                     sdf2 = scalar_field_to_sdf(sdf2, 0)
                     if self.operation == 'UNION':
-                        sdf = union(sdf1, sdf2, k=k)
+                        sdf = sdf1.union(sdf2, k=k)
                     elif self.operation == 'INTERSECTION':
-                        sdf = intersection(sdf1, sdf2, k=k)
+                        sdf = sdf1.intersection(sdf2, k=k)
                     else:
-                        sdf = difference(sdf1, sdf2, k=k)
+                        sdf = sdf1.difference(sdf2, k=k)
                     field = SvExSdfScalarField(sdf)
                     new_sdf.append(field)
                 if flat_output:
@@ -0,0 +1,228 @@
+import os
+
+import numpy as np
+
+import bpy
+from bpy.props import FloatProperty, EnumProperty, BoolProperty, IntProperty, StringProperty
+
+from sverchok.node_tree import SverchCustomTreeNode
+from sverchok.data_structure import updateNode, zip_long_repeat, ensure_nesting_level
+from sverchok.utils.field.scalar import SvScalarField
+from sverchok.utils.dummy_nodes import add_dummy
+from sverchok_extra.dependencies import sdf
+from sverchok_extra.utils.sdf import *
+from sverchok_extra.utils import sdf_mesh
+from sverchok_extra.utils.sdf_cache import get_volume_cache
+from sverchok_extra.utils.sdf_export import export_mesh
+
+if sdf is None:
+    add_dummy('SvExSdfExportNode', "SDF Export Mesh", 'sdf')
+else:
+    class SvExSdfExportNode(bpy.types.Node, SverchCustomTreeNode):
+        """
+        Triggers: SDF Export Mesh STL PLY
+        Tooltip: Mesh SDF and write it into binary STL or PLY file, batch by batch
+        """
+        bl_idname = 'SvExSdfExportNode'
+        bl_label = 'SDF Export Mesh'
+        bl_icon = 'EXPORT'
+
+        active : BoolProperty(
+            name = "Write",
+            description = "Write files when the node is updated",
+            default = False,
+            update = updateNode)
+
+        file_path : StringProperty(
+            name = "File",
+            description = "Path of the file; when there are several SDFs, their number is added to the name",
+            subtype = 'FILE_PATH',
+            update = updateNode)
+
+        file_formats = [
+                ('STL', "STL", "Binary STL", 0),
+                ('PLY', "PLY", "Binary PLY with vertices shared across batches", 1)
+            ]
+
+        file_format : EnumProperty(
+            name = "Format",
+            items = file_formats,
+            default = 'STL',
+            update = updateNode)
+
+        step : FloatProperty(
+            name = "Step",
+            default = 0.05,
+            precision = 8,
+            update = updateNode)
+
+        samples : IntProperty(
+            name = "Samples",
+            min = 100,
+            default = 1*1000*1000,
+            update = updateNode)
+
+        def update_sockets(self, context):
+            self.inputs['Step'].hide_safe = self.precision_mode != 'STEP'
+            self.inputs['Samples'].hide_safe = self.precision_mode != 'SAMPLES'
+            updateNode(self, context)
+
+        precision_modes = [
+                ('STEP', "Step", "Step", 0),
+                ('SAMPLES', "Samples", "Samples", 1)
+            ]
+
+        precision_mode : EnumProperty(
+            name = "Precision mode",
+            items = precision_modes,
+            default = 'STEP',
+            update = update_sockets)
+
+        specify_workers : BoolProperty(
+            name = "Specify workers count",
+            default = False,
+            update = updateNode)
+
+        workers_count : IntProperty(
+            name = "Workers count",
+            min = 1,
+            default = 4,
+            update = updateNode)
+
+        backends = [
+                ('THREADS', "Threads", "Mesh batches in threads of Blender process", 0),
+                ('PROCESSES', "Processes", "Mesh batches in worker processes: faster for SDFs evaluated by Python code (fields, callbacks), which hold the GIL", 1)
+            ]
+
+        backend : EnumProperty(
+            name = "Backend",
+            items = backends,
+            default = 'THREADS',
+            update = updateNode)
+
+        batch_size : IntProperty(
+            name = "Batch size",
+            min = 1,
+            default = sdf_mesh.BATCH_SIZE,
+            update = updateNode)
+
+        float_precisions = [
+                ('DOUBLE', "Double", "Evaluate SDF in 64-bit floating point", 0),
+                ('SINGLE', "Single", "Evaluate SDF in 32-bit floating point: faster and uses less memory, but less precise", 1)
+            ]
+
+        float_precision : EnumProperty(
+            name = "Float precision",
+            items = float_precisions,
+            default = 'DOUBLE',
+            update = updateNode)
+
+        sparse : BoolProperty(
+            name = "Sparse",
+            default = True,
+            update = updateNode)
+
+        adaptive : BoolProperty(
+            name = "Adaptive",
+            description = "Subdivide an octree only near the surface, instead of checking every batch of the bounding box; faster for large, mostly empty bounds",
+            default = False,
+            update = updateNode)
+
+        use_cache : BoolProperty(
+            name = "Cache volumes",
+            description = "Reuse SDF volumes sampled earlier for identical SDF trees",
+            default = False,
+            update = updateNode)
+
+        def draw_buttons(self, context, layout):
+            layout.prop(self, 'file_path')
+            layout.prop(self, 'file_format')
+            layout.prop(self, 'precision_mode')
+            layout.prop(self, 'adaptive')
+            layout.prop(self, 'active', toggle=True)
+
+        def draw_buttons_ext(self, context, layout):
+            self.draw_buttons(context, layout)
+            layout.prop(self, 'specify_workers')
+            if self.specify_workers:
+                layout.prop(self, 'workers_count')
+            layout.prop(self, 'backend')
+            layout.prop(self, 'batch_size')
+            layout.prop(self, 'sparse')
+            layout.prop(self, 'float_precision')
+            layout.prop(self, 'use_cache')
+
+        def sv_init(self, context):
+            self.inputs.new('SvScalarFieldSocket', "SDF")
+            self.inputs.new('SvStringsSocket', "Step").prop_name = 'step'
+            self.inputs.new('SvStringsSocket', "Samples").prop_name = 'samples'
+            self.outputs.new('SvStringsSocket', "Files")
+            self.outputs.new('SvStringsSocket', "Triangles")
+            self.update_sockets(context)
+
+        def file_paths(self, count):
+            path = bpy.path.abspath(self.file_path)
+            if count == 1:
+                return [path]
+            base, ext = os.path.splitext(path)
+            return [f"{base}_{i}{ext}" for i in range(count)]
+
+        def process(self):
+            if not self.active or not self.file_path:
+                return
+
+            sdf_s = self.inputs['SDF'].sv_get()
+            step_s = self.inputs['Step'].sv_get()
+            samples_s = self.inputs['Samples'].sv_get()
+
+            sdf_s = ensure_nesting_level(sdf_s, 2, data_types=(SvScalarField,))
+            step_s = ensure_nesting_level(step_s, 2)
+            samples_s = ensure_nesting_level(samples_s, 2)
+
+            if self.float_precision == 'SINGLE':
+                dtype = np.float32
+            else:
+                dtype = np.float64
+
+            if self.use_cache:
+                cache = get_volume_cache()
+            else:
+                cache = None
+
+            if self.specify_workers:
+                workers = self.workers_count
+            else:
+                workers = sdf_mesh.WORKERS
+
+            jobs = []
+            for params in zip_long_repeat(sdf_s, step_s, samples_s):
+                for sdf, step, samples in zip_long_repeat(*params):
+                    if self.precision_mode == 'STEP':
+                        samples = sdf_mesh.SAMPLES
+                    else:
+                        step = None
+                    jobs.append((sdf, step, samples))
+
+            files_out = []
+            triangles_out = []
+            for (sdf, step, samples), path in zip(jobs, self.file_paths(len(jobs))):
+                sdf = scalar_field_to_sdf(sdf, 0)
+                count = export_mesh(sdf, path, self.file_format,
+                            step = step, samples = samples,
+                            workers = workers, batch_size = self.batch_size,
+                            sparse = self.sparse, dtype = dtype,
+                            cache = cache, adaptive = self.adaptive,
+                            backend = self.backend)
+                files_out.append(path)
+                triangles_out.append(count)
+
+            self.outputs['Files'].sv_set([files_out])
+            self.outputs['Triangles'].sv_set([triangles_out])
+
+def register():
+    if sdf is not None:
+        bpy.utils.register_class(SvExSdfExportNode)
+
+def unregister():
+    if sdf is not None:
+        bpy.utils.unregister_class(SvExSdfExportNode)
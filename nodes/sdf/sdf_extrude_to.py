@@ -67,7 +67,7 @@ else:
                     sdf_2d_1 = scalar_field_to_sdf_2d(sdf1, 0)
                     sdf_2d_2 = scalar_field_to_sdf_2d(sdf2, 0)
 
-                    sdf = extrude_to(sdf_2d_1, sdf_2d_2, height, e=easing_function)
+                    sdf = SdfExtrudeTo(sdf_2d_1, sdf_2d_2, height, e=easing_function)
 
                     field = SvExSdfScalarField(sdf)
                     new_sdf.append(field)
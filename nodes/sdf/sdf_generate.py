@@ -1,3 +1,5 @@
+import itertools
+
 import numpy as np
 
 import bpy
@@ -7,9 +9,14 @@ from sverchok.node_tree import SverchCustomTreeNode
 from sverchok.data_structure import updateNode, zip_long_repeat, ensure_nesting_level
 from sverchok.utils.field.scalar import SvScalarField
 from sverchok.utils.dummy_nodes import add_dummy
+from sverchok.utils.logging import debug
 from sverchok_extra.dependencies import sdf
 from sverchok_extra.utils.sdf import *
-from sverchok.utils.sv_bmesh_utils import remove_doubles
+from sverchok_extra.utils import sdf_mesh
+from sverchok_extra.utils.sdf_cache import get_volume_cache
+
+# Meshes of the previous update of each node, for incremental mode
+_mesh_states = dict()
 
 if sdf is None:
     add_dummy('SvExSdfGenerateNode', "SDF Generate Mesh", 'sdf')
@@ -76,10 +83,32 @@ else:
             default = 4,
             update = updateNode)
 
+        backends = [
+                ('THREADS', "Threads", "Mesh batches in threads of Blender process", 0),
+                ('PROCESSES', "Processes", "Mesh batches in worker processes: faster for SDFs evaluated by Python code (fields, callbacks), which hold the GIL; marching cubes only", 1)
+            ]
+
+        backend : EnumProperty(
+            name = "Backend",
+            items = backends,
+            default = 'THREADS',
+            update = updateNode)
+
         batch_size : IntProperty(
             name = "Batch size",
             min = 1,
-            default = sdf.mesh.BATCH_SIZE,
+            default = sdf_mesh.BATCH_SIZE,
+            update = updateNode)
+
+        float_precisions = [
+                ('DOUBLE', "Double", "Evaluate SDF in 64-bit floating point", 0),
+                ('SINGLE', "Single", "Evaluate SDF in 32-bit floating point: faster and uses less memory, but less precise", 1)
+            ]
+
+        float_precision : EnumProperty(
+            name = "Float precision",
+            items = float_precisions,
+            default = 'DOUBLE',
             update = updateNode)
         
         sparse : BoolProperty(
@@ -87,9 +116,79 @@ else:
             default = True,
             update = updateNode)
 
+        algorithms = [
+                ('MARCHING_CUBES', "Marching Cubes", "Marching cubes: rounds sharp edges and corners, unless the step is small", 0),
+                ('DUAL_CONTOURING', "Dual Contouring", "Dual contouring: places vertices by SDF gradients, keeping sharp edges and corners at larger steps", 1)
+            ]
+
+        algorithm : EnumProperty(
+            name = "Algorithm",
+            items = algorithms,
+            default = 'MARCHING_CUBES',
+            update = updateNode)
+
+        adaptive : BoolProperty(
+            name = "Adaptive",
+            description = "Subdivide an octree only near the surface, instead of checking every batch of the bounding box; faster for large, mostly empty bounds",
+            default = False,
+            update = updateNode)
+
+        use_cache : BoolProperty(
+            name = "Cache volumes",
+            description = "Reuse SDF volumes sampled earlier for identical SDF trees",
+            default = True,
+            update = updateNode)
+
+        cache_to_disk : BoolProperty(
+            name = "Spill cache to disk",
+            description = "Save volumes evicted from the memory cache into Blender's temporary directory",
+            default = False,
+            update = updateNode)
+
+        incremental : BoolProperty(
+            name = "Incremental",
+            description = "Keep the mesh between updates, and re-mesh only the regions where the SDF changed (marching cubes only)",
+            default = False,
+            update = updateNode)
+
+        decimate : BoolProperty(
+            name = "Decimate",
+            description = "Simplify the mesh by collapsing edges in order of quadric error",
+            default = False,
+            update = updateNode)
+
+        decimate_faces : IntProperty(
+            name = "Target faces",
+            description = "Number of faces to keep for each SDF; 0 means no limit",
+            min = 0,
+            default = 10000,
+            update = updateNode)
+
+        decimate_error : FloatProperty(
+            name = "Max error",
+            description = "Maximum distance by which decimation can move the surface; 0 means no limit",
+            min = 0,
+            default = 0,
+            precision = 6,
+            update = updateNode)
+
+        output_numpy : BoolProperty(
+            name = "Output NumPy",
+            description = "Output NumPy arrays (float32 vertices, int32 faces) instead of Python lists; uses much less memory for large meshes",
+            default = False,
+            update = updateNode)
+
         def draw_buttons(self, context, layout):
+            layout.prop(self, 'algorithm')
             layout.prop(self, 'precision_mode')
+            layout.prop(self, 'adaptive')
+            if self.algorithm == 'MARCHING_CUBES':
+                layout.prop(self, 'incremental')
             layout.prop(self, 'remove_doubles')
+            layout.prop(self, 'decimate')
+            if self.decimate:
+                layout.prop(self, 'decimate_faces')
+                layout.prop(self, 'decimate_error')
 
         def draw_buttons_ext(self, context, layout):
             self.draw_buttons(context, layout)
@@ -97,8 +196,15 @@ else:
             layout.prop(self, 'specify_workers')
             if self.specify_workers:
                 layout.prop(self, 'workers_count')
+            if self.algorithm == 'MARCHING_CUBES':
+                layout.prop(self, 'backend')
             layout.prop(self, 'batch_size')
             layout.prop(self, 'sparse')
+            layout.prop(self, 'float_precision')
+            layout.prop(self, 'use_cache')
+            if self.use_cache:
+                layout.prop(self, 'cache_to_disk')
+            layout.prop(self, 'output_numpy')
 
         def sv_init(self, context):
             self.inputs.new('SvScalarFieldSocket', "SDF")
@@ -106,8 +212,12 @@ else:
             self.inputs.new('SvStringsSocket', "Samples").prop_name = 'samples'
             self.outputs.new('SvVerticesSocket', "Vertices")
             self.outputs.new('SvStringsSocket', "Faces")
+            self.outputs.new('SvDictionarySocket', "Statistics")
             self.update_sockets(context)
 
+        def sv_free(self):
+            _mesh_states.pop(self.node_id, None)
+
         def process(self):
             if not any(socket.is_linked for socket in self.outputs):
                 return
@@ -120,41 +230,107 @@ else:
             step_s = ensure_nesting_level(step_s, 2)
             samples_s = ensure_nesting_level(samples_s, 2)
 
-            verts_out = []
-            faces_out = []
-            for params in zip_long_repeat(sdf_s, step_s, samples_s):
-                new_verts = []
-                new_faces = []
-                for sdf, step, samples in zip_long_repeat(*params):
-                    sdf = scalar_field_to_sdf(sdf, 0)
+            if self.float_precision == 'SINGLE':
+                dtype = np.float32
+            else:
+                dtype = np.float64
+
+            if self.use_cache:
+                cache = get_volume_cache(disk = self.cache_to_disk)
+            else:
+                cache = None
+
+            if self.incremental:
+                states = _mesh_states.setdefault(self.node_id, dict())
+            else:
+                _mesh_states.pop(self.node_id, None)
+                states = None
+
+            if self.specify_workers:
+                workers = self.workers_count
+            else:
+                workers = sdf_mesh.WORKERS
+
+            # All objects are meshed at once, so that their batches are
+            # shared between workers
+            objects = []
+            sdfs, steps, samples_list, object_states = [], [], [], []
+            for i, params in enumerate(zip_long_repeat(sdf_s, step_s, samples_s)):
+                count = 0
+                for j, (sdf, step, samples) in enumerate(zip_long_repeat(*params)):
+                    sdfs.append(scalar_field_to_sdf(sdf, 0))
 
                     if self.precision_mode == 'STEP':
-                        samples = mesh.SAMPLES
+                        samples = sdf_mesh.SAMPLES
                     else:
                         step = None
+                    steps.append(step)
+                    samples_list.append(samples)
 
-                    if self.specify_workers:
-                        workers = self.workers
+                    if states is not None:
+                        object_states.append(states.setdefault((i, j), sdf_mesh.SdfMeshState()))
                     else:
-                        workers = mesh.WORKERS
-
-                    print(f"Step={step}, samples={samples}")
-
-                    points = sdf.generate(step=step, samples=samples,
-                                workers = workers, batch_size = self.batch_size,
-                                sparse = self.sparse)
-
-                    res = geometry_from_points(points)
-                    
-                    verts = res.verts
-                    faces = res.tris
-
-                    if self.remove_doubles:
-                        verts, _, faces = remove_doubles(verts, [], faces, self.threshold)
-
-                    new_verts.extend(verts)
-                    new_faces.extend(faces)
+                        object_states.append(None)
+                    count += 1
+                objects.append(count)
+
+            stats = sdf_mesh.SdfMeshStats()
+            with stats.stage('total'):
+                self.build_meshes(objects, sdfs, steps, samples_list, object_states,
+                        workers, dtype, cache, stats)
+            debug("SDF generate: %s", stats)
+
+            # Nodes created by older versions have no Statistics output
+            if 'Statistics' in self.outputs:
+                self.outputs['Statistics'].sv_set([stats.as_dict()])
+
+        def build_meshes(self, objects, sdfs, steps, samples_list, object_states, workers, dtype, cache, stats):
+            meshes = sdf_mesh.generate_many(sdfs, steps, samples_list,
+                        states = object_states,
+                        workers = workers, batch_size = self.batch_size,
+                        sparse = self.sparse, dtype = dtype,
+                        cache = cache, adaptive = self.adaptive,
+                        algorithm = self.algorithm, backend = self.backend,
+                        stats = stats)
+
+            if self.remove_doubles:
+                threshold = self.threshold
+            else:
+                threshold = 0
 
+            verts_out = []
+            faces_out = []
+            meshes = iter(meshes)
+            for count in objects:
+                new_verts = []
+                new_faces = []
+                for points in itertools.islice(meshes, count):
+                    with stats.stage('weld'):
+                        verts, faces = sdf_mesh.weld_triangles(points, threshold)
+                    if self.decimate:
+                        with stats.stage('decimate'):
+                            verts, faces = sdf_mesh.decimate(verts, faces,
+                                                target = self.decimate_faces or None,
+                                                max_error = self.decimate_error or None)
+                    stats.count('vertices', len(verts))
+                    stats.count('faces', len(faces))
+
+                    with stats.stage('output'):
+                        if self.output_numpy:
+                            offset = sum(len(vs) for vs in new_verts)
+                            new_verts.append(verts.astype(np.float32, copy=False))
+                            new_faces.append((faces + offset).astype(np.int32))
+                        else:
+                            new_faces.extend((faces + len(new_verts)).tolist())
+                            new_verts.extend(verts.tolist())
+
+                if self.output_numpy:
+                    with stats.stage('output'):
+                        if len(new_verts) == 1:
+                            new_verts, new_faces = new_verts[0], new_faces[0]
+                        else:
+                            new_verts = np.concatenate(new_verts)
+                            new_faces = np.concatenate(new_faces)
                 verts_out.append(new_verts)
                 faces_out.append(new_faces)
 
@@ -0,0 +1,86 @@
+import numpy as np
+
+import bpy
+from bpy.props import FloatProperty
+from mathutils import Matrix
+
+from sverchok.node_tree import SverchCustomTreeNode
+from sverchok.data_structure import updateNode, zip_long_repeat, ensure_nesting_level, get_data_nesting_level
+from sverchok.utils.field.scalar import SvScalarField
+from sverchok.utils.dummy_nodes import add_dummy
+from sverchok_extra.dependencies import sdf, scipy
+from sverchok_extra.utils.sdf import *
+
+if sdf is None:
+    add_dummy('SvExSdfInstancesNode', "SDF Instances", 'sdf')
+elif scipy is None:
+    add_dummy('SvExSdfInstancesNode', "SDF Instances", 'scipy')
+
+class SvExSdfInstancesNode(bpy.types.Node, SverchCustomTreeNode):
+    """
+    Triggers: SDF Instances Array Copies Matrix
+    Tooltip: Union of copies of SDF placed by matrices; each point evaluates only copies near to it
+    """
+    bl_idname = 'SvExSdfInstancesNode'
+    bl_label = 'SDF Instances'
+    bl_icon = 'OUTLINER_OB_EMPTY'
+
+    k_value : FloatProperty(
+            name = "K Value",
+            description = "Smoothness of union of copies",
+            default = 0.0,
+            min = 0.0,
+            update = updateNode)
+
+    def sv_init(self, context):
+        self.inputs.new('SvScalarFieldSocket', "SDF")
+        self.inputs.new('SvMatrixSocket', "Matrices")
+        self.inputs.new('SvStringsSocket', "KValue").prop_name = 'k_value'
+        self.outputs.new('SvScalarFieldSocket', "SDF")
+
+    def process(self):
+        if not any(socket.is_linked for socket in self.outputs):
+            return
+        if not self.inputs['Matrices'].is_linked:
+            return
+
+        sdf_s = self.inputs['SDF'].sv_get()
+        matrices_s = self.inputs['Matrices'].sv_get()
+        ks_s = self.inputs['KValue'].sv_get()
+
+        input_level = get_data_nesting_level(sdf_s, data_types=(SvScalarField,))
+        flat_output = input_level == 1
+        sdf_s = ensure_nesting_level(sdf_s, 2, data_types=(SvScalarField,))
+        matrices_s = ensure_nesting_level(matrices_s, 2, data_types=(Matrix,))
+        ks_s = ensure_nesting_level(ks_s, 2)
+
+        sdf_out = []
+        # All matrices of one list are copies of each SDF of the
+        # corresponding list of SDFs
+        for sdfs, matrices, ks in zip_long_repeat(sdf_s, matrices_s, ks_s):
+            if not matrices:
+                continue
+            # Copies by degenerate matrices (zero scale) are skipped
+            matrices = np.array([np.array(matrix) for matrix in matrices])
+            new_sdf = []
+            for sdf, k in zip_long_repeat(sdfs, ks):
+                if isinstance(sdf, SvExSdf2DScalarField):
+                    raise Exception("SDF Instances require a 3D SDF; extrude or revolve the 2D SDF first")
+                sdf = scalar_field_to_sdf(sdf, 0)
+                sdf = SdfInstances(sdf, matrices, k=k)
+                field = SvExSdfScalarField(sdf)
+                new_sdf.append(field)
+            if flat_output:
+                sdf_out.extend(new_sdf)
+            else:
+                sdf_out.append(new_sdf)
+
+        self.outputs['SDF'].sv_set(sdf_out)
+
+def register():
+    if sdf is not None and scipy is not None:
+        bpy.utils.register_class(SvExSdfInstancesNode)
+
+def unregister():
+    if sdf is not None and scipy is not None:
+        bpy.utils.unregister_class(SvExSdfInstancesNode)
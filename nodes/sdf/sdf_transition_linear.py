@@ -77,7 +77,7 @@ else:
                 for sdf1, sdf2, point1, point2 in zip_long_repeat(*params):
                     sdf1 = scalar_field_to_sdf(sdf1, 0)
                     sdf2 = scalar_field_to_sdf(sdf2, 0)
-                    sdf = transition_linear(sdf1, sdf2, p0=point1, p1=point2, e=easing_function)
+                    sdf = SdfTransitionLinear(sdf1, sdf2, p0=point1, p1=point2, e=easing_function)
                     field = SvExSdfScalarField(sdf)
                     new_sdf.append(field)
                 if flat_output:
@@ -74,7 +74,7 @@ else:
                 for sdf1, sdf2, radius1, radius2 in zip_long_repeat(*params):
                     sdf1 = scalar_field_to_sdf(sdf1, 0)
                     sdf2 = scalar_field_to_sdf(sdf2, 0)
-                    sdf = transition_radial(sdf1, sdf2, r0=radius1, r1=radius2, e=easing_function)
+                    sdf = SdfTransitionRadial(sdf1, sdf2, r0=radius1, r1=radius2, e=easing_function)
                     field = SvExSdfScalarField(sdf)
                     new_sdf.append(field)
                 if flat_output:
@@ -63,7 +63,7 @@ class SvExSdf2dCircleNode(bpy.types.Node, SverchCustomTreeNode):
             new_fields = []
             for radius, origin in zip_long_repeat(*params):
                 origin = origin[0:2]
-                sdf2d = circle(radius=radius, center=origin)
+                sdf2d = SdfCircle(radius=radius, center=origin)
 
                 field = SvExSdf2DScalarField(sdf2d)
 
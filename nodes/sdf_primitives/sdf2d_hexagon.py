@@ -64,8 +64,11 @@ class SvExSdf2dHexagonNode(bpy.types.Node, SverchCustomTreeNode):
             for radius, origin in zip_long_repeat(*params):
                 origin = origin[0:2]
                 sdf2d = hexagon(radius).translate(origin)
+                # Radius is the apothem; corners are farther from the center
+                r = 2 * radius / np.sqrt(3)
+                box = (np.array(origin) - r, np.array(origin) + r)
 
-                field = SvExSdf2DScalarField(sdf2d)
+                field = SvExSdf2DScalarField(SdfOpaque(sdf2d, dim=2, box=box))
 
                 new_fields.append(field)
             if self.flat_output:
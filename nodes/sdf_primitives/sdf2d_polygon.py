@@ -50,8 +50,9 @@ class SvExSdf2dPolygonNode(bpy.types.Node, SverchCustomTreeNode):
             for verts in params:
                 verts = [v[0:2] for v in verts]
                 sdf2d = polygon(verts)
+                box = (np.min(verts, axis=0), np.max(verts, axis=0))
 
-                field = SvExSdf2DScalarField(sdf2d)
+                field = SvExSdf2DScalarField(SdfOpaque(sdf2d, dim=2, box=box))
 
                 new_fields.append(field)
             if self.flat_output:
@@ -0,0 +1,92 @@
+import numpy as np
+
+import bpy
+from bpy.props import FloatProperty, BoolProperty
+
+from sverchok.node_tree import SverchCustomTreeNode
+from sverchok.data_structure import updateNode, zip_long_repeat, ensure_nesting_level, repeat_last_for_length
+from sverchok.utils.dummy_nodes import add_dummy
+from sverchok_extra.dependencies import sdf
+from sverchok_extra.utils.sdf import *
+
+if sdf is None:
+    add_dummy('SvExSdfBeamLatticeNode', "SDF Beam Lattice", 'sdf')
+
+class SvExSdfBeamLatticeNode(bpy.types.Node, SverchCustomTreeNode):
+    """
+    Triggers: SDF Beam Lattice Struts Edges Capsules
+    Tooltip: Union of capsules along edges of a mesh; each point evaluates only struts near to it
+    """
+    bl_idname = 'SvExSdfBeamLatticeNode'
+    bl_label = 'SDF Beam Lattice'
+    bl_icon = 'MOD_WIREFRAME'
+
+    radius : FloatProperty(
+        name = "Radius",
+        description = "Radius of struts; can be given for each edge",
+        default = 0.05,
+        min = 0.0,
+        update = updateNode)
+
+    k_value : FloatProperty(
+        name = "K Value",
+        description = "Smoothness of union of struts at the nodes of the lattice",
+        default = 0.0,
+        min = 0.0,
+        update = updateNode)
+
+    flat_output : BoolProperty(
+        name = "Flat output",
+        default = True,
+        update = updateNode)
+
+    def draw_buttons(self, context, layout):
+        layout.prop(self, 'flat_output')
+
+    def sv_init(self, context):
+        self.inputs.new('SvVerticesSocket', "Vertices")
+        self.inputs.new('SvStringsSocket', "Edges")
+        self.inputs.new('SvStringsSocket', "Radius").prop_name = 'radius'
+        self.inputs.new('SvStringsSocket', "KValue").prop_name = 'k_value'
+        self.outputs.new('SvScalarFieldSocket', "SDF")
+
+    def process(self):
+        if not any(socket.is_linked for socket in self.outputs):
+            return
+        if not self.inputs['Vertices'].is_linked or not self.inputs['Edges'].is_linked:
+            return
+
+        verts_s = self.inputs['Vertices'].sv_get()
+        edges_s = self.inputs['Edges'].sv_get()
+        radius_s = self.inputs['Radius'].sv_get()
+        ks_s = self.inputs['KValue'].sv_get()
+
+        verts_s = ensure_nesting_level(verts_s, 4)
+        edges_s = ensure_nesting_level(edges_s, 4)
+        radius_s = ensure_nesting_level(radius_s, 3)
+        ks_s = ensure_nesting_level(ks_s, 2)
+
+        fields_out = []
+        for params in zip_long_repeat(verts_s, edges_s, radius_s, ks_s):
+            new_fields = []
+            for verts, edges, radiuses, k in zip_long_repeat(*params):
+                if not edges:
+                    continue
+                radiuses = repeat_last_for_length(radiuses, len(edges))
+                sdf = SdfBeamLattice(verts, edges, radiuses, k=k)
+                field = SvExSdfScalarField(sdf)
+                new_fields.append(field)
+            if self.flat_output:
+                fields_out.extend(new_fields)
+            else:
+                fields_out.append(new_fields)
+
+        self.outputs['SDF'].sv_set(fields_out)
+
+def register():
+    if sdf is not None:
+        bpy.utils.register_class(SvExSdfBeamLatticeNode)
+
+def unregister():
+    if sdf is not None:
+        bpy.utils.unregister_class(SvExSdfBeamLatticeNode)
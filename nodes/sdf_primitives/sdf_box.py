@@ -80,7 +80,7 @@ class SvExSdfBoxNode(bpy.types.Node, SverchCustomTreeNode):
         for params in zip_long_repeat(size_x_s, size_y_s, size_z_s, origins_s):
             new_fields = []
             for size_x, size_y, size_z, origin, in zip_long_repeat(*params):
-                sdf = box(size=(size_x,size_y,size_z), center=origin)
+                sdf = SdfBox(size=(size_x,size_y,size_z), center=origin)
                 field = SvExSdfScalarField(sdf)
                 new_fields.append(field)
             if self.flat_output:
@@ -70,7 +70,7 @@ class SvExSdfCapsuleNode(bpy.types.Node, SverchCustomTreeNode):
         for params in zip_long_repeat(radiuses_s, point1_s, point2_s):
             new_fields = []
             for radius, point1, point2 in zip_long_repeat(*params):
-                sdf = capsule(point1, point2, radius)
+                sdf = SdfCapsule(point1, point2, radius)
                 field = SvExSdfScalarField(sdf)
                 new_fields.append(field)
             if self.flat_output:
@@ -78,7 +78,7 @@ class SvExSdfCylinderNode(bpy.types.Node, SverchCustomTreeNode):
                 if self.origin_at_center:
                     x0, y0, z0 = origin
                     origin = x0, y0, z0 - (height / 2.0)
-                sdf = capped_cylinder((0, 0, 0), (0, 0, height), radius).translate(origin)
+                sdf = SdfCappedCylinder((0, 0, 0), (0, 0, height), radius).translate(origin)
                 field = SvExSdfScalarField(sdf)
                 new_fields.append(field)
             if self.flat_output:
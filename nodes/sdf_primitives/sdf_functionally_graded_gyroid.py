@@ -52,9 +52,20 @@ class SvExSdfFunctionallyGradedGyroidNode(bpy.types.Node, SverchCustomTreeNode):
         default = True,
         update=updateNode)
 
+    processes : IntProperty(
+        name = "Processes",
+        description = "Number of worker processes evaluating the field on large point sets; 0 to evaluate in Blender process",
+        default = 0,
+        min = 0,
+        update=updateNode)
+
     def draw_buttons(self, context, layout):
         layout.prop(self, 'flat_output')
 
+    def draw_buttons_ext(self, context, layout):
+        self.draw_buttons(context, layout)
+        layout.prop(self, 'processes')
+
     def sv_init(self, context):
         self.inputs.new('SvStringsSocket', "XSize").prop_name = 'size_x'
         self.inputs.new('SvStringsSocket', "YSize").prop_name = 'size_y'
@@ -86,10 +97,10 @@ class SvExSdfFunctionallyGradedGyroidNode(bpy.types.Node, SverchCustomTreeNode):
         for params in zip_long_repeat(size_x_s, size_y_s, size_z_s, thickness_s, value_s, origins_s):
             new_fields = []
             for size_x, size_y, size_z, thickness, value, origin in zip_long_repeat(*params):
-                thickness = scalar_field_to_sdf(thickness, 0)
-                value = scalar_field_to_sdf(value, 0)
+                thickness = scalar_field_to_sdf(thickness, 0, processes=self.processes)
+                value = scalar_field_to_sdf(value, 0, processes=self.processes)
                 sdf = FG_gyroid(thickness, value, size=(size_x,size_y,size_z),center=origin).translate(origin)
-                field = SvExSdfScalarField(sdf)
+                field = SvExSdfScalarField(sdf, processes=self.processes)
                 new_fields.append(field)
             if self.flat_output:
                 fields_out.extend(new_fields)
@@ -62,7 +62,7 @@ class SvExSdfPlaneNode(bpy.types.Node, SverchCustomTreeNode):
         for params in zip_long_repeat(origins_s, normal_s):
             new_fields = []
             for origin, normal in zip_long_repeat(*params):
-                sdf = plane(normal=normal, point=origin)
+                sdf = SdfPlane(normal=normal, point=origin)
                 field = SvExSdfScalarField(sdf)
                 new_fields.append(field)
             if self.flat_output:
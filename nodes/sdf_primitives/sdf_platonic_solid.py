@@ -81,7 +81,7 @@ class SvExSdfPlatonicSolidNode(bpy.types.Node, SverchCustomTreeNode):
                 if self.solid_type == 'TETRA':
                     sdf = tetrahedron(radius).translate(origin)
                 elif self.solid_type == 'CUBE':
-                    sdf = box(2*radius).translate(origin)
+                    sdf = SdfBox(2*radius).translate(origin)
                 elif self.solid_type == 'OCTA':
                     sdf = octahedron(radius).translate(origin)
                 elif self.solid_type == 'DODECA':
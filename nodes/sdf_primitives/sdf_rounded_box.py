@@ -89,7 +89,7 @@ class SvExSdfRoundedBoxNode(bpy.types.Node, SverchCustomTreeNode):
         for params in zip_long_repeat(size_x_s, size_y_s, size_z_s, radius_s, origins_s):
             new_fields = []
             for size_x, size_y, size_z, radius, origin in zip_long_repeat(*params):
-                sdf = rounded_box((size_x,size_y,size_z), radius).translate(origin)
+                sdf = SdfRoundedBox((size_x,size_y,size_z), radius).translate(origin)
                 field = SvExSdfScalarField(sdf)
                 new_fields.append(field)
             if self.flat_output:
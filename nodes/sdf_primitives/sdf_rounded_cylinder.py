@@ -86,7 +86,7 @@ class SvExSdfRoundedCylinderNode(bpy.types.Node, SverchCustomTreeNode):
                 if not self.origin_at_center:
                     x0, y0, z0 = origin
                     origin = x0, y0, z0 + (height / 2.0)
-                sdf = rounded_cylinder(major_radius, minor_radius, height).translate(origin)
+                sdf = SdfRoundedCylinder(major_radius, minor_radius, height).translate(origin)
                 field = SvExSdfScalarField(sdf)
                 new_fields.append(field)
             if self.flat_output:
@@ -161,7 +161,7 @@ class SvExSdfSlabNode(bpy.types.Node, SverchCustomTreeNode):
                     z_max = None
                 print(f"X {x_min} - {x_max}, Y {y_min} - {y_max}, Z {z_min} - {z_max}")
 
-                sdf = slab(x0=x_min, y0=y_min, z0=z_min, x1=x_max, y1=y_max, z1=z_max)
+                sdf = SdfSlab(x0=x_min, y0=y_min, z0=z_min, x1=x_max, y1=y_max, z1=z_max)
                 field = SvExSdfScalarField(sdf)
                 new_fields.append(field)
             if self.flat_output:
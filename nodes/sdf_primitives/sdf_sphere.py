@@ -62,7 +62,7 @@ class SvExSdfSphereNode(bpy.types.Node, SverchCustomTreeNode):
         for params in zip_long_repeat(radiuses_s, origins_s):
             new_fields = []
             for radius, origin in zip_long_repeat(*params):
-                sdf = sphere(radius, origin)
+                sdf = SdfSphere(radius, origin)
                 field = SvExSdfScalarField(sdf)
                 new_fields.append(field)
             if self.flat_output:
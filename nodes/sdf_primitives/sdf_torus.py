@@ -71,7 +71,7 @@ class SvExSdfTorusNode(bpy.types.Node, SverchCustomTreeNode):
         for params in zip_long_repeat(major_radius_s, minor_radius_s, origins_s):
             new_fields = []
             for major_radius, minor_radius, origin in zip_long_repeat(*params):
-                sdf = torus(major_radius, minor_radius).translate(origin)
+                sdf = SdfTorus(major_radius, minor_radius).translate(origin)
                 field = SvExSdfScalarField(sdf)
                 new_fields.append(field)
             if self.flat_output:
@@ -16,15 +16,22 @@ def solve(field, init, iso_value, step_coeff, maxiter=30, threshold=1e-4):
     p = init
     while True:
         i += 1
-        v = field.evaluate_grid(p[:,0], p[:,1], p[:,2]) - iso_value
+        if hasattr(field, 'evaluate_with_gradient'):
+            # Values and gradients of SDF fields are calculated in one pass
+            v, grad = field.evaluate_with_gradient(p[:,0], p[:,1], p[:,2])
+            v = v - iso_value
+        else:
+            v = field.evaluate_grid(p[:,0], p[:,1], p[:,2]) - iso_value
+            grad = None
         dv = abs(v)
         #print(f"I#{i}, DV {dv.max()}")
         if (dv < threshold).all():
             return p
         if i > maxiter:
             raise Exception(f"Maximum number of iterations ({maxiter}) is exceeded, last error {dv.max()}")
-        gradX, gradY, gradZ = field.gradient_grid(p[:,0], p[:,1], p[:,2])
-        grad = np.stack((gradX, gradY, gradZ)).T
+        if grad is None:
+            gradX, gradY, gradZ = field.gradient_grid(p[:,0], p[:,1], p[:,2])
+            grad = np.stack((gradX, gradY, gradZ)).T
         n = np.linalg.norm(grad, axis=1, keepdims=True)**2
         step = step_coeff * v[np.newaxis].T * grad / n
         p -= step
@@ -14,6 +14,8 @@ from sverchok_extra.dependencies import pygalmesh, scipy
 if pygalmesh is not None and scipy is not None:
 
     from scipy.interpolate import RegularGridInterpolator
+    from sverchok_extra.utils.sdf import SvExSdfScalarField
+    from sverchok_extra.utils.sdf_cache import get_volume_cache, volume_key
 
     class SvDomain(pygalmesh.DomainBase):
         def __init__(self, field, b1, b2, samples, iso_value):
@@ -40,6 +42,17 @@ if pygalmesh is not None and scipy is not None:
         x_range = np.linspace(b1[0], b2[0], num=samples)
         y_range = np.linspace(b1[1], b2[1], num=samples)
         z_range = np.linspace(b1[2], b2[2], num=samples)
+
+        # Volumes of SDF trees are cached by tree structure
+        key = None
+        if isinstance(field, SvExSdfScalarField) and field.sdf.structural_hash() is not None:
+            cache = get_volume_cache()
+            key = volume_key(field.sdf.structural_hash(), (x_range, y_range, z_range),
+                        dtype=field.dtype, iso_value=iso_value)
+            func_values = cache.get(key)
+            if func_values is not None:
+                return x_range, y_range, z_range, func_values
+
         xs, ys, zs = np.meshgrid(x_range, y_range, z_range, indexing='ij')
         func_values = field.evaluate_grid(xs.flatten(), ys.flatten(), zs.flatten())
         m = func_values.min()
@@ -48,6 +61,8 @@ if pygalmesh is not None and scipy is not None:
         func_values = func_values - iso_value
         #func_values[func_values > iso_value] = 0
         func_values = func_values.reshape((samples, samples, samples))
+        if key is not None:
+            cache.put(key, func_values)
         return x_range, y_range, z_range, func_values
 
     class SvExUpdateGalMeshNodeOp(bpy.types.Operator):
@@ -31,6 +31,10 @@ class SvExPreferences(AddonPreferences):
         draw_message(box, "sverchok", dependencies=ex_dependencies)
         draw_message(box, "pygalmesh", dependencies=ex_dependencies)
         draw_message(box, "sdf", dependencies=ex_dependencies)
+        draw_message(box, "numba", dependencies=ex_dependencies)
+        if ex_dependencies["numba"].module is not None:
+            # See sdf_jit._choose_threading_layer
+            box.label(text="Parallel SDF kernels use Numba 'workqueue' threading layer, unless NUMBA_THREADING_LAYER is set")
 
 def register():
     bpy.utils.register_class(SvExPreferences)
@@ -0,0 +1,36 @@
+
+import os
+import tempfile
+
+import numpy as np
+
+from sverchok.utils.testing import SverchokTestCase
+
+from sverchok_extra.utils.sdf_tree import *
+from sverchok_extra.utils.sdf_cache import SdfVolumeCache, volume_key
+
+class SdfCacheTestCase(SverchokTestCase):
+    def test_structural_hash(self):
+        sdf1 = SdfSphere(1, (0.3, 0, 0)).union(SdfBox((1, 2, 0.5)), k=0.2)
+        sdf2 = SdfSphere(1.0, np.array([0.3, 0.0, 0.0])).union(SdfBox((1, 2, 0.5)), k=0.2)
+        sdf3 = SdfSphere(1, (0.3, 0, 0)).union(SdfBox((1, 2, 0.5)), k=0.3)
+        self.assertEqual(sdf1.structural_hash(), sdf2.structural_hash())
+        self.assertNotEqual(sdf1.structural_hash(), sdf3.structural_hash())
+        self.assertIsNone(sdf1.union(SdfOpaque(sdf2.f)).structural_hash())
+
+    def test_lru(self):
+        cache = SdfVolumeCache(max_bytes=2000)
+        for i in range(4):
+            cache.put(str(i), np.full(100, i, dtype=np.float64))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('0'))
+        self.assertEqual(cache.get('3')[0], 3)
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SdfVolumeCache(max_bytes=1000, directory=directory)
+            key = volume_key(SdfSphere(1).structural_hash(), [np.arange(10)], dtype='float64')
+            cache.put(key, np.arange(100, dtype=np.float64))
+            cache.put('other', np.zeros(100))
+            self.assertTrue(os.path.exists(os.path.join(directory, key + ".npy")))
+            self.assert_numpy_arrays_equal(cache.get(key), np.arange(100, dtype=np.float64))
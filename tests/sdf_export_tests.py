@@ -0,0 +1,78 @@
+
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from sverchok.utils.testing import SverchokTestCase, requires
+from sverchok.dependencies import skimage
+
+from sverchok_extra.utils.sdf_tree import *
+from sverchok_extra.utils import sdf_mesh
+from sverchok_extra.utils.sdf_export import export_mesh, SdfPlyWriter, STL_RECORD, PLY_FACE
+
+class SdfExportTestCase(SverchokTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.sdf = SdfTorus(1, 0.3)
+        self.bounds = ((-1.41, -1.41, -0.41), (1.4, 1.4, 0.4))
+        self.expected = np.sort(sdf_mesh.generate(self.sdf, step=0.05, bounds=self.bounds, batch_size=8), axis=0)
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    @requires(skimage)
+    def test_stl(self):
+        path = os.path.join(self.directory.name, "torus.stl")
+        count = export_mesh(self.sdf, path, 'STL', step=0.05, bounds=self.bounds, batch_size=8)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(struct.unpack('<I', data[80:84])[0], count)
+        records = np.frombuffer(data[84:], dtype=STL_RECORD)
+        self.assertEqual(len(records), count)
+        triangles = np.sort(records['vertices'].reshape((-1, 3)), axis=0)
+        self.assert_numpy_arrays_equal(triangles, self.expected, precision=5)
+
+    @requires(skimage)
+    def test_ply(self):
+        path = os.path.join(self.directory.name, "torus.ply")
+        count = export_mesh(self.sdf, path, 'PLY', step=0.05, bounds=self.bounds, batch_size=8)
+        with open(path, 'rb') as f:
+            data = f.read()
+        end = data.index(b"end_header\n") + len(b"end_header\n")
+        header = data[:end].decode('ascii').split()
+        n_verts = int(header[header.index('vertex') + 1])
+        n_faces = int(header[header.index('face') + 1])
+        self.assertEqual(n_faces, count)
+        verts = np.frombuffer(data[end:end + 12 * n_verts], dtype='<f4').reshape((-1, 3))
+        faces = np.frombuffer(data[end + 12 * n_verts:], dtype=PLY_FACE)
+        self.assertEqual(len(faces), n_faces)
+        triangles = np.sort(verts[faces['vertices']].reshape((-1, 3)), axis=0)
+        self.assert_numpy_arrays_equal(triangles, self.expected, precision=5)
+        # Vertices are shared across batch borders, so the mesh is closed
+        self.assertEqual(len(np.unique(verts, axis=0)), n_verts)
+        edges = np.sort(faces['vertices'][:,[0, 1, 1, 2, 2, 0]].reshape((-1, 2)), axis=1)
+        _, counts = np.unique(edges, axis=0, return_counts=True)
+        self.assertTrue(np.all(counts == 2))
+
+    @requires(skimage)
+    def test_ply_seams(self):
+        # Vertices on batch borders are dropped once all batches containing
+        # them are written
+        plan = sdf_mesh.plan_mesh(self.sdf, step=0.05, bounds=self.bounds, batch_size=8)
+        items = [(plan.sdf, plan.kernel, job) for job in plan.batches]
+        lattice = (np.asarray(plan.bounds[0], dtype=np.float64), np.full(3, 0.05))
+        path = os.path.join(self.directory.name, "torus.ply")
+        sizes = []
+        with SdfPlyWriter(path, lattice, plan.batches) as writer:
+            for i, triangles in enumerate(sdf_mesh.imesh_batches(items, 1, True, None, 'THREADS')):
+                if triangles is not None and len(triangles) > 0:
+                    writer.write(triangles, i)
+                    sizes.append(len(writer.seam_keys))
+                    self.assertTrue(np.all(np.diff(writer.seam_keys) > 0))
+                    self.assertTrue(np.all(writer.seam_last > i))
+            total = writer.vertex_count
+        self.assertLess(max(sizes), total / 4)
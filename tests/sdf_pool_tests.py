@@ -0,0 +1,115 @@
+
+import os
+import pickle
+import subprocess
+import sys
+
+import numpy as np
+
+from sverchok.utils.testing import SverchokTestCase, requires
+from sverchok.dependencies import skimage
+
+from sverchok_extra.utils.sdf_tree import *
+from sverchok_extra.utils.sdf_pool import SdfProcessPool, get_process_pool, RING_SIZE
+from sverchok_extra.utils import sdf_mesh
+
+# Evaluates SDF in the main thread, in worker processes and in a thread
+# pool; the process must exit afterwards
+EXIT_SCRIPT = """
+import sys
+import threading
+import numpy as np
+try:
+    from sverchok_extra.utils.sdf_tree import SdfSphere
+    from sverchok_extra.utils.sdf_pool import SdfProcessPool
+    from sverchok_extra.utils import sdf_mesh
+except ImportError:
+    sys.exit(3)
+sdf = SdfSphere(1)
+points = np.zeros((100000, 3))
+sdf.f(points)
+pool = SdfProcessPool(sdf, workers=2)
+pool(points)
+pool.close()
+thread = threading.Thread(target=sdf_mesh.generate, args=(sdf,), kwargs=dict(step=0.1, workers=2))
+thread.start()
+thread.join()
+"""
+
+def waves(ps):
+    return np.sin(ps[:,0]) * np.cos(ps[:,1]) + np.sin(ps[:,1]) * np.cos(ps[:,2])
+
+def sample(sdf, n):
+    return sdf.f(np.linspace(-2, 2, 3 * n).reshape((n, 3)))
+
+class SdfPoolTestCase(SverchokTestCase):
+    def test_pickle(self):
+        sdf = SdfSphere(1, (0.3, 0, 0)).union(SdfBox((1, 2, 0.5)), k=0.2)
+        points = np.random.default_rng(1).uniform(-2, 2, (100, 3))
+        expected = sdf.f(points)
+        copy = pickle.loads(pickle.dumps(sdf))
+        self.assert_numpy_arrays_equal(copy.f(points), expected, precision=8)
+
+    def test_process_pool(self):
+        sdf = SdfOpaque(waves).intersection(SdfSphere(2)).shell(0.1)
+        xs, ys, zs = np.random.default_rng(1).uniform(-2, 2, (3, 10, 1000))
+        pool = SdfProcessPool(sdf, workers=2)
+        try:
+            values = pool.evaluate_chunked((xs, ys, zs), chunk_size=1024)
+        finally:
+            pool.close()
+        expected = sdf.kernel().evaluate_chunked((xs, ys, zs))
+        self.assertEqual(values.shape, xs.shape)
+        self.assert_numpy_arrays_equal(values, expected, precision=8)
+
+    def test_shared_workers(self):
+        sdf = SdfSphere(2).shell(0.1)
+        pool = get_process_pool(sdf, 2)
+        # Trees of the same structure reuse the pool, other trees are
+        # sent to its workers
+        self.assertIs(get_process_pool(SdfSphere(2).shell(0.1), 2), pool)
+        other = SdfOpaque(waves).intersection(SdfSphere(1.5))
+        other_pool = get_process_pool(other, 2)
+        self.assertIsNot(other_pool, pool)
+        self.assertIs(other_pool.processes, pool.processes)
+        # Trees which can not be pickled are evaluated in threads, instead
+        # of starting new workers for each version of them
+        self.assertIsNone(get_process_pool(SdfOpaque(lambda ps: waves(ps)), 2))
+        n = 20000
+        for tree, p in [(sdf, pool), (other, other_pool), (sdf, pool)]:
+            results = list(p.imap(sample, [(0, (n,))] * 20))
+            for result in results:
+                self.assert_numpy_arrays_equal(result, sample(tree, n), precision=8)
+        # Results are passed through a fixed set of segments of each worker
+        self.assertLessEqual(len(pool.processes.ring), 2 * RING_SIZE)
+
+    @requires(skimage)
+    def test_process_mesh(self):
+        sdf = SdfOpaque(waves).intersection(SdfSphere(2)).shell(0.1)
+        bounds = ((-2.01, -2.01, -2.01), (2, 2, 2))
+        threads = sdf_mesh.generate(sdf, step=0.05, bounds=bounds, workers=2)
+        processes = sdf_mesh.generate(sdf, step=0.05, bounds=bounds, workers=2, backend='PROCESSES')
+        self.assert_numpy_arrays_equal(processes, threads, precision=8)
+
+    @requires(skimage)
+    def test_generate_many(self):
+        sdfs = [SdfOpaque(waves).intersection(SdfSphere(r)) for r in (1, 1.5, 2)]
+        bounds = [((-r - 0.01,) * 3, (r,) * 3) for r in (1, 1.5, 2)]
+        expected = [sdf_mesh.generate(sdf, step=0.1, bounds=b) for sdf, b in zip(sdfs, bounds)]
+        for backend in ['THREADS', 'PROCESSES']:
+            meshes = sdf_mesh.generate_many(sdfs, [0.1] * 3, bounds=bounds, workers=2, backend=backend)
+            for mesh, triangles in zip(meshes, expected):
+                self.assert_numpy_arrays_equal(mesh, triangles, precision=8)
+
+    @requires(skimage)
+    def test_exit(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        env.pop('NUMBA_THREADING_LAYER', None)
+        try:
+            result = subprocess.run([sys.executable, "-c", EXIT_SCRIPT], env=env,
+                        capture_output=True, timeout=120)
+        except subprocess.TimeoutExpired:
+            self.fail("Process did not exit after SDF evaluation")
+        if result.returncode == 3:
+            self.skipTest("Sverchok-Extra can not be imported by a separate process")
+        self.assertEqual(result.returncode, 0, result.stderr.decode(errors='replace'))
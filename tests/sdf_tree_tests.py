@@ -0,0 +1,540 @@
+import functools
+
+import numpy as np
+
+from sverchok.utils.testing import SverchokTestCase, requires
+from sverchok.dependencies import skimage, scipy
+from sverchok_extra.dependencies import sdf
+
+from sverchok_extra.utils.sdf_tree import *
+from sverchok_extra.utils import sdf_mesh
+from sverchok_extra.utils.sdf import estimate_bounds_many, SvExSdfScalarField, SvExSdf2DScalarField
+
+def length(vs):
+    return np.linalg.norm(vs, axis=1)
+
+def smooth_min(d1, d2, k):
+    h = np.clip(0.5 + 0.5 * (d2 - d1) / k, 0, 1)
+    return d2 + (d1 - d2) * h - k * h * (1 - h)
+
+class SdfKernelTestCase(SverchokTestCase):
+    def setUp(self):
+        super().setUp()
+        self.points = np.random.default_rng(1).uniform(-2, 2, (500, 3))
+
+    def box_surface(self, box):
+        # Points on faces of the box
+        lo, hi = np.asarray(box[0]), np.asarray(box[1])
+        ps = np.random.default_rng(2).uniform(lo, hi, (600, 3))
+        for i in range(6):
+            ps[i::6, i % 3] = (lo, hi)[i // 3][i % 3]
+        return ps
+
+    def sphere(self, ps):
+        return length(ps - [0.3, 0, 0]) - 1
+
+    def box(self, ps):
+        q = np.abs(ps - [0, 0.2, 0]) - np.array([1, 2, 0.5]) / 2
+        return length(np.maximum(q, 0)) + np.minimum(q.max(axis=1), 0)
+
+    def test_sphere(self):
+        sdf = SdfSphere(1, (0.3, 0, 0))
+        self.assert_numpy_arrays_equal(sdf.f(self.points), self.sphere(self.points), precision=8)
+
+    def test_smooth_union(self):
+        sdf = SdfSphere(1, (0.3, 0, 0)).union(SdfBox((1, 2, 0.5), (0, 0.2, 0)), k=0.3)
+        expected = smooth_min(self.sphere(self.points), self.box(self.points), 0.3)
+        self.assert_numpy_arrays_equal(sdf.f(self.points), expected, precision=8)
+
+    def test_translate_difference(self):
+        sdf = SdfSphere(1).translate((0.3, 0, 0)).difference(SdfBox((1, 2, 0.5), (0, 0.2, 0)))
+        expected = np.maximum(self.sphere(self.points), -self.box(self.points))
+        self.assert_numpy_arrays_equal(sdf.f(self.points), expected, precision=8)
+
+    def test_buffers_reuse(self):
+        sdf = SdfSphere(1, (0.3, 0, 0)).shell(0.1)
+        kernel = sdf.kernel()
+        first = kernel(self.points)
+        kernel(self.points[:10])
+        second = kernel(self.points)
+        self.assert_numpy_arrays_equal(first, second)
+
+    def test_evaluate_chunked(self):
+        sdf = SdfSphere(1, (0.3, 0, 0)).union(SdfBox((1, 2, 0.5), (0, 0.2, 0)))
+        kernel = sdf.kernel()
+        xs, ys, zs = self.points.T
+        values = kernel.evaluate_chunked((xs, ys, zs), chunk_size=64)
+        self.assert_numpy_arrays_equal(values, kernel(self.points), precision=8)
+
+    @requires(skimage)
+    def test_float32_mesh(self):
+        sdf = SdfBox((1, 2, 1)).union(SdfSphere(0.8, (0.5, 0.5, 0.5)), k=0.2)
+        # Lattice is shifted, so that box faces do not pass through its points,
+        # where rounding would decide the sign of zero values
+        bounds = ((-1.013, -1.513, -1.013), (1.5, 1.5, 1.5))
+        double = sdf_mesh.generate(sdf, step=0.05, bounds=bounds, dtype=np.float64)
+        single = sdf_mesh.generate(sdf, step=0.05, bounds=bounds, dtype=np.float32)
+        self.assertEqual(double.shape, single.shape)
+        error = np.abs(double - single).max()
+        self.assertLess(error, 1e-4)
+
+    def test_bounds(self):
+        sdf = SdfSphere(1, (0.3, 0, 0)).union(SdfBox((1, 2, 0.5), (0, 0.2, 0))).translate((0, 0, 1))
+        lo, hi = sdf.bounds()
+        self.assert_numpy_arrays_equal(lo, np.array([-0.7, -1.0, 0.0]), precision=8)
+        self.assert_numpy_arrays_equal(hi, np.array([1.3, 1.2, 2.0]), precision=8)
+        self.assertIsNone(sdf.union(SdfPlane()).bounds())
+
+    def test_culled_union(self):
+        rng = np.random.default_rng(2)
+        spheres = [SdfSphere(r, c) for r, c in zip(rng.uniform(0.1, 0.3, 50), rng.uniform(-2, 2, (50, 3)))]
+        spheres.append(SdfPlane((0, 0, 1), (0, 0, -1.5)))
+        expected = spheres[0].union(*spheres[1:]).f(self.points)
+        self.assert_numpy_arrays_equal(SdfCulledUnion(spheres).f(self.points), expected, precision=8)
+        # Smooth union folds values in ascending order; for two children
+        # it is the pairwise one
+        a, b = SdfSphere(1), SdfBox(1.5)
+        self.assert_numpy_arrays_equal(SdfCulledUnion([a, b], k=0.3).f(self.points),
+                    a.union(b, k=0.3).f(self.points), precision=10)
+        # Overlapping children: values do not depend on points evaluated together
+        centers = np.random.default_rng(5).uniform(-0.6, 0.6, (30, 3))
+        spheres = [SdfSphere(0.5, c) for c in centers]
+        sdf = SdfCulledUnion(spheres, k=0.5)
+        values = np.sort(np.stack([sphere.f(self.points) for sphere in spheres], axis=1), axis=1)
+        expected = values[:,0]
+        for column in values[:,1:].T:
+            expected = smooth_min(expected, column, 0.5)
+        self.assert_numpy_arrays_equal(sdf.f(self.points), expected, precision=10)
+        for idx in [np.arange(7), np.arange(0, 500, 3), np.random.default_rng(6).permutation(500)[:100]]:
+            subset = np.concatenate([self.points[idx], self.points * 3])
+            self.assert_numpy_arrays_equal(sdf.f(subset)[:len(idx)], expected[idx], precision=12)
+        values, gradients = sdf.evaluate_with_gradient(self.points)
+        self.assert_numpy_arrays_equal(values, expected, precision=10)
+        h = 1e-6
+        numeric = np.stack([(sdf.f(self.points + h * e) - sdf.f(self.points - h * e)) / (2 * h)
+                                for e in np.eye(3)], axis=1)
+        self.assert_numpy_arrays_equal(gradients, numeric, precision=5)
+        # Smooth union of overlapping children is larger than each of them
+        sdf = SdfCulledUnion([SdfSphere(1)] * 8, k=1)
+        self.assertTrue(np.all(sdf.f(self.box_surface(sdf.bounds())) > 0))
+        # Bounds of sparse children grow by the number of overlapping ones
+        centers = np.stack(np.meshgrid(*[np.arange(8)] * 3), axis=-1).reshape((-1, 3)) * 2.0
+        sdf = SdfCulledUnion([SdfSphere(0.1, c) for c in centers], k=0.5)
+        lo, hi = sdf.bounds()
+        self.assertTrue(np.all(lo > -1) and np.all(hi < 15))
+        self.assertTrue(np.all(sdf.f(self.box_surface((lo, hi))) > 0))
+
+    def test_interval(self):
+        sdf = SdfSphere(1, (0.3, 0, 0)).union(SdfBox((1, 2, 0.5), (0, 0.2, 0)), k=0.3).shell(0.1)
+        rng = np.random.default_rng(3)
+        lo = rng.uniform(-2, 1.5, (20, 3))
+        hi = lo + rng.uniform(0.01, 0.5, (20, 3))
+        dlo, dhi = sdf.interval(lo, hi)
+        for box_lo, box_hi, d0, d1 in zip(lo, hi, dlo, dhi):
+            values = sdf.f(rng.uniform(box_lo, box_hi, (100, 3)))
+            self.assertTrue(np.all(values >= d0))
+            self.assertTrue(np.all(values <= d1))
+
+    def test_interval_bounds(self):
+        sdf = SdfSphere(1, (0.3, 0, 0)).difference(SdfPlane())
+        (x0, y0, z0), (x1, y1, z1) = interval_bounds(sdf)
+        # Lower half of the sphere is left
+        self.assertTrue(x0 <= -0.7 and y0 <= -1 and z0 <= -1)
+        self.assertTrue(x1 >= 1.3 and y1 >= 1 and z1 >= 0)
+        self.assertTrue(x1 - x0 < 2.2 and z1 < 0.1)
+        self.assertIsNone(interval_bounds(SdfOpaque(sdf.f)))
+
+    @requires(skimage)
+    def test_pruned_mesh(self):
+        sdf = SdfTorus(1, 0.4).shell(0.05)
+        bounds = ((-1.5, -1.5, -0.5), (1.5, 1.5, 0.5))
+        full = sdf_mesh.generate(sdf, step=0.02, bounds=bounds, sparse=False)
+        pruned = sdf_mesh.generate(sdf, step=0.02, bounds=bounds, sparse=True)
+        self.assert_numpy_arrays_equal(np.sort(full, axis=0), np.sort(pruned, axis=0), precision=8)
+
+    def test_shared_subtree(self):
+        calls = []
+        def sphere(ps):
+            calls.append(len(ps))
+            return self.sphere(ps)
+        shared = SdfOpaque(sphere)
+        sdf = shared.shell(0.1).union(shared.intersection(SdfBox((1, 2, 0.5), (0, 0.2, 0))))
+        values = sdf.f(self.points)
+        self.assertEqual(len(calls), 1)
+        sphere_values = self.sphere(self.points)
+        expected = np.minimum(np.abs(sphere_values) - 0.05, np.maximum(sphere_values, self.box(self.points)))
+        self.assert_numpy_arrays_equal(values, expected, precision=8)
+
+    def test_deduplicate(self):
+        sdf = SdfSphere(1).translate((0.3, 0, 0)).difference(SdfSphere(1).translate((0.3, 0, 0)).shell(0.1))
+        sdf = deduplicate(sdf)
+        self.assertIs(sdf.a, sdf.b.child)
+        self.assertIs(deduplicate(SdfSphere(1).translate((0.3, 0, 0))), sdf.a)
+
+    def test_gradient(self):
+        sphere = SdfSphere(1, (0.3, 0, 0))
+        box = SdfBox((1, 2, 0.5), (0, 0.2, 0))
+        sdfs = [sphere.union(box, k=0.3).shell(0.1),
+                sphere.difference(box.twist(1.3), k=0.2).rotate(0.7, (1, 1, 0)),
+                SdfTorus(1, 0.3).bend_linear((0, 0, -1), (0, 0, 1), (1, 0, 0)).scale(1.5),
+                SdfCircle(0.5, (0.2, 0)).revolve(0.5).intersection(SdfOpaque(box.f))]
+        h = 1e-6
+        for sdf in sdfs:
+            values, gradients = sdf.evaluate_with_gradient(self.points)
+            self.assert_numpy_arrays_equal(values, sdf.f(self.points), precision=8)
+            for axis in range(3):
+                offset = np.eye(3)[axis] * h
+                expected = (sdf.f(self.points + offset) - sdf.f(self.points - offset)) / (2 * h)
+                self.assert_numpy_arrays_equal(gradients[:,axis], expected, precision=4)
+
+    @requires(skimage)
+    def test_adaptive_mesh(self):
+        sdf = SdfSphere(0.5, (3, 3, 3)).union(SdfOpaque(SdfTorus(1, 0.3).f))
+        bounds = ((-4.01, -4.01, -4.01), (4, 4, 4))
+        full = sdf_mesh.generate(sdf, step=0.05, bounds=bounds, batch_size=16)
+        adaptive = sdf_mesh.generate(sdf, step=0.05, bounds=bounds, batch_size=16, adaptive=True)
+        self.assert_numpy_arrays_equal(np.sort(full, axis=0), np.sort(adaptive, axis=0), precision=8)
+
+    def test_dual_contouring(self):
+        sdf = SdfBox(1).rotate(0.3)
+        bounds = ((-1.013, -1.013, -1.013), (1, 1, 1))
+        triangles = sdf_mesh.generate(sdf, step=0.1, bounds=bounds, batch_size=8, algorithm='DUAL_CONTOURING')
+        verts, faces = np.unique(triangles, axis=0, return_inverse=True)
+        faces = faces.reshape((-1, 3))
+        # Closed mesh: each edge is shared by two triangles
+        edges = np.sort(np.concatenate([faces[:,[0, 1]], faces[:,[1, 2]], faces[:,[2, 0]]]), axis=1)
+        _, counts = np.unique(edges, axis=0, return_counts=True)
+        self.assertTrue(np.all(counts == 2))
+        # Corners are kept, so the volume is close to one
+        a, b, c = verts[faces[:,0]], verts[faces[:,1]], verts[faces[:,2]]
+        volume = np.einsum('ij,ij->i', a, np.cross(b, c)).sum() / 6
+        self.assertAlmostEqual(volume, 1.0, delta=0.005)
+
+    def test_weld(self):
+        triangles = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0],
+                              [1, 1e-9, 0], [1, 1, 0], [0, 1, 1e-9],
+                              [0, 0, 0], [0, 0, 1e-9], [1, 1, 1]])
+        verts, faces = sdf_mesh.weld_triangles(triangles, threshold=1e-6)
+        self.assertEqual(len(verts), 4)
+        # The third triangle collapses to an edge and is removed
+        self.assertEqual(faces.shape, (2, 3))
+        self.assertEqual(set(faces[0]) & set(faces[1]), {faces[0][1], faces[0][2]})
+        verts, faces = sdf_mesh.weld_triangles(triangles, threshold=0)
+        self.assertEqual(faces.shape, (3, 3))
+
+    def test_changed_region(self):
+        spheres = [SdfSphere(0.3, (x, 0, 0)) for x in range(5)]
+        moved = spheres[:2] + [SdfSphere(0.3, (2, 0.5, 0))] + spheres[3:]
+        old = SdfCulledUnion(spheres).translate((0, 0, 1))
+        boxes = changed_region(old, SdfCulledUnion(moved).translate((0, 0, 1)), margin=0.1)
+        lo = np.min([box[0] for box in boxes], axis=0)
+        hi = np.max([box[1] for box in boxes], axis=0)
+        self.assert_numpy_arrays_equal(lo, np.array([1.6, -0.4, 0.6]), precision=8)
+        self.assert_numpy_arrays_equal(hi, np.array([2.4, 0.9, 1.4]), precision=8)
+        self.assertEqual(changed_region(old, SdfCulledUnion(spheres).translate((0, 0, 1))), [])
+        self.assertIsNone(changed_region(old, old.union(SdfPlane())))
+
+    @requires(skimage)
+    def test_remesh(self):
+        centers = np.random.default_rng(4).uniform(-1, 1, (10, 3))
+        bounds = ((-1.51, -1.51, -1.51), (1.5, 1.5, 1.5))
+        state = sdf_mesh.SdfMeshState()
+        sdf = SdfCulledUnion([SdfSphere(0.3, c) for c in centers], k=0.05)
+        sdf_mesh.generate(sdf, step=0.05, bounds=bounds, batch_size=8, state=state)
+        centers = centers.copy()
+        centers[3] += 0.1
+        sdf = SdfCulledUnion([SdfSphere(0.3, c) for c in centers], k=0.05)
+        updated = sdf_mesh.generate(sdf, step=0.05, bounds=bounds, batch_size=8, state=state)
+        full = sdf_mesh.generate(sdf, step=0.05, bounds=bounds, batch_size=8)
+        self.assert_numpy_arrays_equal(np.sort(updated, axis=0), np.sort(full, axis=0), precision=8)
+
+    @requires(skimage)
+    def test_decimate(self):
+        sdf = SdfBox((2, 1, 1)).union(SdfSphere(0.6, (1, 0, 0.5)), k=0.1)
+        triangles = sdf_mesh.generate(sdf, step=0.05, bounds=((-1.51, -1.51, -1.51), (1.7, 1.7, 1.7)))
+        verts, faces = sdf_mesh.weld_triangles(triangles)
+        verts, faces = sdf_mesh.decimate(verts, faces, target=len(faces) // 5)
+        self.assertLessEqual(len(faces), len(triangles) // 15)
+        edges = np.sort(np.concatenate([faces[:,[0, 1]], faces[:,[1, 2]], faces[:,[2, 0]]]), axis=1)
+        _, counts = np.unique(edges, axis=0, return_counts=True)
+        self.assertTrue(np.all(counts == 2))
+        self.assertLess(np.abs(sdf.f(verts)).max(), 0.02)
+
+    @requires(skimage)
+    def test_mesh_stats(self):
+        sdf = SdfTorus(1, 0.4)
+        bounds = ((-1.5, -1.5, -0.5), (1.5, 1.5, 0.5))
+        stats = sdf_mesh.SdfMeshStats()
+        triangles = sdf_mesh.generate(sdf, step=0.05, bounds=bounds, batch_size=8, stats=stats)
+        result = stats.as_dict()
+        self.assertEqual(result['triangles'], len(triangles) // 3)
+        self.assertGreater(result['batches_skipped'], 0)
+        self.assertLessEqual(result['batches_skipped'] + result['batches_empty'], result['batches'])
+        self.assertGreater(result['points'], 0)
+        for stage in ['sparse', 'evaluation', 'marching_cubes', 'meshing']:
+            self.assertIn(f"time_{stage}", result)
+        self.assertGreater(result['points_per_second'], 0)
+
+    def test_tree_bounds(self):
+        # Interval evaluation can not bound twisted SDFs
+        sdf = SdfBox((2, 1, 1)).twist(1)
+        (x0, y0, z0), (x1, y1, z1) = tree_bounds(sdf)
+        self.assertAlmostEqual(x1, np.sqrt(1.25))
+        self.assertAlmostEqual(z1, 0.5)
+        opaque = SdfOpaque(SdfSphere(1).f, box=((-1, -1, -1), (1, 1, 1)))
+        self.assertEqual(tree_bounds(opaque.translate((1, 0, 0))), ((0, -1, -1), (2, 1, 1)))
+        self.assertIsNone(tree_bounds(SdfOpaque(SdfSphere(1).f)))
+
+    @requires(skimage)
+    def test_estimated_bounds_mesh(self):
+        triangles = sdf_mesh.generate(SdfBox((2, 1, 1)), step=0.07)
+        verts, faces = sdf_mesh.weld_triangles(triangles)
+        edges = np.sort(np.concatenate([faces[:,[0, 1]], faces[:,[1, 2]], faces[:,[2, 0]]]), axis=1)
+        _, counts = np.unique(edges, axis=0, return_counts=True)
+        self.assertTrue(np.all(counts == 2))
+        self.assert_numpy_arrays_equal(verts.max(axis=0), [1, 0.5, 0.5], precision=3)
+
+    def test_estimate_bounds_many(self):
+        class SphereField(object):
+            # Generic field, which can only be sampled
+            def __init__(self, r, x):
+                self.r, self.x = r, x
+            def evaluate_grid(self, xs, ys, zs):
+                return np.sqrt((xs - self.x)**2 + ys**2 + zs**2) - self.r
+
+        fields = [SphereField(1, 0), SphereField(0.5, 10), SphereField(-1, 0),
+                  SvExSdf2DScalarField(SdfOpaque(SdfCircle(1).f, dim=2)), SvExSdf2DScalarField(SdfCircle(2))]
+        bounds = estimate_bounds_many(fields)
+        (x0, y0, z0), (x1, y1, z1) = bounds[1]
+        self.assertTrue(9.4 < x0 < 9.5 and 10.5 < x1 < 10.6 and -0.6 < z0 < -0.5)
+        self.assertIsNone(bounds[2])
+        (x0, y0, z0), (x1, y1, z1) = bounds[3]
+        self.assertTrue(-1.1 < x0 < -1 and 1 < y1 < 1.1 and z0 == z1 == 0)
+        self.assertEqual(bounds[4], ((-2, -2, 0), (2, 2, 0)))
+        # Smaller budget gives coarser bounds
+        (x0, y0, z0), (x1, y1, z1) = estimate_bounds_many(fields[:1], budget=5 * 16**3)[0]
+        self.assertLess(x0, -1.1)
+        # SDF trees without analytic bounds are sampled by one kernel
+        # call, with the same results as one by one
+        trees = [SvExSdfScalarField(SdfOpaque(SdfSphere(r, (x, 0, 0)).f)) for r, x in [(1, 0), (0.5, 3), (2, -5)]]
+        bounds = estimate_bounds_many(trees + fields[:1])
+        for field, box in zip(trees + fields[:1], bounds):
+            self.assert_numpy_arrays_equal(np.array(box), np.array(estimate_bounds_many([field])[0]), precision=12)
+
+    def test_nary_intersection(self):
+        spheres = [SdfSphere(1.2, c) for c in np.random.default_rng(2).uniform(-0.3, 0.3, (20, 3))]
+        values = np.stack([sphere.f(self.points) for sphere in spheres], axis=1)
+        sdf = SdfNaryIntersection(spheres)
+        self.assert_numpy_arrays_equal(sdf.f(self.points), values.max(axis=1), precision=12)
+        sdf = SdfNaryIntersection(spheres, subtract=True)
+        expected = np.maximum(values[:,0], -values[:,1:].min(axis=1))
+        self.assert_numpy_arrays_equal(sdf.f(self.points), expected, precision=12)
+        # Smooth intersection and difference are the same as chains of
+        # pairwise ones
+        a, b = SdfSphere(1), SdfBox(1.5)
+        sdf = SdfNaryIntersection(spheres, k=0.2)
+        chain = functools.reduce(lambda x, y: x.intersection(y, k=0.2), spheres)
+        self.assert_numpy_arrays_equal(sdf.f(self.points), chain.f(self.points), precision=10)
+        chain = functools.reduce(lambda x, y: x.difference(y, k=0.2), spheres)
+        self.assert_numpy_arrays_equal(SdfNaryIntersection(spheres, k=0.2, subtract=True).f(self.points),
+                    chain.f(self.points), precision=10)
+        sdf = SdfNaryIntersection([a, b] * 10, k=0.2)
+        d = sdf.f(self.points)
+        self.assertTrue(np.all(d >= np.maximum(a.f(self.points), b.f(self.points))))
+        dlo, dhi = sdf.interval(self.points - 0.05, self.points + 0.05)
+        self.assertTrue(np.all(dlo <= d) and np.all(d <= dhi))
+        values, gradients = sdf.evaluate_with_gradient(self.points)
+        self.assert_numpy_arrays_equal(values, d, precision=10)
+        h = 1e-6
+        numeric = np.stack([(sdf.f(self.points + h * e) - sdf.f(self.points - h * e)) / (2 * h)
+                                for e in np.eye(3)], axis=1)
+        self.assert_numpy_arrays_equal(gradients, numeric, precision=5)
+
+    def test_accumulate(self):
+        # Accumulating operations of the boolean node give the same results
+        # as nested pairwise ones; union only for sharp or two children
+        sdfs = [SdfSphere(0.8, c) for c in np.random.default_rng(7).uniform(-0.5, 0.5, (12, 3))]
+        for k in [None, 0.2]:
+            cases = [(SdfCulledUnion(sdfs[:2], k=k), sdfs[0].union(sdfs[1], k=k)),
+                     (SdfNaryIntersection(sdfs, k=k), functools.reduce(lambda x, y: x.intersection(y, k=k), sdfs)),
+                     (SdfNaryIntersection(sdfs, k=k, subtract=True), functools.reduce(lambda x, y: x.difference(y, k=k), sdfs))]
+            if not k:
+                cases.append((SdfCulledUnion(sdfs), functools.reduce(lambda x, y: x.union(y), sdfs)))
+            for accumulated, pairwise in cases:
+                self.assert_numpy_arrays_equal(accumulated.f(self.points), pairwise.f(self.points), precision=10)
+
+    @requires(scipy)
+    def test_instances(self):
+        rng = np.random.default_rng(3)
+        child = SdfBox((0.3, 0.2, 0.1)).union(SdfSphere(0.1, (0.15, 0, 0)))
+        matrices = []
+        for angle, scale, offset in zip(rng.uniform(0, 6, 300), rng.uniform(0.5, 1.5, 300), rng.uniform(-2, 2, (300, 3))):
+            matrix = np.eye(4)
+            matrix[:3,:3] = SdfRotate(child, angle).matrix.T * scale
+            matrix[:3,3] = offset
+            matrices.append(matrix)
+        sdf = SdfInstances(child, matrices)
+        self.assertLess(sdf.count, 100)
+        expected = np.full(len(self.points), np.inf)
+        for matrix in matrices:
+            q = np.dot(self.points - matrix[:3,3], np.linalg.inv(matrix[:3,:3]).T)
+            expected = np.minimum(expected, child.f(q) * np.linalg.svd(matrix[:3,:3], compute_uv=False).min())
+        values = sdf.f(self.points)
+        # Exact near the surface, and never smaller than the distance
+        near = expected < sdf.radius
+        self.assert_numpy_arrays_equal(values[near], expected[near], precision=10)
+        self.assertTrue(np.all(values >= expected - 1e-10))
+        dlo, dhi = sdf.interval(self.points - 0.05, self.points + 0.05)
+        self.assertTrue(np.all(dlo <= values) and np.all(values <= dhi))
+        # Smooth union of overlapping copies is larger than each of them
+        sdf = SdfInstances(SdfSphere(1), [np.eye(4)] * 8, k=1)
+        self.assertTrue(np.all(sdf.f(self.box_surface(sdf.bounds())) > 0))
+        # Smooth union of overlapping scaled spheres does not depend on the
+        # order of matrices, and equals culled union of the same spheres
+        scales, offsets = rng.uniform(0.3, 0.6, 40), rng.uniform(-1, 1, (40, 3))
+        matrices = []
+        for scale, offset in zip(scales, offsets):
+            matrix = np.diag([scale, scale, scale, 1.0])
+            matrix[:3,3] = offset
+            matrices.append(matrix)
+        sdf = SdfInstances(SdfSphere(1), matrices, k=0.3)
+        values = sdf.f(self.points)
+        expected = SdfCulledUnion([SdfSphere(s, o) for s, o in zip(scales, offsets)], k=0.3).f(self.points)
+        near = expected < sdf.radius
+        self.assertTrue(np.any(near))
+        self.assert_numpy_arrays_equal(values[near], expected[near], precision=10)
+        reverse = SdfInstances(SdfSphere(1), matrices[::-1], k=0.3)
+        self.assert_numpy_arrays_equal(reverse.f(self.points), values, precision=12)
+        self.assert_numpy_arrays_equal(sdf.f(self.points[::3]), values[::3], precision=12)
+        d, g = sdf.evaluate_with_gradient(self.points)
+        self.assert_numpy_arrays_equal(d, values, precision=10)
+        eps = 1e-6
+        numeric = np.stack([(sdf.f(self.points + eps * axis) - sdf.f(self.points - eps * axis)) / (2 * eps)
+                                for axis in np.eye(3)], axis=1)
+        self.assert_numpy_arrays_equal(g[near], numeric[near], precision=4)
+        # Non-uniformly scaled copy is an ellipsoid; values are scaled by the
+        # smallest factor, so they are not larger than the distance
+        matrix = np.diag([1.0, 0.5, 2.0, 1.0])
+        matrix[:3,3] = (0.2, 0, 0)
+        sdf = SdfInstances(SdfSphere(1), [matrix, np.diag([1.0, 0.0, 1.0, 1.0])])
+        self.assertEqual(len(sdf.matrices), 1)
+        q = (self.points - (0.2, 0, 0)) / (1.0, 0.5, 2.0)
+        values = sdf.f(self.points)
+        self.assert_numpy_arrays_equal(values, (length(q) - 1) * 0.5, precision=10)
+        self.assertTrue(np.array_equal(values < 0, length(q) < 1))
+        steps = np.abs(np.diff(values)) / length(np.diff(self.points, axis=0))
+        self.assertTrue(np.all(steps <= 1 + 1e-10))
+        with self.assertRaises(ValueError):
+            SdfInstances(SdfSphere(1), [np.zeros((4, 4))])
+        with self.assertRaises(ValueError):
+            SdfInstances(SdfCircle(1), [np.eye(4)])
+
+    def test_beam_lattice(self):
+        rng = np.random.default_rng(4)
+        grid = np.linspace(-1.5, 1.5, 4)
+        verts = np.array([(x, y, z) for x in grid for y in grid for z in grid])
+        verts += rng.uniform(-0.1, 0.1, verts.shape)
+        index = np.arange(len(verts)).reshape((4, 4, 4))
+        edges = np.concatenate([np.stack([np.take(index, range(3), axis=axis).ravel(),
+                                          np.take(index, range(1, 4), axis=axis).ravel()], axis=1)
+                                    for axis in range(3)])
+        radius = rng.uniform(0.05, 0.15, len(edges))
+        sdf = SdfBeamLattice(verts, edges, radius)
+        expected = np.full(len(self.points), np.inf)
+        for (i, j), r in zip(edges, radius):
+            expected = np.minimum(expected, SdfCapsule(verts[i], verts[j], r).f(self.points))
+        values = sdf.f(self.points)
+        # Exact near struts (by grid cells) and farther from them (by BVH)
+        near = expected < sdf.reach
+        self.assertTrue(np.any(near) and not np.all(near))
+        self.assert_numpy_arrays_equal(values, expected, precision=10)
+        dlo, dhi = sdf.interval(self.points - 0.05, self.points + 0.05)
+        self.assertTrue(np.all(dlo <= values) and np.all(values <= dhi))
+        # Dilation by more than reach does not fill all of the space
+        far = np.array([[5.0, 5.0, 5.0]])
+        self.assertTrue(SdfDilate(sdf, 2 * sdf.reach).f(far)[0] > 0)
+        # Struts of zero radius are segments
+        segments = SdfBeamLattice(verts, edges, 0)
+        self.assertTrue(np.all(segments.f(self.points) > 0))
+        # Smooth union is not larger than the hard one, and blends struts at nodes
+        sdf = SdfBeamLattice(verts, edges, radius, k=0.1)
+        d = sdf.f(self.points)
+        self.assertTrue(np.all(d <= values + 1e-10))
+        values, gradients = sdf.evaluate_with_gradient(self.points)
+        self.assert_numpy_arrays_equal(values, d, precision=10)
+        h = 1e-6
+        numeric = np.stack([(sdf.f(self.points + h * e) - sdf.f(self.points - h * e)) / (2 * h)
+                                for e in np.eye(3)], axis=1)
+        self.assert_numpy_arrays_equal(gradients, numeric, precision=5)
+        dlo, dhi = sdf.interval(self.points - 0.05, self.points + 0.05)
+        self.assertTrue(np.all(dlo <= d) and np.all(d <= dhi))
+        # Log-sum-exp of N equal struts is less than each of them by
+        # k/4 * log2(N), the largest difference
+        single = SdfCapsule(verts[0], verts[1], 0.1).f(self.points)
+        near = single < 0.5
+        for n in [2, 3, 20]:
+            d = SdfBeamLattice(verts, [(0, 1)] * n, 0.1, k=0.2).f(self.points)
+            self.assert_numpy_arrays_equal(d[near], single[near] - 0.05 * np.log2(n), precision=10)
+        with self.assertRaises(ValueError):
+            SdfBeamLattice(verts, np.zeros((0, 2)), 0.1)
+
+class SdfFoglemanTestCase(SverchokTestCase):
+    """
+    Nodes of SDF trees evaluate the same functions as the sdf package,
+    which they replace.
+    """
+    def setUp(self):
+        super().setUp()
+        self.points = np.random.default_rng(8).uniform(-2, 2, (500, 3))
+
+    def cases(self):
+        # (name, tree, sdf package object, dimension of points)
+        e = sdf.ease.in_out_cubic
+        sphere, box = SdfSphere(1, (0.3, 0, 0)), SdfBox((1, 2, 0.5), (0, 0.2, 0))
+        sphere_f, box_f = sdf.sphere(1, (0.3, 0, 0)), sdf.box((1, 2, 0.5), (0, 0.2, 0))
+        circle, circle_f = SdfCircle(0.8, (0.2, 0)), sdf.circle(0.8, (0.2, 0))
+        small, small_f = SdfCircle(0.3), sdf.circle(0.3)
+        return [
+            ("sphere", sphere, sphere_f, 3),
+            ("plane", SdfPlane((1, 1, 0), (0, 0.5, 0)), sdf.plane((1, 1, 0), (0, 0.5, 0)), 3),
+            ("slab", SdfSlab(x0=-1, z1=0.5), sdf.slab(x0=-1, z1=0.5), 3),
+            ("box", box, box_f, 3),
+            ("rounded box", SdfRoundedBox((1, 2, 0.5), 0.1), sdf.rounded_box((1, 2, 0.5), 0.1), 3),
+            ("torus", SdfTorus(1, 0.3), sdf.torus(1, 0.3), 3),
+            ("capsule", SdfCapsule((-1, 0, 0), (1, 1, 0), 0.4), sdf.capsule((-1, 0, 0), (1, 1, 0), 0.4), 3),
+            ("capped cylinder", SdfCappedCylinder((0, -1, 0), (0.5, 1, 0), 0.5),
+                    sdf.capped_cylinder((0, -1, 0), (0.5, 1, 0), 0.5), 3),
+            ("rounded cylinder", SdfRoundedCylinder(0.8, 0.1, 1.5), sdf.rounded_cylinder(0.8, 0.1, 1.5), 3),
+            ("translate", sphere.translate((0.1, 0.2, 0.3)), sphere_f.translate((0.1, 0.2, 0.3)), 3),
+            ("scale", SdfScale(box, (1, 2, 0.5)), box_f.scale((1, 2, 0.5)), 3),
+            ("rotate", SdfRotate(box, 0.7, (1, 1, 0)), box_f.rotate(0.7, (1, 1, 0)), 3),
+            ("twist", SdfTwist(box, 1.5), box_f.twist(1.5), 3),
+            ("bend", SdfBendLinear(box, (0, -1, 0), (0, 1, 0), (0.5, 0, 0)),
+                    box_f.bend_linear((0, -1, 0), (0, 1, 0), (0.5, 0, 0)), 3),
+            ("bend eased", SdfBendLinear(box, (0, -1, 0), (0, 1, 0), (0.5, 0, 0), e),
+                    box_f.bend_linear((0, -1, 0), (0, 1, 0), (0.5, 0, 0), e), 3),
+            ("dilate", SdfDilate(box, 0.2), box_f.dilate(0.2), 3),
+            ("shell", box.shell(0.1), box_f.shell(0.1), 3),
+            ("union", sphere.union(box), sdf.union(sphere_f, box_f), 3),
+            ("smooth union", sphere.union(box, k=0.3), sdf.union(sphere_f, box_f, k=0.3), 3),
+            ("smooth intersection", sphere.intersection(box, k=0.3), sdf.intersection(sphere_f, box_f, k=0.3), 3),
+            ("smooth difference", sphere.difference(box, k=0.3), sdf.difference(sphere_f, box_f, k=0.3), 3),
+            ("blend", sphere.blend(box, k=0.3), sdf.blend(sphere_f, box_f, k=0.3), 3),
+            ("transition linear", SdfTransitionLinear(sphere, box, (0, 0, -1), (0, 0, 1), e),
+                    sdf.transition_linear(sphere_f, box_f, (0, 0, -1), (0, 0, 1), e), 3),
+            ("transition radial", SdfTransitionRadial(sphere, box, 0.2, 1.5),
+                    sdf.transition_radial(sphere_f, box_f, 0.2, 1.5), 3),
+            ("circle", circle, circle_f, 2),
+            ("slice", SdfSlice(sphere.translate((0, 0, 0.5))), sdf.slice(sphere_f.translate((0, 0, 0.5))), 2),
+            ("extrude", SdfExtrude(circle, 1.2), circle_f.extrude(1.2), 3),
+            ("extrude to", SdfExtrudeTo(circle, small, 1.2), sdf.extrude_to(circle_f, small_f, 1.2), 3),
+            ("extrude to eased", SdfExtrudeTo(circle, small, 1.2, e), sdf.extrude_to(circle_f, small_f, 1.2, e), 3),
+            ("revolve", SdfRevolve(small, 1), small_f.revolve(1), 3),
+        ]
+
+    @requires(sdf)
+    def test_primitives_and_operations(self):
+        for name, tree, expected, dim in self.cases():
+            with self.subTest(name=name):
+                points = self.points[:,:dim]
+                self.assert_numpy_arrays_equal(tree.f(points), np.ravel(expected(points)), precision=8)
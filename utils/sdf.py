@@ -4,76 +4,119 @@ import numpy as np
 from sverchok_extra.dependencies import sdf
 if sdf is not None:
     from sdf import *
+    from sdf import ease
 
 from sverchok.utils.field.scalar import SvScalarField
 from sverchok.utils.modules.sdf_utils import geometry_from_points
+from sverchok_extra.utils.sdf_tree import *
+from sverchok_extra.utils.sdf_pool import get_process_pool, MIN_POINTS
+
+def evaluate_with_gradient_chunked(sdf, coords, chunk_size=CHUNK_SIZE):
+    """
+    Calculate values and gradients of SDF tree at points given by separate
+    coordinate arrays (xs, ys[, zs]), chunk by chunk.
+    Return values array of the shape of coordinate arrays, and
+    gradients array of shape (n, dim).
+    """
+    shape = np.shape(coords[0])
+    points = np.stack([np.ravel(cs) for cs in coords], axis=1)
+    n = len(points)
+    values = np.empty(n)
+    gradients = np.empty((n, sdf.dim))
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        values[start:end], gradients[start:end] = sdf.evaluate_with_gradient(points[start:end])
+    return values.reshape(shape), gradients
 
 class SvExSdfScalarField(SvScalarField):
+    """
+    Scalar field defined by SDF tree. If processes is nonzero, large
+    point sets are evaluated by a pool of that many worker processes.
+    """
     __description__ = "SDF"
 
-    def __init__(self, sdf):
+    def __init__(self, sdf, chunk_size=CHUNK_SIZE, dtype=np.float64, processes=0):
+        if not isinstance(sdf, SdfNode):
+            sdf = SdfOpaque(sdf)
         self.sdf = sdf
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+        self.processes = processes
 
     def evaluate_grid(self, xs, ys, zs):
-        points = np.stack((xs, ys, zs)).T
-        r = self.sdf.f(points)
-        if r.ndim == 2 and r.shape[1] == 1:
-            r = r.flatten()
-        return r
+        if self.processes and np.size(xs) >= MIN_POINTS:
+            pool = get_process_pool(self.sdf, self.processes)
+            if pool is not None:
+                return pool.evaluate_chunked((xs, ys, zs), self.dtype, self.chunk_size)
+        return self.sdf.kernel(self.dtype).evaluate_chunked((xs, ys, zs), self.chunk_size)
 
     def evaluate(self, x, y, z):
         points = np.array([[x,y,z]])
         r = self.sdf.f(points)
         return r
 
+    def evaluate_with_gradient(self, xs, ys, zs):
+        """
+        Return SDF values and gradients in one pass, as arrays of
+        shapes (n,) and (n, 3).
+        """
+        values, gradients = evaluate_with_gradient_chunked(self.sdf, (xs, ys, zs), self.chunk_size)
+        return values.astype(self.dtype, copy=False), gradients.astype(self.dtype, copy=False)
+
+    def gradient_grid(self, xs, ys, zs):
+        _, gradients = self.evaluate_with_gradient(xs, ys, zs)
+        return gradients.T
+
 class SvExSdf2DScalarField(SvScalarField):
     __description__ = "2D SDF"
 
-    def __init__(self, sdf):
+    def __init__(self, sdf, chunk_size=CHUNK_SIZE, dtype=np.float64):
+        if not isinstance(sdf, SdfNode):
+            sdf = SdfOpaque(sdf, dim=2)
         self.sdf = sdf
+        self.chunk_size = chunk_size
+        self.dtype = dtype
 
     def evaluate_grid(self, xs, ys, zs):
-        points = np.stack((xs, ys)).T
-        r = self.sdf.f(points)
-        if r.ndim == 2 and r.shape[1] == 1:
-            r = r.flatten()
-        return r
+        return self.sdf.kernel(self.dtype).evaluate_chunked((xs, ys), self.chunk_size)
 
     def evaluate(self, x, y, z):
         points = np.array([[x,y]])
         r = self.sdf.f(points)
         return r
 
-def scalar_field_to_sdf(field, iso_value):
-    if isinstance(field, SvExSdfScalarField):
-        return field.sdf
+    def evaluate_with_gradient(self, xs, ys, zs):
+        """
+        Return SDF values and gradients in one pass, as arrays of
+        shapes (n,) and (n, 3); Z components of gradients are zero.
+        """
+        values, gradients = evaluate_with_gradient_chunked(self.sdf, (xs, ys), self.chunk_size)
+        gradients = np.hstack((gradients, np.zeros((len(gradients), 1))))
+        return values.astype(self.dtype, copy=False), gradients.astype(self.dtype, copy=False)
 
-    def function():
-        def evaluate_array(points):
-            xs = points[:,0]
-            ys = points[:,1]
-            zs = points[:,2]
-            return field.evaluate_grid(xs, ys, zs) - iso_value
-        return evaluate_array
+    def gradient_grid(self, xs, ys, zs):
+        _, gradients = self.evaluate_with_gradient(xs, ys, zs)
+        return gradients.T
 
-    return sdf3(function)()
+def scalar_field_to_sdf(field, iso_value, processes=0):
+    """
+    Return SDF tree of the field. Generic fields are wrapped into leaves,
+    which are evaluated by a pool of worker processes if processes is nonzero.
+    """
+    if isinstance(field, SvExSdfScalarField):
+        # Equal subtrees built by different nodes are shared
+        return deduplicate(field.sdf)
+
+    return SdfFieldLeaf(field, iso_value, processes=processes)
 
 def scalar_field_to_sdf_2d(field, iso_value):
     if isinstance(field, SvExSdf2DScalarField):
-        return field.sdf
+        return deduplicate(field.sdf)
 
     if isinstance(field, SvExSdfScalarField):
-        return field.sdf.slice()
-
-    def function():
-        def evaluate_array(points):
-            xs = points[:,0]
-            ys = points[:,1]
-            zs = np.zeros_like(xs)
-            return field.evaluate_grid(xs, ys, zs) - iso_value
-        return evaluate_array
+        return deduplicate(field.sdf).slice()
 
-    return sdf2(function)()
+    return SdfFieldLeaf(field, iso_value, dim=2)
 
 def cartesian_product(*arrays):
     la = len(arrays)
@@ -83,31 +126,132 @@ def cartesian_product(*arrays):
         arr[...,i] = a
     return arr.reshape(-1, la)
 
-def estimate_bounds(field):
-    # TODO: raise exception if bound estimation fails
-    s = 16
-    x0 = y0 = z0 = -1e9
-    x1 = y1 = z1 = 1e9
-    prev = None
-    for i in range(32):
-        X = np.linspace(x0, x1, s)
-        Y = np.linspace(y0, y1, s)
-        Z = np.linspace(z0, z1, s)
-        d = np.array([X[1] - X[0], Y[1] - Y[0], Z[1] - Z[0]])
-        threshold = np.linalg.norm(d) / 2
-        if threshold == prev:
-            break
-        prev = threshold
-        pts = cartesian_product(X, Y, Z)
-        xs = pts[:,0]
-        ys = pts[:,1]
-        zs = pts[:,2]
-        volume = field.evaluate_grid(xs,ys,zs)
-        volume = volume.reshape((len(X), len(Y), len(Z)))
-        where = np.argwhere(np.abs(volume) <= threshold)
-        x1, y1, z1 = (x0, y0, z0) + where.max(axis=0) * d + d / 2
-        x0, y0, z0 = (x0, y0, z0) + where.min(axis=0) * d - d / 2
-    return ((x0, y0, z0), (x1, y1, z1))
+# Number of lattice points along each axis per round of bounds refinement
+BOUNDS_LATTICE = 16
+# Default maximum number of samples of each field
+BOUNDS_BUDGET = 32 * BOUNDS_LATTICE**3
+# Refinement of a field stops when its box moves by less than this
+# fraction of its size
+BOUNDS_TOLERANCE = 1e-3
+# Half-size of the cube where surfaces are searched for
+BOUNDS_SIZE = 1e9
+
+def _sample_fields(fields, points):
+    """
+    Values of fields at their own points ((n, m, dim) array, m points
+    for each field), as (n, m) array. SDF trees are evaluated by one
+    kernel call for all of them (see SdfSegments).
+    """
+    n, m, dim = points.shape
+    values = np.empty((n, m))
+    is_tree = np.array([isinstance(field, (SvExSdfScalarField, SvExSdf2DScalarField)) for field in fields], dtype=bool)
+    trees = np.flatnonzero(is_tree)
+    if len(trees):
+        node = SdfSegments([fields[j].sdf for j in trees], m)
+        values[trees] = node.f(points[trees].reshape((-1, dim))).reshape((len(trees), m))
+    for j in np.flatnonzero(~is_tree):
+        field = fields[j]
+        grid = list(points[j].T)
+        if dim == 2:
+            grid.append(np.zeros(m))
+        values[j] = np.asarray(field.evaluate_grid(*grid)).reshape(m)
+    return values
+
+def sample_bounds(fields, dim=3, budget=BOUNDS_BUDGET, tolerance=BOUNDS_TOLERANCE, size=BOUNDS_SIZE):
+    """
+    Estimate bounding boxes of zero level surfaces of several fields by
+    sampling: in each round, lattices of BOUNDS_LATTICE^dim points are
+    built for boxes of all fields at once, SDF tree fields are evaluated
+    at all their lattices by one kernel call, and the box of each field
+    is shrunk to lattice cells where values are not larger than half of
+    the cell diagonal. Each field stops when its box settles (see
+    tolerance), or when the next round would exceed the budget of its
+    samples.
+    If dim is 2, fields are sampled in the XY plane.
+    Return list of (min corner, max corner) pairs of arrays of dim
+    coordinates; None for fields where no surface was found.
+    """
+    n = len(fields)
+    s = BOUNDS_LATTICE
+    lo = np.full((n, dim), -size, dtype=np.float64)
+    hi = np.full((n, dim), size, dtype=np.float64)
+    found = np.ones(n, dtype=bool)
+    active = np.ones(n, dtype=bool)
+    spent = np.zeros(n, dtype=np.int64)
+    # Indices of lattice points along each axis
+    lattice = cartesian_product(*[np.arange(s)] * dim)
+    count = len(lattice)
+    while active.any():
+        idx = np.flatnonzero(active)
+        cells = (hi - lo)[idx] / (s - 1)
+        thresholds = np.linalg.norm(cells, axis=1) / 2
+        points = lo[idx,np.newaxis,:] + lattice[np.newaxis] * cells[:,np.newaxis,:]
+        volume = _sample_fields([fields[i] for i in idx], points)
+        spent[idx] += count
+        near = np.abs(volume) <= thresholds[:,np.newaxis]
+        hit = near.any(axis=1)
+        found[idx[~hit]] = active[idx[~hit]] = False
+        idx, cells, near = idx[hit], cells[hit], near[hit]
+        if not len(idx):
+            continue
+        first = np.where(near[:,:,np.newaxis], lattice[np.newaxis], s).min(axis=1)
+        last = np.where(near[:,:,np.newaxis], lattice[np.newaxis], -1).max(axis=1)
+        new_lo = lo[idx] + first * cells - cells / 2
+        new_hi = lo[idx] + last * cells + cells / 2
+        moved = np.maximum(np.abs(new_lo - lo[idx]), np.abs(new_hi - hi[idx])).max(axis=1)
+        lo[idx], hi[idx] = new_lo, new_hi
+        done = (moved <= tolerance * (new_hi - new_lo).max(axis=1)) | (spent[idx] + count > budget)
+        active[idx[done]] = False
+    return [(lo[i], hi[i]) if found[i] else None for i in range(n)]
+
+def estimate_bounds_many(fields, budget=BOUNDS_BUDGET, tolerance=BOUNDS_TOLERANCE):
+    """
+    Estimate bounding boxes of zero level surfaces of several fields, as
+    ((x0, y0, z0), (x1, y1, z1)). Bounds of SDF trees are calculated
+    without sampling (see tree_bounds); Z range of 2D SDFs is (0, 0).
+    Other fields are sampled together (see sample_bounds), 2D SDF fields
+    in the XY plane.
+    Return list of bounds; None for fields where no surface was found.
+    """
+    result = [None] * len(fields)
+    todo = {2: [], 3: []}
+    for i, field in enumerate(fields):
+        if isinstance(field, SvExSdf2DScalarField):
+            dim = 2
+        else:
+            dim = 3
+        bounds = None
+        if isinstance(field, (SvExSdfScalarField, SvExSdf2DScalarField)):
+            bounds = tree_bounds(field.sdf)
+        if bounds is None:
+            todo[dim].append(i)
+        else:
+            result[i] = bounds
+
+    for dim, idxs in todo.items():
+        if not idxs:
+            continue
+        boxes = sample_bounds([fields[i] for i in idxs], dim, budget, tolerance)
+        for i, box in zip(idxs, boxes):
+            if box is not None:
+                result[i] = (tuple(float(v) for v in box[0]), tuple(float(v) for v in box[1]))
+
+    for i, bounds in enumerate(result):
+        if bounds is not None and len(bounds[0]) == 2:
+            (x0, y0), (x1, y1) = bounds
+            result[i] = ((x0, y0, 0.0), (x1, y1, 0.0))
+    return result
+
+def estimate_bounds(field, budget=BOUNDS_BUDGET, tolerance=BOUNDS_TOLERANCE):
+    """
+    Estimate bounding box of the zero level surface of the field, as
+    ((x0, y0, z0), (x1, y1, z1)); see estimate_bounds_many.
+    Raise ValueError if no surface was found.
+    """
+    bounds = estimate_bounds_many([field], budget, tolerance)[0]
+    if bounds is None:
+        raise ValueError("Can not estimate bounds: no zero level surface found")
+    return bounds
 
 if sdf is not None:
     easing_dict = dict(enumerate([
@@ -0,0 +1,166 @@
+
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from sverchok.utils.logging import debug, exception
+
+# Default limits of memory and disk used by cached volumes
+MAX_BYTES = 512 * 1024 * 1024
+MAX_DISK_BYTES = 4 * 1024 * 1024 * 1024
+
+def temp_directory():
+    """
+    Directory for spilled volumes: under Blender's temporary directory,
+    or under the system one outside of Blender.
+    """
+    try:
+        import bpy
+        base = bpy.app.tempdir
+    except (ImportError, AttributeError):
+        base = None
+    return os.path.join(base or tempfile.gettempdir(), "sverchok_sdf_cache")
+
+def volume_key(tree_hash, coords, **params):
+    """
+    Cache key of a volume sampled from SDF tree with structural hash
+    `tree_hash` on the grid given by coordinate arrays `coords`; params
+    are any other settings which affect sampled values (dtype etc).
+    """
+    h = hashlib.sha1(tree_hash.encode())
+    for cs in coords:
+        cs = np.ascontiguousarray(cs)
+        h.update(str((cs.dtype.str, cs.shape)).encode())
+        h.update(cs.tobytes())
+    h.update(repr(sorted((k, str(v)) for k, v in params.items())).encode())
+    return h.hexdigest()
+
+class SdfVolumeCache(object):
+    """
+    LRU cache of sampled SDF volumes, bounded by total size in bytes.
+    If directory is specified, volumes evicted from memory are saved
+    there as .npy files (the directory is bounded by max_disk_bytes), and
+    loaded back on request.
+    Cached arrays are read-only, as they are shared between callers.
+    """
+    def __init__(self, max_bytes=MAX_BYTES, directory=None, max_disk_bytes=MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.items = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        with self._lock:
+            volume = self.items.get(key)
+            if volume is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return volume
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                volume = np.load(path)
+                os.utime(path)
+            except FileNotFoundError:
+                volume = None
+            except Exception as e:
+                exception("Can't load cached SDF volume %s: %s", path, e)
+                volume = None
+            if volume is not None:
+                self._store(key, volume)
+                with self._lock:
+                    self.hits += 1
+                return volume
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, volume):
+        volume.setflags(write=False)
+        if volume.nbytes > self.max_bytes:
+            self._spill([(key, volume)])
+            return
+        self._store(key, volume)
+
+    def _store(self, key, volume):
+        volume.setflags(write=False)
+        evicted = []
+        with self._lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.size -= old.nbytes
+            self.items[key] = volume
+            self.size += volume.nbytes
+            while self.size > self.max_bytes:
+                evicted_key, evicted_volume = self.items.popitem(last=False)
+                self.size -= evicted_volume.nbytes
+                evicted.append((evicted_key, evicted_volume))
+        self._spill(evicted)
+
+    def _spill(self, items):
+        if self.directory is None or not items:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for key, volume in items:
+                path = self._path(key)
+                if os.path.exists(path):
+                    continue
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, 'wb') as f:
+                    np.save(f, volume)
+                os.replace(tmp, path)
+            self._trim_disk()
+        except Exception as e:
+            exception("Can't save SDF volumes to %s: %s", self.directory, e)
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+        debug("SDF cache directory: %s bytes", total)
+
+    def clear(self):
+        with self._lock:
+            self.items.clear()
+            self.size = 0
+        if self.directory is not None and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".npy"):
+                    os.remove(os.path.join(self.directory, name))
+
+_caches = dict()
+_caches_lock = threading.Lock()
+
+def get_volume_cache(disk=False):
+    """
+    Shared volume cache; the one with disk=True spills to temp_directory().
+    """
+    with _caches_lock:
+        cache = _caches.get(disk)
+        if cache is None:
+            directory = temp_directory() if disk else None
+            cache = _caches[disk] = SdfVolumeCache(directory=directory)
+        return cache
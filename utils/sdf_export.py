@@ -0,0 +1,233 @@
+
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+from sverchok.utils.logging import debug
+from sverchok_extra.utils import sdf_mesh
+
+STL_RECORD = np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+PLY_FACE = np.dtype([('count', 'u1'), ('vertices', '<i4', 3)])
+# Width of element counts in PLY header, which are written when the
+# file is complete
+PLY_COUNT_WIDTH = 10
+# Vertices closer than this (in lattice steps) to a lattice plane are on it
+SEAM_TOLERANCE = 1e-6
+
+class SdfMeshWriter(object):
+    """
+    Base class for writers of triangle soup into binary mesh files,
+    batch by batch. Element counts in the header are filled in by close().
+    If the writer is used as a context manager and an exception occurs,
+    the incomplete file is removed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.count = 0
+
+    def write(self, triangles, job=None):
+        """
+        Write triangles given by (3*n, 3) array of vertices; job is the
+        index of their batch in the list given to the writer, if any.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is not None:
+            os.remove(self.path)
+        return False
+
+class SdfStlWriter(SdfMeshWriter):
+    """
+    Writer of binary STL files.
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self.file.write(b"Binary STL written by Sverchok-Extra SDF Export".ljust(80, b' '))
+        self.file.write(struct.pack('<I', 0))
+
+    def write(self, triangles, job=None):
+        triangles = np.asarray(triangles, dtype=np.float32).reshape((-1, 3, 3))
+        normals = np.cross(triangles[:,1] - triangles[:,0], triangles[:,2] - triangles[:,0])
+        length = np.linalg.norm(normals, axis=1)
+        normals /= np.where(length > 0, length, 1)[:,np.newaxis]
+        records = np.zeros(len(triangles), dtype=STL_RECORD)
+        records['normal'] = normals
+        records['vertices'] = triangles
+        self.file.write(records.tobytes())
+        self.count += len(triangles)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.seek(80)
+            self.file.write(struct.pack('<I', self.count))
+        super().close()
+
+class SdfPlyWriter(SdfMeshWriter):
+    """
+    Writer of binary little endian PLY files. Vertices shared by triangles
+    of one batch are merged. If the lattice (origin, step) and the list of
+    batches are given, and batches are written with their indices in it,
+    vertices on batch borders are merged with ones written by neighbouring
+    batches, so the mesh has no seams: they are identified by the lattice
+    edge they lie on, and only they are kept in memory, until all batches
+    containing them are written. Vertices are written into the file
+    directly, faces are spooled into a temporary file, and appended on
+    close().
+    """
+    def __init__(self, path, lattice=None, batches=None):
+        super().__init__(path)
+        self.lattice = lattice
+        self.starts = None
+        if lattice is not None and batches is not None:
+            # Boxes of batches in integer lattice coordinates
+            origin, step = lattice
+            self.starts = np.array([[np.round((cs[0] - o) / d) for cs, o, d in zip(job, origin, step)]
+                                        for job in batches], dtype=np.int64).reshape((-1, 3))
+            self.ends = self.starts + np.array([[len(cs) - 1 for cs in job] for job in batches],
+                                        dtype=np.int64).reshape((-1, 3))
+            self.size = int(self.ends.max(initial=0)) + 2
+        # Vertices on borders of batches which are not written yet: sorted
+        # keys of their lattice edges, their indices, and indices of the
+        # last batches containing them
+        self.seam_keys = np.zeros(0, dtype=np.int64)
+        self.seam_index = np.zeros(0, dtype=np.int64)
+        self.seam_last = np.zeros(0, dtype=np.int64)
+        self.vertex_count = 0
+        self.faces = tempfile.TemporaryFile()
+        placeholder = "0" * PLY_COUNT_WIDTH
+        header = ["ply",
+                  "format binary_little_endian 1.0",
+                  "comment written by Sverchok-Extra SDF Export",
+                  f"element vertex {placeholder}",
+                  "property float x",
+                  "property float y",
+                  "property float z",
+                  f"element face {placeholder}",
+                  "property list uchar int vertex_indices",
+                  "end_header"]
+        header = "\n".join(header) + "\n"
+        self.vertex_offset = header.index("element vertex ") + len("element vertex ")
+        self.face_offset = header.index("element face ") + len("element face ")
+        self.file.write(header.encode('ascii'))
+
+    def border_vertices(self, verts, batch):
+        """
+        Return indices of vertices on borders of the batch, and their
+        lattice edges: integer coordinates of edge starts, and axes (3 for
+        lattice points).
+        """
+        origin, step = self.lattice
+        g = (verts - origin) / step
+        r = np.round(g)
+        on_plane = np.abs(g - r) < SEAM_TOLERANCE
+        border = (on_plane & ((r == self.starts[batch]) | (r == self.ends[batch]))).any(axis=1)
+        # Vertices of marching cubes lie on lattice edges, so at most one
+        # coordinate is off lattice planes
+        border &= np.count_nonzero(~on_plane, axis=1) <= 1
+        idx = np.flatnonzero(border)
+        off = ~on_plane[idx]
+        base = np.where(off, np.floor(g[idx]), r[idx]).astype(np.int64)
+        axis = np.where(off.any(axis=1), off.argmax(axis=1), 3)
+        return idx, base, axis
+
+    def edge_keys(self, base, axis):
+        # Lattice edges packed into integers; coordinates are shifted
+        # by one, as the floor of a coordinate can be -1 near the origin
+        x, y, z = (base + 1).T
+        return ((x * self.size + y) * self.size + z) * 4 + axis
+
+    def last_batches(self, batch, base, axis):
+        """
+        Return indices of the last batches whose boxes contain the
+        lattice edges (the batch itself, if no later one does).
+        """
+        end = base + np.eye(4, 3, dtype=np.int64)[axis]
+        last = np.full(len(base), batch, dtype=np.int64)
+        later = np.arange(batch + 1, len(self.starts))
+        # Edges are in the box of the batch, so only boxes touching it matter
+        touching = np.all((self.starts[later] <= self.ends[batch]) & (self.ends[later] >= self.starts[batch]), axis=1)
+        for j in later[touching]:
+            inside = np.all((self.starts[j] <= base) & (end <= self.ends[j]), axis=1)
+            last[inside] = j
+        return last
+
+    def write(self, triangles, job=None):
+        verts, faces = sdf_mesh.weld_triangles(triangles, threshold=0)
+        index = np.empty(len(verts), dtype=np.int64)
+        new = np.ones(len(verts), dtype=bool)
+        seam = self.starts is not None and job is not None
+        if seam:
+            idx, base, axis = self.border_vertices(verts, job)
+            keys = self.edge_keys(base, axis)
+            found = np.zeros(len(keys), dtype=bool)
+            if len(self.seam_keys):
+                pos = np.minimum(np.searchsorted(self.seam_keys, keys), len(self.seam_keys) - 1)
+                found = self.seam_keys[pos] == keys
+                index[idx[found]] = self.seam_index[pos[found]]
+                new[idx[found]] = False
+        # Vertices written by this batch are numbered consecutively
+        index[new] = np.arange(np.count_nonzero(new)) + self.vertex_count
+        if seam:
+            last = self.last_batches(job, base[~found], axis[~found])
+            keys = np.concatenate([self.seam_keys, keys[~found]])
+            indices = np.concatenate([self.seam_index, index[idx[~found]]])
+            last = np.concatenate([self.seam_last, last])
+            # Vertices which no later batch contains are not needed any more
+            keep = np.flatnonzero(last > job)
+            order = keep[np.argsort(keys[keep], kind='stable')]
+            self.seam_keys, self.seam_index, self.seam_last = keys[order], indices[order], last[order]
+        self.file.write(np.ascontiguousarray(verts[new], dtype='<f4').tobytes())
+        records = np.empty(len(faces), dtype=PLY_FACE)
+        records['count'] = 3
+        records['vertices'] = index[faces]
+        self.faces.write(records.tobytes())
+        self.vertex_count += np.count_nonzero(new)
+        self.count += len(faces)
+
+    def close(self):
+        if not self.file.closed:
+            self.faces.seek(0)
+            shutil.copyfileobj(self.faces, self.file)
+            self.faces.close()
+            for offset, count in [(self.vertex_offset, self.vertex_count), (self.face_offset, self.count)]:
+                self.file.seek(offset)
+                self.file.write(str(count).zfill(PLY_COUNT_WIDTH).encode('ascii'))
+        super().close()
+
+WRITERS = dict(STL = SdfStlWriter, PLY = SdfPlyWriter)
+
+def export_mesh(sdf, path, file_format='STL', step=None, bounds=None, samples=sdf_mesh.SAMPLES,
+        workers=sdf_mesh.WORKERS, batch_size=sdf_mesh.BATCH_SIZE, sparse=True, dtype=np.float64,
+        cache=None, adaptive=False, backend='THREADS'):
+    """
+    Mesh SDF tree by marching cubes, as sdf_mesh.generate does, and write
+    triangles of each batch into the file ('STL' or 'PLY' format) as soon
+    as the batch is meshed, so that the whole mesh is never kept in memory.
+    Return number of written triangles.
+    """
+    plan = sdf_mesh.plan_mesh(sdf, step, samples, bounds, batch_size, sparse, dtype, adaptive)
+    items = [(plan.sdf, plan.kernel, job) for job in plan.batches]
+    if file_format == 'PLY':
+        lattice = (np.asarray(plan.bounds[0], dtype=np.float64),
+                   np.broadcast_to(np.asarray(plan.step, dtype=np.float64), (3,)))
+        writer = SdfPlyWriter(path, lattice, plan.batches)
+    else:
+        writer = WRITERS[file_format](path)
+    with writer:
+        for i, triangles in enumerate(sdf_mesh.imesh_batches(items, workers, sparse, cache, backend)):
+            if triangles is not None and len(triangles) > 0:
+                writer.write(triangles, i)
+    debug("SDF export: %s triangles written to %s", writer.count, path)
+    return writer.count
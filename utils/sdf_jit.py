@@ -0,0 +1,159 @@
+
+import math
+import os
+import threading
+
+import numpy as np
+
+from sverchok.utils.logging import debug, exception
+from sverchok_extra.dependencies import numba
+from sverchok_extra.utils.sdf_pool import in_worker
+
+if numba is not None:
+    from numba import njit, prange
+
+class SdfJitGenerator(object):
+    """
+    Accumulates lines of Numba code for SDF tree evaluation at one point.
+    Numeric parameters are not inlined into the code, but passed in an
+    array; so trees of the same structure share one compiled kernel.
+    """
+    def __init__(self):
+        self.lines = []
+        self.values = []
+        self.memo = dict()
+
+    def source(self, node, p):
+        """
+        Emit code of the subtree `node` for point p; a subtree shared by
+        several parents is emitted once for the same point.
+        """
+        key = (id(node), tuple(p))
+        result = self.memo.get(key)
+        if result is None:
+            result = self.memo[key] = node.jit_source(self, p)
+        return result
+
+    def param(self, value):
+        self.values.append(float(value))
+        return f"c[{len(self.values) - 1}]"
+
+    def params(self, values):
+        return [self.param(value) for value in values]
+
+    def assign(self, expr):
+        name = f"v{len(self.lines)}"
+        self.lines.append(f"{name} = {expr}")
+        return name
+
+    def dot(self, xs, ys):
+        return " + ".join(f"{x} * {y}" for x, y in zip(xs, ys))
+
+    def nested(self, function, args):
+        expr = args[0]
+        for arg in args[1:]:
+            expr = f"{function}({expr}, {arg})"
+        return expr
+
+    def box_distance(self, qs):
+        outside = " + ".join(f"max({q}, 0.0)**2" for q in qs)
+        inside = self.nested('max', qs)
+        return self.assign(f"sqrt({outside}) + min({inside}, 0.0)")
+
+def generate_jit_source(node):
+    g = SdfJitGenerator()
+    coords = ['x', 'y', 'z'][:node.dim]
+    result = g.source(node, coords)
+    loads = [f"{name} = points[i, {j}]" for j, name in enumerate(coords)]
+    body = "\n".join("        " + line for line in loads + g.lines)
+    source = f"""
+def kernel(points, c, out):
+    for i in prange(points.shape[0]):
+{body}
+        out[i] = {result}
+"""
+    return source, g.values
+
+_kernels = dict()
+_compile_lock = threading.Lock()
+# Parallel kernels are entered only from the main thread of Blender
+# process: threading layers of Numba started from other threads, or
+# inherited by forked worker processes, can keep the interpreter from
+# exiting. sdf.generate evaluates batches from a thread pool, so
+# there serial kernels are used; they release the GIL, so batches are
+# still evaluated on all cores. Workqueue threading layer does not allow
+# parallel kernels to be entered from several threads at once, so their
+# calls are serialized.
+_call_lock = threading.Lock()
+
+def _choose_threading_layer():
+    """
+    Called before the first parallel kernel is compiled. TBB threading
+    layer, which Numba prefers, keeps the process from exiting once worker
+    processes were forked after a parallel kernel was run; workqueue layer
+    is always available and does not. It is selected only if the layer
+    is not configured (by NUMBA_THREADING_LAYER environment variable or
+    otherwise) and was not started by other parallel code in this process,
+    since Numba chooses it once per process.
+    """
+    if 'NUMBA_THREADING_LAYER' in os.environ or numba.config.THREADING_LAYER != 'default':
+        return
+    try:
+        layer = numba.threading_layer()
+        debug("Numba threading layer %s is already running", layer)
+    except ValueError:
+        # No threading layer was started yet
+        numba.config.THREADING_LAYER = 'workqueue'
+
+def use_parallel():
+    """
+    Whether parallel kernels can be called from the current thread.
+    """
+    return threading.current_thread() is threading.main_thread() and not in_worker()
+
+def get_jit_kernel(source, params, dim, parallel=False):
+    key = (source, params.dtype, parallel)
+    with _compile_lock:
+        if key in _kernels:
+            return _kernels[key]
+        namespace = dict(prange=prange, sqrt=math.sqrt, hypot=math.hypot,
+                    sin=math.sin, cos=math.cos, copysign=math.copysign)
+        try:
+            if parallel:
+                _choose_threading_layer()
+            exec(source, namespace)
+            function = njit(parallel=parallel, nogil=not parallel, error_model='numpy')(namespace['kernel'])
+            # Compile right away, so that any failure falls back to NumPy evaluation
+            function(np.zeros((1, dim), dtype=params.dtype), params, np.zeros(1, dtype=params.dtype))
+            debug("Compiled SDF kernel (parallel=%s):\n%s", parallel, source)
+        except Exception as e:
+            exception("Can't compile SDF kernel, NumPy will be used: %s", e)
+            function = None
+        _kernels[key] = function
+        return function
+
+def compile_jit(node, c, p):
+    """
+    Emit one step into SdfCompiler c, which evaluates the whole subtree
+    `node` with a Numba kernel: a parallel one in the main thread, and a
+    serial one elsewhere. Return None if the subtree can not be compiled.
+    """
+    if numba is None:
+        return None
+    source, values = generate_jit_source(node)
+    params = np.array(values, dtype=c.dtype)
+    serial = get_jit_kernel(source, params, node.dim)
+    if serial is None:
+        return None
+    d = c.alloc()
+    def step(p, d):
+        if use_parallel():
+            # Parallel variant is compiled when it is needed first
+            parallel = get_jit_kernel(source, params, node.dim, parallel=True)
+            if parallel is not None:
+                with _call_lock:
+                    parallel(p, params, d)
+                return
+        serial(p, params, d)
+    c.emit(step, p, d)
+    return d
@@ -0,0 +1,921 @@
+
+import itertools
+import multiprocessing
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from sverchok.dependencies import skimage
+from sverchok.utils.logging import debug
+from sverchok_extra.utils.sdf import SvExSdfScalarField, estimate_bounds
+from sverchok_extra.utils.sdf_cache import volume_key
+from sverchok_extra.utils.sdf_tree import changed_region
+from sverchok_extra.utils.sdf_pool import get_process_pool
+
+if skimage is not None:
+    from skimage import measure
+
+WORKERS = multiprocessing.cpu_count()
+SAMPLES = 2 ** 22
+BATCH_SIZE = 32
+# Size of lattice blocks (in cells) checked by interval evaluation
+BLOCK_SIZE = 8
+
+class SdfMeshStats(object):
+    """
+    Statistics of meshing: time spent in each stage (in seconds; stages
+    run by several threads at once are summed over threads, so they can
+    exceed the wall clock time), and counters of batches, points and
+    triangles. It can be updated by several threads at once.
+    """
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.times[name] += seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def as_dict(self):
+        """
+        Return flat dictionary with times ('time_<stage>' keys), counters,
+        and evaluation throughput ('points_per_second').
+        """
+        with self._lock:
+            result = {f"time_{name}" : seconds for name, seconds in self.times.items()}
+            result.update(self.counts)
+            evaluation = self.times.get('evaluation', 0)
+            if evaluation > 0:
+                result['points_per_second'] = self.counts.get('points', 0) / evaluation
+        return result
+
+    def __str__(self):
+        return ", ".join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+                            for key, value in sorted(self.as_dict().items()))
+
+def _stage(stats, name):
+    if stats is None:
+        return nullcontext()
+    return stats.stage(name)
+
+def lattice(X, Y, Z, dtype=np.float64):
+    """
+    Cartesian product of coordinate ranges, as (len(X)*len(Y)*len(Z), 3) array.
+    """
+    points = np.empty((len(X), len(Y), len(Z), 3), dtype=dtype)
+    points[...,0] = X[:,np.newaxis,np.newaxis]
+    points[...,1] = Y[np.newaxis,:,np.newaxis]
+    points[...,2] = Z[np.newaxis,np.newaxis,:]
+    return points.reshape((-1, 3))
+
+def marching_cubes(volume, level=0):
+    verts, faces, _, _ = measure.marching_cubes(volume, level)
+    return verts[faces].reshape((-1, 3))
+
+def make_batches(bounds, step, batch_size):
+    (x0, y0, z0), (x1, y1, z1) = bounds
+    try:
+        dx, dy, dz = step
+    except TypeError:
+        dx = dy = dz = step
+    X = np.arange(x0, x1, dx)
+    Y = np.arange(y0, y1, dy)
+    Z = np.arange(z0, z1, dz)
+    s = batch_size
+    Xs = [X[i:i+s+1] for i in range(0, len(X), s)]
+    Ys = [Y[i:i+s+1] for i in range(0, len(Y), s)]
+    Zs = [Z[i:i+s+1] for i in range(0, len(Z), s)]
+    return list(itertools.product(Xs, Ys, Zs))
+
+def may_contain_surface(sdf, kernel, lo, hi):
+    """
+    Check which boxes (lo[i], hi[i]) can contain the surface: their value
+    interval contains zero, and SDF value at the center is not larger
+    than the distance to corners (this assumes that SDF values do not
+    exceed the distance to the surface).
+    Return boolean array.
+    """
+    dlo, dhi = sdf.interval(lo, hi)
+    center = (lo + hi) / 2
+    r = np.linalg.norm(hi - lo, axis=1) / 2
+    d = kernel(center)
+    return (dlo <= 0) & (dhi >= 0) & (np.abs(d) <= r)
+
+def adaptive_batches(sdf, kernel, bounds, step, batch_size):
+    """
+    Select batches which can contain the surface, by descending an octree
+    over the grid of batches: an octree cell is subdivided only if it
+    can contain the surface (see may_contain_surface), so empty space is
+    dropped in large cells, and the cost grows with the area of the
+    surface rather than with the volume. Leaves are batches of the same
+    lattice as make_batches produces, so all batches crossed by the
+    surface have the same resolution, and their triangles meet without
+    cracks.
+    """
+    (x0, y0, z0), (x1, y1, z1) = bounds
+    try:
+        dx, dy, dz = step
+    except TypeError:
+        dx = dy = dz = step
+    coords = [np.arange(x0, x1, dx), np.arange(y0, y1, dy), np.arange(z0, z1, dz)]
+    s = batch_size
+    counts = np.array([-(-len(cs) // s) for cs in coords])
+    if not counts.all():
+        return []
+    origin = np.array((x0, y0, z0), dtype=np.float64)
+    size = np.array((dx, dy, dz), dtype=np.float64) * s
+    corners = np.array(list(itertools.product((0, 1), repeat=3)))
+
+    level = int(np.ceil(np.log2(counts.max())))
+    cells = np.zeros((1, 3), dtype=np.int64)
+    while True:
+        lo = origin + cells * size
+        hi = origin + np.minimum(cells + 2 ** level, counts) * size
+        cells = cells[may_contain_surface(sdf, kernel, lo, hi)]
+        if level == 0 or not len(cells):
+            break
+        level -= 1
+        cells = (cells[:,np.newaxis] + corners * 2 ** level).reshape((-1, 3))
+        cells = cells[np.all(cells < counts, axis=1)]
+    debug("SDF generate: octree leaves %s of %s batches", len(cells), counts.prod())
+
+    X, Y, Z = coords
+    return [(X[i*s:i*s+s+1], Y[j*s:j*s+s+1], Z[k*s:k*s+s+1]) for i, j, k in cells]
+
+def skip_batch(kernel, job):
+    """
+    Check if the batch can not contain the surface: SDF value at the
+    center is larger than the distance to corners, and all corners are
+    on the same side of the surface.
+    """
+    X, Y, Z = job
+    x0, x1 = X[0], X[-1]
+    y0, y1 = Y[0], Y[-1]
+    z0, z1 = Z[0], Z[-1]
+    x = (x0 + x1) / 2
+    y = (y0 + y1) / 2
+    z = (z0 + z1) / 2
+    r = abs(kernel(np.array([(x, y, z)]))[0])
+    d = np.linalg.norm(np.array((x - x0, y - y0, z - z0)))
+    if r <= d:
+        return False
+    corners = np.array(list(itertools.product((x0, x1), (y0, y1), (z0, z1))))
+    values = kernel(corners)
+    if values[0] > 0:
+        return np.all(values > 0)
+    else:
+        return np.all(values < 0)
+
+def prune_lattice(sdf, kernel, X, Y, Z, block_size=BLOCK_SIZE, stats=None):
+    """
+    Sample SDF on the lattice, skipping regions which can not contain the
+    surface. Lattice cells are grouped into blocks of block_size^3 cells;
+    SDF values are only calculated at corners of blocks whose value
+    interval contains zero. The rest of the lattice is filled with
+    values of the same sign as SDF (interval bounds), so marching cubes
+    produces no triangles there.
+    Return the volume array; None if no block can contain the surface.
+    """
+    coords = (X, Y, Z)
+    starts = [np.arange(0, len(cs) - 1, block_size) for cs in coords]
+    ends = [np.minimum(s + block_size, len(cs) - 1) for s, cs in zip(starts, coords)]
+    lo = lattice(*[cs[s] for cs, s in zip(coords, starts)])
+    hi = lattice(*[cs[e] for cs, e in zip(coords, ends)])
+    dlo, dhi = sdf.interval(lo, hi)
+    surface = (dlo <= 0) & (dhi >= 0)
+    if not surface.any():
+        return None
+    if surface.all():
+        points = lattice(X, Y, Z, kernel.dtype)
+        if stats is not None:
+            stats.count('points', len(points))
+        return kernel(points).reshape((len(X), len(Y), len(Z)))
+
+    shape = tuple(len(s) for s in starts)
+    # Lattice point i lies in block i // block_size; the last points
+    # belong to the last block
+    fill = np.where(dlo > 0, dlo, dhi).reshape(shape)
+    fill = np.pad(fill, [(0, 1)] * 3, mode='edge')
+    for axis in range(3):
+        fill = fill.repeat(block_size, axis=axis)
+    volume = fill[:len(X), :len(Y), :len(Z)].astype(kernel.dtype)
+    # Corners of blocks are shared with neighbours, so the slices overlap
+    mask = np.zeros(volume.shape, dtype=bool)
+    for i, j, k in np.argwhere(surface.reshape(shape)) * block_size:
+        mask[i:i+block_size+1, j:j+block_size+1, k:k+block_size+1] = True
+    idx = np.nonzero(mask)
+    points = np.stack([cs[i] for cs, i in zip(coords, idx)], axis=1)
+    if stats is not None:
+        stats.count('points', len(points))
+    volume[idx] = kernel(points)
+    return volume
+
+def sample_batch(sdf, kernel, X, Y, Z, sparse=True, stats=None):
+    """
+    Return SDF volume on the lattice of the batch; None if it can not
+    contain the surface.
+    """
+    if sparse:
+        return prune_lattice(sdf, kernel, X, Y, Z, stats=stats)
+    points = lattice(X, Y, Z, kernel.dtype)
+    if stats is not None:
+        stats.count('points', len(points))
+    return kernel(points).reshape((len(X), len(Y), len(Z)))
+
+def batch_volume(sdf, kernel, job, sparse=True, cache=None, stats=None):
+    """
+    Return SDF volume sampled on the lattice of the batch; None, if the
+    batch can not contain the surface.
+    If cache (SdfVolumeCache) is specified, sampled volumes are looked up
+    there by structural hash of the SDF tree and lattice coordinates.
+    Time of the stages is added to stats (SdfMeshStats), if specified.
+    """
+    X, Y, Z = job
+    if sparse:
+        with _stage(stats, 'sparse'):
+            box = np.array([[X[0], Y[0], Z[0]]]), np.array([[X[-1], Y[-1], Z[-1]]])
+            dlo, dhi = sdf.interval(*box)
+            if dlo[0] > 0 or dhi[0] < 0:
+                return None
+            # Fall back to sampling if SDF values can not be estimated
+            if np.isinf(dlo[0]) and np.isinf(dhi[0]) and skip_batch(kernel, job):
+                return None
+
+    key = None
+    volume = None
+    if cache is not None and sdf.structural_hash() is not None:
+        key = volume_key(sdf.structural_hash(), job, dtype=kernel.dtype)
+        volume = cache.get(key)
+        if volume is not None and stats is not None:
+            stats.count('cache_hits')
+    if volume is None:
+        with _stage(stats, 'evaluation'):
+            volume = sample_batch(sdf, kernel, X, Y, Z, sparse, stats)
+        if volume is not None and key is not None:
+            cache.put(key, volume)
+    return volume
+
+def mesh_batch(sdf, kernel, job, sparse=True, cache=None, stats=None):
+    """
+    Return triangles of the batch, as (3*n, 3) array of vertices;
+    None, if the batch was skipped.
+    """
+    X, Y, Z = job
+    if len(X) < 2 or len(Y) < 2 or len(Z) < 2:
+        return np.empty((0, 3))
+    volume = batch_volume(sdf, kernel, job, sparse, cache, stats)
+    if volume is None:
+        return None
+
+    try:
+        with _stage(stats, 'marching_cubes'):
+            triangles = marching_cubes(volume)
+    except Exception:
+        return np.empty((0, 3))
+    scale = np.array([X[1] - X[0], Y[1] - Y[0], Z[1] - Z[0]])
+    offset = np.array([X[0], Y[0], Z[0]])
+    return triangles * scale + offset
+
+## Dual contouring
+
+# Singular values of QEF matrix smaller than this fraction of the largest
+# one are dropped, so that vertices of flat and edge-like cells stay near
+# the mass point of the crossings instead of running along the surface
+QEF_TOLERANCE = 0.1
+
+# Offsets of four cells around a lattice edge along each axis, in the
+# counter-clockwise order when looking against the axis
+EDGE_CELLS = np.array([
+        [(0, -1, -1), (0, 0, -1), (0, 0, 0), (0, -1, 0)],
+        [(-1, 0, -1), (-1, 0, 0), (0, 0, 0), (0, 0, -1)],
+        [(-1, -1, 0), (0, -1, 0), (0, 0, 0), (-1, 0, 0)]
+    ])
+
+def solve_qef(ata, atb, mass):
+    """
+    Minimize quadratic error functions sum((n_i, x - p_i)^2) for many
+    cells at once, given A^T A (m, 3, 3), A^T b (m, 3) and mass points
+    of intersections (m, 3). Return the (m, 3) array of minimizers;
+    along directions where the system is degenerate, mass points are taken.
+    """
+    w, v = np.linalg.eigh(ata)
+    # Eigenvalues of A^T A are squares of singular values of A
+    keep = w > (QEF_TOLERANCE ** 2) * w[:,-1:]
+    inverse = np.where(keep, 1 / np.where(keep, w, 1), 0)
+    residual = atb - np.einsum('mij,mj->mi', ata, mass)
+    delta = np.einsum('mij,mj,mj->mi', v, inverse, np.einsum('mji,mj->mi', v, residual))
+    return mass + delta
+
+def dual_contour_batch(sdf, kernel, job, sparse=True, cache=None):
+    """
+    Dual contouring of the batch lattice: one vertex per lattice cell
+    crossed by the surface, placed by minimizing QEF built from points
+    where the surface crosses cell edges, and normals there (taken from
+    SDF gradients: analytic where nodes know them, finite differences
+    otherwise). Vertices of cells with sharp edges or corners stay on them.
+    Return (cells, vertices, edges): local indices of crossed cells (m, 3),
+    their vertices (m, 3), and lattice edges crossed by the surface as
+    (k, 5) array of (i, j, k, axis, flip); None, if the batch was skipped.
+    """
+    X, Y, Z = job
+    if len(X) < 2 or len(Y) < 2 or len(Z) < 2:
+        return None
+    volume = batch_volume(sdf, kernel, job, sparse, cache)
+    if volume is None:
+        return None
+    volume = volume.astype(np.float64)
+    coords = [np.asarray(cs, dtype=np.float64) for cs in job]
+    inside = volume < 0
+
+    points = []
+    edges = []
+    for axis in range(3):
+        lower = [slice(None)] * 3
+        upper = [slice(None)] * 3
+        lower[axis] = slice(None, -1)
+        upper[axis] = slice(1, None)
+        v0, v1 = volume[tuple(lower)], volume[tuple(upper)]
+        crossed = inside[tuple(lower)] != inside[tuple(upper)]
+        idx = np.argwhere(crossed)
+        t = v0[crossed] / (v0[crossed] - v1[crossed])
+        p = np.stack([cs[i] for cs, i in zip(coords, idx.T)], axis=1)
+        cs = coords[axis]
+        p[:,axis] += t * (cs[idx[:,axis] + 1] - cs[idx[:,axis]])
+        points.append(p)
+        flip = ~inside[tuple(lower)][crossed]
+        edges.append(np.column_stack([idx, np.full(len(idx), axis), flip]))
+    edges = np.concatenate(edges)
+    if not len(edges):
+        return None
+    points = np.concatenate(points)
+    values, normals = sdf.evaluate_with_gradient(points)
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:,np.newaxis]
+    # Linear interpolation is not exact where SDF is curved along the
+    # edge (near corners); step along the gradient towards the surface
+    points -= values[:,np.newaxis] * normals
+
+    # Each crossing contributes to QEF of the four cells around its edge
+    shape = tuple(len(cs) - 1 for cs in coords)
+    n = int(np.prod(shape))
+    around = edges[:,np.newaxis,:3] + EDGE_CELLS[edges[:,3]]
+    valid = np.all((around >= 0) & (around < shape), axis=2)
+    crossing, _ = np.nonzero(valid)
+    cell = np.ravel_multi_index(tuple(around[valid].T), shape)
+    nn = normals[crossing]
+    pp = points[crossing]
+    d = np.einsum('ij,ij->i', nn, pp)
+    count = np.bincount(cell, minlength=n)
+    ata = np.stack([np.bincount(cell, nn[:,i] * nn[:,j], minlength=n)
+                for i in range(3) for j in range(3)], axis=1).reshape((n, 3, 3))
+    atb = np.stack([np.bincount(cell, nn[:,i] * d, minlength=n) for i in range(3)], axis=1)
+    mass = np.stack([np.bincount(cell, pp[:,i], minlength=n) for i in range(3)], axis=1)
+
+    active = np.flatnonzero(count)
+    mass = mass[active] / count[active][:,np.newaxis]
+    vertices = solve_qef(ata[active], atb[active], mass)
+    cells = np.stack(np.unravel_index(active, shape), axis=1)
+    # Keep vertices inside their cells
+    lo = np.stack([cs[i] for cs, i in zip(coords, cells.T)], axis=1)
+    hi = np.stack([cs[i + 1] for cs, i in zip(coords, cells.T)], axis=1)
+    vertices = np.clip(vertices, lo, hi)
+    return cells, vertices, edges
+
+def dual_contouring(sdf, kernel, bounds, step, batches, workers=WORKERS, sparse=True, cache=None):
+    """
+    Generate triangle mesh of SDF tree surface by dual contouring of
+    the batches, which must be cut from the lattice of make_batches
+    (bounds, step). Cells of neighbouring batches are joined by quads
+    across the batch borders.
+    Return (3*n, 3) array of triangle vertices.
+    """
+    (x0, y0, z0), (x1, y1, z1) = bounds
+    try:
+        dx, dy, dz = step
+    except TypeError:
+        dx = dy = dz = step
+    coords = [np.arange(x0, x1, dx), np.arange(y0, y1, dy), np.arange(z0, z1, dz)]
+    shape = tuple(len(cs) - 1 for cs in coords)
+
+    def process(job):
+        result = dual_contour_batch(sdf, kernel, job, sparse, cache)
+        if result is None:
+            return None
+        cells, vertices, edges = result
+        offset = np.array([np.searchsorted(cs, c[0]) for cs, c in zip(coords, job)])
+        edges[:,:3] += offset
+        return np.ravel_multi_index(tuple((cells + offset).T), shape), vertices, edges
+
+    cells, vertices, edges = [], [], []
+    pool = ThreadPool(workers)
+    try:
+        for result in pool.imap(process, batches):
+            if result is not None:
+                cells.append(result[0])
+                vertices.append(result[1])
+                edges.append(result[2])
+    finally:
+        pool.close()
+    debug("SDF dual contouring: %s nonempty batches", len(cells))
+    if not cells:
+        return np.empty((0, 3))
+
+    cells = np.concatenate(cells)
+    order = np.argsort(cells)
+    cells = cells[order]
+    vertices = np.concatenate(vertices)[order]
+    # Edges on borders of batches are found by both neighbours
+    edges = np.unique(np.concatenate(edges), axis=0)
+
+    around = edges[:,np.newaxis,:3] + EDGE_CELLS[edges[:,3]]
+    valid = np.all((around >= 0) & (around < shape), axis=(1, 2))
+    around, flip = around[valid], edges[valid,4].astype(bool)
+    ids = np.ravel_multi_index(tuple(around.reshape((-1, 3)).T), shape)
+    idx = np.minimum(np.searchsorted(cells, ids), len(cells) - 1)
+    quads = idx.reshape((-1, 4))
+    found = np.all(cells[quads] == ids.reshape((-1, 4)), axis=1)
+    quads, flip = quads[found], flip[found]
+    quads[flip] = quads[flip][:,::-1]
+    triangles = np.concatenate([quads[:,[0, 1, 2]], quads[:,[0, 2, 3]]])
+    return vertices[triangles].reshape((-1, 3))
+
+def weld_triangles(triangles, threshold=1e-6):
+    """
+    Convert triangle soup ((3*n, 3) array of vertices) into mesh with shared
+    vertices. Coordinates are quantized to multiples of threshold, and
+    vertices with equal quantized coordinates are merged (with threshold
+    of 0, only identical vertices are). Triangles which become degenerate
+    are removed, together with vertices used only by them.
+    Return (verts, faces) pair of (m, 3) float and (k, 3) integer arrays.
+    """
+    triangles = np.asarray(triangles)
+    if not len(triangles):
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64)
+    if threshold > 0:
+        keys = np.round(triangles / threshold).astype(np.int64)
+        keys -= keys.min(axis=0)
+        extent = keys.max(axis=0).astype(np.float64) + 1
+        if np.prod(extent) < 2 ** 63:
+            # Hash quantized coordinates into one integer, which is much
+            # faster to sort than rows
+            keys = np.ravel_multi_index(tuple(keys.T), tuple(extent.astype(np.int64)))
+    else:
+        keys = np.ascontiguousarray(triangles)
+    if keys.ndim > 1:
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * 3))).ravel()
+    _, index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    verts = triangles[index]
+    faces = inverse.reshape((-1, 3))
+    good = (faces[:,0] != faces[:,1]) & (faces[:,1] != faces[:,2]) & (faces[:,2] != faces[:,0])
+    if not good.all():
+        faces = faces[good]
+        used = np.zeros(len(verts), dtype=bool)
+        used[faces] = True
+        verts = verts[used]
+        faces = (np.cumsum(used) - 1)[faces]
+    return verts, faces
+
+class SdfMeshState(object):
+    """
+    Mesh produced by the previous call of generate, kept to re-mesh only
+    the part of it which changed since then: the SDF tree, the lattice,
+    and triangles of each nonempty batch, keyed by the first lattice
+    point of the batch.
+    """
+    def __init__(self):
+        self.sdf = None
+        self.settings = None
+        self.bounds = None
+        self.step = None
+        self.triangles = dict()
+
+    def clear(self):
+        self.sdf = None
+        self.triangles.clear()
+
+    def result(self):
+        if not self.triangles:
+            return np.empty((0, 3))
+        return np.concatenate(list(self.triangles.values()))
+
+def batch_key(job):
+    X, Y, Z = job
+    return (X[0], Y[0], Z[0])
+
+def dirty_batches(batches, boxes):
+    """
+    Select batches which intersect any of the boxes.
+    """
+    if not batches or not boxes:
+        return []
+    lo = np.array([[X[0], Y[0], Z[0]] for X, Y, Z in batches])
+    hi = np.array([[X[-1], Y[-1], Z[-1]] for X, Y, Z in batches])
+    box_lo = np.array([box[0] for box in boxes])
+    box_hi = np.array([box[1] for box in boxes])
+    hit = (lo[:,np.newaxis] <= box_hi[np.newaxis]) & (hi[:,np.newaxis] >= box_lo[np.newaxis])
+    hit = hit.all(axis=2).any(axis=1)
+    return [job for job, h in zip(batches, hit) if h]
+
+def _mesh_batch_in_worker(sdf, job, sparse, dtype):
+    return mesh_batch(sdf, sdf.kernel(dtype), job, sparse)
+
+def imesh_batches(items, workers=WORKERS, sparse=True, cache=None, backend='THREADS', stats=None):
+    """
+    Run mesh_batch for each (sdf, kernel, batch) item, possibly of
+    different SDF trees. Items are queued to one pool of threads, or, if
+    backend is 'PROCESSES', to one pool of processes evaluating all the
+    trees (see SdfProcessPool), which is faster for trees whose evaluation
+    holds the GIL; triangles are passed back through shared memory, and
+    worker processes do not use the cache. Idle workers take the next
+    item from the common queue, so they stay busy until all trees are
+    meshed. Times of stages are added to stats (SdfMeshStats) by the
+    threads; worker processes do not report them.
+    Yield results in the order of items, as soon as they are ready.
+    """
+    pool = None
+    if backend == 'PROCESSES' and len(items) > 1:
+        sdfs = list({id(sdf) : sdf for sdf, _, _ in items}.values())
+        pool = get_process_pool(sdfs, workers)
+    if pool is not None:
+        index = {id(sdf) : i for i, sdf in enumerate(sdfs)}
+        jobs = [(index[id(sdf)], (job, sparse, kernel.dtype.str)) for sdf, kernel, job in items]
+        yield from pool.imap(_mesh_batch_in_worker, jobs)
+    else:
+        pool = ThreadPool(workers)
+        try:
+            yield from pool.imap(lambda item: mesh_batch(*item, sparse, cache, stats), items, chunksize=1)
+        finally:
+            pool.terminate()
+
+def mesh_batches(items, workers=WORKERS, sparse=True, cache=None, backend='THREADS', stats=None):
+    """
+    Run mesh_batch for each (sdf, kernel, batch) item (see imesh_batches).
+    Return list of results, in the order of items.
+    """
+    with _stage(stats, 'meshing'):
+        results = list(imesh_batches(items, workers, sparse, cache, backend, stats))
+    skipped = sum(1 for result in results if result is None)
+    empty = sum(1 for result in results if result is not None and len(result) == 0)
+    debug("SDF generate: %s skipped, %s empty, %s nonempty batches",
+            skipped, empty, len(results) - skipped - empty)
+    if stats is not None:
+        stats.count('batches', len(results))
+        stats.count('batches_skipped', skipped)
+        stats.count('batches_empty', empty)
+        stats.count('triangles', sum(len(result) // 3 for result in results if result is not None))
+    return results
+
+def changed_batches(state, sdf, batch_size):
+    """
+    Select batches of the lattice kept in state (SdfMeshState) which
+    intersect the region changed between its SDF tree and the new
+    version (see changed_region), and so must be meshed again.
+    Return None if the region is unknown or can contain surface outside
+    of the lattice.
+    """
+    step = np.broadcast_to(state.step, (3,))
+    # Triangles of a cell depend only on values at its corners, which
+    # are within a diagonal of the cell from the surface
+    boxes = changed_region(state.sdf, sdf, margin=np.linalg.norm(step))
+    if boxes is None:
+        return None
+    lo, hi = np.asarray(state.bounds[0]), np.asarray(state.bounds[1])
+    if any(np.any(box[0] < lo) or np.any(box[1] > hi) for box in boxes):
+        return None
+    batches = dirty_batches(make_batches(state.bounds, state.step, batch_size), boxes)
+    debug("SDF generate: %s changed regions, %s batches to update", len(boxes), len(batches))
+    return batches
+
+class SdfMeshPlan(object):
+    """
+    Batches of one SDF tree to be meshed by generate_many, and the way
+    their results make the mesh.
+    """
+    def __init__(self, sdf, kernel, state=None):
+        self.sdf = sdf
+        self.kernel = kernel
+        self.state = state
+        self.bounds = None
+        self.step = None
+        self.batches = []
+        # Whether the batches update the mesh kept in state
+        self.incremental = False
+
+    def finish(self, results):
+        state = self.state
+        if self.incremental:
+            for job, result in zip(self.batches, results):
+                if result is None or len(result) == 0:
+                    state.triangles.pop(batch_key(job), None)
+                else:
+                    state.triangles[batch_key(job)] = result
+            state.sdf = self.sdf
+            return state.result()
+        triangles = [result for result in results if result is not None and len(result) > 0]
+        if state is not None:
+            state.sdf = self.sdf
+            state.bounds = self.bounds
+            state.step = self.step
+            state.triangles = {batch_key(job) : result for job, result in zip(self.batches, results)
+                                if result is not None and len(result) > 0}
+        if not triangles:
+            return np.empty((0, 3))
+        return np.concatenate(triangles)
+
+def plan_mesh(sdf, step=None, samples=SAMPLES, bounds=None, batch_size=BATCH_SIZE,
+        sparse=True, dtype=np.float64, adaptive=False, state=None, stats=None):
+    """
+    Select the lattice and batches to mesh SDF tree, with arguments as of
+    generate (see there).
+    Return SdfMeshPlan.
+    """
+    plan = SdfMeshPlan(sdf, sdf.kernel(dtype), state)
+    if state is not None:
+        settings = repr((bounds, step, samples, batch_size, sparse, np.dtype(dtype).str))
+        if state.sdf is not None and state.settings == settings:
+            batches = changed_batches(state, sdf, batch_size)
+            if batches is not None:
+                plan.batches = batches
+                plan.incremental = True
+                return plan
+        state.clear()
+        state.settings = settings
+
+    estimated = bounds is None
+    if estimated:
+        with _stage(stats, 'bounds'):
+            bounds = estimate_bounds(SvExSdfScalarField(sdf))
+    (x0, y0, z0), (x1, y1, z1) = bounds
+    if step is None and samples is not None:
+        volume = (x1 - x0) * (y1 - y0) * (z1 - z0)
+        step = (volume / samples) ** (1 / 3)
+    if estimated:
+        # Analytic bounds touch the surface; a margin of one cell keeps
+        # the mesh closed at the sides of the lattice
+        margin = np.broadcast_to(np.asarray(step, dtype=np.float64), (3,))
+        bounds = (tuple(np.asarray(bounds[0]) - margin), tuple(np.asarray(bounds[1]) + margin))
+    plan.bounds = bounds
+    plan.step = step
+
+    with _stage(stats, 'planning'):
+        if adaptive:
+            plan.batches = adaptive_batches(sdf, plan.kernel, bounds, step, batch_size)
+        else:
+            plan.batches = make_batches(bounds, step, batch_size)
+    debug("SDF generate: bounds %s, step %s, %s batches", bounds, step, len(plan.batches))
+    return plan
+
+def generate_many(sdfs, steps=None, samples=None, bounds=None, states=None,
+        workers=WORKERS, batch_size=BATCH_SIZE, sparse=True, dtype=np.float64,
+        cache=None, adaptive=False, algorithm='MARCHING_CUBES', backend='THREADS',
+        stats=None):
+    """
+    Generate triangle meshes of several SDF trees, as generate does for
+    each one; steps, samples, bounds and states are lists of values of
+    the corresponding arguments of generate for each tree (None stands
+    for the list of default values). Batches of all trees are meshed in
+    one pool (see mesh_batches). Times of stages and counters are added
+    to stats (SdfMeshStats), if specified.
+    Return list of (3*n, 3) arrays of triangle vertices.
+    """
+    n = len(sdfs)
+    steps = steps if steps is not None else [None] * n
+    samples = samples if samples is not None else [SAMPLES] * n
+    bounds = bounds if bounds is not None else [None] * n
+    states = states if states is not None else [None] * n
+    if algorithm != 'MARCHING_CUBES':
+        states = [None] * n
+
+    plans = [plan_mesh(sdf, step, sdf_samples, sdf_bounds, batch_size, sparse, dtype, adaptive, state, stats)
+                for sdf, step, sdf_samples, sdf_bounds, state in zip(sdfs, steps, samples, bounds, states)]
+
+    if algorithm == 'DUAL_CONTOURING':
+        with _stage(stats, 'dual_contouring'):
+            return [dual_contouring(plan.sdf, plan.kernel, plan.bounds, plan.step, plan.batches, workers, sparse, cache)
+                        for plan in plans]
+
+    items = [(plan.sdf, plan.kernel, job) for plan in plans for job in plan.batches]
+    results = mesh_batches(items, workers, sparse, cache, backend, stats)
+    meshes = []
+    start = 0
+    for plan in plans:
+        end = start + len(plan.batches)
+        meshes.append(plan.finish(results[start:end]))
+        start = end
+    return meshes
+
+def generate(sdf, step=None, bounds=None, samples=SAMPLES,
+        workers=WORKERS, batch_size=BATCH_SIZE, sparse=True, dtype=np.float64,
+        cache=None, adaptive=False, algorithm='MARCHING_CUBES', state=None,
+        backend='THREADS', stats=None):
+    """
+    Generate triangle mesh of SDF tree surface by marching cubes (or by
+    dual contouring, if algorithm is 'DUAL_CONTOURING'), in batches.
+    This works as sdf.generate, but the lattice is sampled with the
+    specified floating point precision (dtype), and sampled volumes can
+    be reused from cache (SdfVolumeCache). If adaptive is True, batches
+    are selected by octree subdivision (see adaptive_batches) instead of
+    checking each batch of the bounding box.
+    If state (SdfMeshState) is specified, the mesh is kept there, and the
+    next call with the same settings re-meshes only batches affected by
+    changes of the SDF tree (see changed_batches); marching cubes only.
+    Batches are meshed by a pool of threads or, if backend is 'PROCESSES',
+    by a pool of processes (see mesh_batches); marching cubes only.
+    Times of stages and counters are added to stats (SdfMeshStats).
+    Return (3*n, 3) array of triangle vertices.
+    """
+    return generate_many([sdf], [step], [samples], [bounds], [state],
+                workers = workers, batch_size = batch_size, sparse = sparse,
+                dtype = dtype, cache = cache, adaptive = adaptive,
+                algorithm = algorithm, backend = backend, stats = stats)[0]
+
+## Decimation
+
+# Edge collapses which turn normals of triangles around the edge by more
+# than arccos of this value are rejected, as they make folds and slivers
+DECIMATE_MIN_COS = 0.2
+DECIMATE_MAX_PASSES = 100
+
+def vertex_quadrics(verts, faces):
+    """
+    Quadric error matrices of vertices: sums of squared distances to the
+    planes of adjacent faces, as (n, 4, 4) array.
+    """
+    a, b, c = verts[faces[:,0]], verts[faces[:,1]], verts[faces[:,2]]
+    normals = np.cross(b - a, c - a)
+    length = np.linalg.norm(normals, axis=1)
+    normals /= np.where(length > 0, length, 1)[:,np.newaxis]
+    planes = np.concatenate([normals, -np.einsum('ij,ij->i', normals, a)[:,np.newaxis]], axis=1)
+    products = (planes[:,:,np.newaxis] * planes[:,np.newaxis,:]).reshape((-1, 16))
+    index = faces.ravel()
+    quadrics = np.empty((len(verts), 16))
+    for i in range(16):
+        quadrics[:,i] = np.bincount(index, weights=np.repeat(products[:,i], 3), minlength=len(verts))
+    return quadrics.reshape((-1, 4, 4))
+
+def collapse_positions(quadrics, lo, hi):
+    """
+    Positions minimizing quadric errors, for edges with end points lo and
+    hi. The quadric is regularized by a small pull towards the middle of
+    the edge, so that positions stay defined on flat and cylindrical
+    parts. Return positions and errors.
+    """
+    A = quadrics[:,:3,:3]
+    b = quadrics[:,:3,3]
+    middle = (lo + hi) / 2
+    eps = 1e-3 * np.trace(A, axis1=1, axis2=2)[:,np.newaxis,np.newaxis] / 3 + 1e-12
+    positions = np.linalg.solve(A + eps * np.eye(3), (eps[:,:,0] * middle - b)[:,:,np.newaxis])[:,:,0]
+    homogeneous = np.concatenate([positions, np.ones((len(positions), 1))], axis=1)
+    errors = np.einsum('ni,nij,nj->n', homogeneous, quadrics, homogeneous)
+    return positions, np.maximum(errors, 0)
+
+def _independent_edges(n, faces, a, b, cost, check, rounds=4):
+    # Select edges which can be collapsed at once: first, edges with the
+    # least cost among edges sharing a vertex with them, which pass the
+    # check (edges failing it are dropped, and the selection is repeated
+    # a few times, so that they do not block their neighbours); then, of
+    # those which share a triangle, the cheapest one. Ties (as on flat
+    # parts, where the cost is zero) are broken randomly; breaking them
+    # by index would leave few local minima in each pass
+    tie = np.random.default_rng(len(cost)).random(len(cost))
+    rank = np.empty(len(cost), dtype=np.int64)
+    rank[np.lexsort((tie, cost))] = np.arange(len(cost))
+    big = len(cost)
+    alive = np.ones(len(cost), dtype=bool)
+    checked = np.zeros(len(cost), dtype=bool)
+    for _ in range(rounds):
+        vertex_min = np.full(n, big)
+        np.minimum.at(vertex_min, a[alive], rank[alive])
+        np.minimum.at(vertex_min, b[alive], rank[alive])
+        selected = alive & (vertex_min[a] == rank) & (vertex_min[b] == rank)
+        new = np.flatnonzero(selected & ~checked)
+        if not len(new):
+            break
+        checked[new] = True
+        alive[new[~check(new)]] = False
+    selected &= checked & alive
+    vertex_min = np.full(n, big)
+    vertex_min[a[selected]] = rank[selected]
+    vertex_min[b[selected]] = rank[selected]
+    face_min = vertex_min[faces].min(axis=1)
+    around = np.full(n, big)
+    np.minimum.at(around, faces.ravel(), np.repeat(face_min, 3))
+    return selected & (around[a] == rank) & (around[b] == rank)
+
+def _link_condition(n, edges, a, b):
+    # Ends of the edge may have only two common neighbours (vertices of
+    # the two triangles around it), otherwise the collapse makes the
+    # mesh non-manifold
+    keys = np.sort(np.concatenate([edges[:,0] * n + edges[:,1], edges[:,1] * n + edges[:,0]]))
+    starts = np.searchsorted(keys, np.arange(n + 1) * n)
+    index, owner = _expand(starts, a)
+    neighbours = keys[index] % n
+    probe = b[owner] * n + neighbours
+    found = keys[np.minimum(np.searchsorted(keys, probe), len(keys) - 1)] == probe
+    return np.bincount(owner, weights=found, minlength=len(a)) == 2
+
+def _expand(starts, index):
+    # Concatenate ranges starts[i]:starts[i+1] for each i in index;
+    # return the positions and the number of the range of each
+    lengths = starts[index + 1] - starts[index]
+    owner = np.repeat(np.arange(len(index)), lengths)
+    offsets = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts[index], lengths) + offsets, owner
+
+def _keeps_orientation(verts, faces, a, b, positions):
+    # Check that triangles around each edge do not turn over when the
+    # edge is collapsed into the position
+    n = len(verts)
+    order = np.argsort(faces.ravel(), kind='stable')
+    starts = np.searchsorted(faces.ravel()[order], np.arange(n + 1))
+    bad = np.zeros(len(a), dtype=bool)
+    for end, other in [(a, b), (b, a)]:
+        index, owner = _expand(starts, end)
+        face = order[index] // 3
+        vs = faces[face]
+        # Triangles containing the edge itself disappear
+        keep = ~(vs == other[owner][:,np.newaxis]).any(axis=1)
+        vs, owner = vs[keep], owner[keep]
+        old = verts[vs]
+        moved = vs == end[owner][:,np.newaxis]
+        new = np.where(moved[:,:,np.newaxis], positions[owner][:,np.newaxis,:], old)
+        n0 = np.cross(old[:,1] - old[:,0], old[:,2] - old[:,0])
+        n1 = np.cross(new[:,1] - new[:,0], new[:,2] - new[:,0])
+        dot = np.einsum('ij,ij->i', n0, n1)
+        good = dot > DECIMATE_MIN_COS * np.linalg.norm(n0, axis=1) * np.linalg.norm(n1, axis=1)
+        bad[owner[~good]] = True
+    return ~bad
+
+def decimate(verts, faces, target=None, max_error=None):
+    """
+    Simplify triangle mesh by edge collapses, ordered by quadric error
+    metric (Garland & Heckbert). Each pass collapses a set of cheapest
+    edges whose neighbourhoods do not overlap, all at once, until the
+    number of faces is not larger than target, or collapses would move
+    the surface by more than max_error. Edges on the boundary of the
+    mesh and non-manifold edges are kept.
+    Return (verts, faces) pair of arrays.
+    """
+    verts = np.array(verts, dtype=np.float64)
+    faces = np.array(faces, dtype=np.int64).reshape((-1, 3))
+    if target is None and max_error is None:
+        return verts, faces
+    n = len(verts)
+    quadrics = vertex_quadrics(verts, faces)
+    for _ in range(DECIMATE_MAX_PASSES):
+        if target is not None and len(faces) <= target:
+            break
+        edges = np.sort(np.concatenate([faces[:,[0, 1]], faces[:,[1, 2]], faces[:,[2, 0]]]), axis=1)
+        keys, counts = np.unique(edges[:,0] * n + edges[:,1], return_counts=True)
+        edges = np.stack([keys // n, keys % n], axis=1)
+        locked = np.zeros(n, dtype=bool)
+        locked[edges[counts != 2].ravel()] = True
+        a, b = edges[:,0], edges[:,1]
+        candidate = ~locked[a] & ~locked[b]
+        a, b = a[candidate], b[candidate]
+        if not len(a):
+            break
+        quadric = quadrics[a] + quadrics[b]
+        positions, errors = collapse_positions(quadric, verts[a], verts[b])
+        if max_error is not None:
+            ok = errors <= max_error ** 2
+            a, b, quadric, positions, errors = a[ok], b[ok], quadric[ok], positions[ok], errors[ok]
+        if not len(a):
+            break
+        def check(index):
+            return _link_condition(n, edges, a[index], b[index]) & \
+                    _keeps_orientation(verts, faces, a[index], b[index], positions[index])
+        selected = np.flatnonzero(_independent_edges(n, faces, a, b, errors, check))
+        if target is not None:
+            # Each collapse removes two triangles
+            limit = max((len(faces) - target + 1) // 2, 1)
+            selected = selected[np.argsort(errors[selected], kind='stable')[:limit]]
+        if not len(selected):
+            break
+        a, b = a[selected], b[selected]
+        verts[a] = positions[selected]
+        quadrics[a] = quadric[selected]
+        remap = np.arange(n)
+        remap[b] = a
+        faces = remap[faces]
+        good = (faces[:,0] != faces[:,1]) & (faces[:,1] != faces[:,2]) & (faces[:,2] != faces[:,0])
+        faces = faces[good]
+    used = np.zeros(n, dtype=bool)
+    used[faces] = True
+    return verts[used], (np.cumsum(used) - 1)[faces]
@@ -0,0 +1,371 @@
+import atexit
+import multiprocessing
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from sverchok.utils.logging import debug, exception
+
+WORKERS = multiprocessing.cpu_count()
+# Smaller point sets are evaluated in the calling process, as passing
+# them to workers costs more than evaluation itself
+MIN_POINTS = 16 * 1024
+# Number of sets of SDF trees kept alive; each SdfProcessPool serves one set
+MAX_POOLS = 4
+
+def _fork_context():
+    # Workers are forked, so that they get the trees they are started
+    # with without pickling; where processes can not be forked, SDF trees
+    # are evaluated in threads
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+FORK = _fork_context()
+
+# SDF trees evaluated by this worker process, given when it was started
+_worker_nodes = None
+# Trees received by this worker later, by (segment name, size) of their pickle
+_worker_trees = OrderedDict()
+
+def in_worker():
+    """
+    Whether the code runs in a worker process of SdfProcessPool. Nodes which
+    can use the pool themselves evaluate in-process there.
+    """
+    return _worker_nodes is not None
+
+def _init_worker(nodes):
+    global _worker_nodes
+    _worker_nodes = nodes
+
+def _get_nodes(trees):
+    # Trees of a job: the initial ones, or ones pickled into shared memory
+    if trees is None:
+        return _worker_nodes
+    nodes = _worker_trees.get(trees)
+    if nodes is None:
+        name, size = trees
+        memory = shared_memory.SharedMemory(name=name)
+        try:
+            data = bytes(memory.buf[:size])
+        finally:
+            memory.close()
+        nodes = _worker_trees[trees] = pickle.loads(data)
+        while len(_worker_trees) > MAX_POOLS:
+            _worker_trees.popitem(last=False)
+    else:
+        _worker_trees.move_to_end(trees)
+    return nodes
+
+def _evaluate_range(job):
+    trees, points_name, result_name, n, dim, dtype, start, end = job
+    node = _get_nodes(trees)[0]
+    points_memory = shared_memory.SharedMemory(name=points_name)
+    result_memory = shared_memory.SharedMemory(name=result_name)
+    try:
+        points = np.ndarray((n, dim), dtype=dtype, buffer=points_memory.buf)
+        result = np.ndarray(n, dtype=dtype, buffer=result_memory.buf)
+        node.kernel(dtype)(points[start:end], out=result[start:end])
+        # Views must be released before shared memory is closed
+        del points, result
+    finally:
+        points_memory.close()
+        result_memory.close()
+
+# Results larger than this are passed from workers through shared memory
+# instead of being pickled
+MIN_SHARED_BYTES = 64 * 1024
+# Number of result segments of each worker; a worker writes results into
+# them in turn, and reuses a segment once the caller has copied from it
+RING_SIZE = 4
+# Segments of the ring start with a flag, which is set by the worker when
+# it writes a result, and cleared by the caller when it is copied
+RING_HEADER = 64
+
+# Result segments of this worker process
+_ring = [None] * RING_SIZE
+_ring_next = 0
+
+def _share_array(array):
+    # One-off segment, which is removed by the caller once copied
+    memory = shared_memory.SharedMemory(create=True, size=array.nbytes)
+    try:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+    finally:
+        memory.close()
+    return ('once', memory.name, array.shape, array.dtype.str)
+
+def _send_array(array):
+    global _ring_next
+    array = np.ascontiguousarray(array)
+    if array.nbytes < MIN_SHARED_BYTES:
+        return array
+    for attempt in range(RING_SIZE):
+        i = (_ring_next + attempt) % RING_SIZE
+        memory = _ring[i]
+        if memory is not None and memory.buf[0]:
+            # Not copied by the caller yet
+            continue
+        if memory is None or memory.size < RING_HEADER + array.nbytes:
+            # The segment is grown by creating a new one; the caller
+            # drops the old one when it sees the new name for the slot
+            size = RING_HEADER + max(array.nbytes, 2 * (memory.size - RING_HEADER) if memory is not None else 0)
+            if memory is not None:
+                memory.close()
+                memory.unlink()
+            memory = _ring[i] = shared_memory.SharedMemory(create=True, size=size)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf, offset=RING_HEADER)[...] = array
+        memory.buf[0] = 1
+        _ring_next = (i + 1) % RING_SIZE
+        return ('ring', (os.getpid(), i), memory.name, array.shape, array.dtype.str)
+    # All segments of the ring wait to be copied
+    return _share_array(array)
+
+def _call(job):
+    func, trees, index, args = job
+    result = func(_get_nodes(trees)[index], *args)
+    if result is None:
+        return None
+    return _send_array(result)
+
+class SdfWorkers(object):
+    """
+    Pool of forked SDF worker processes, shared by SdfProcessPool
+    instances which evaluate different trees, and attached result segments
+    of the workers' rings. Processes are stopped when the last instance
+    using them is closed.
+    """
+    def __init__(self, nodes, workers):
+        if FORK is None:
+            raise RuntimeError("SDF worker processes can not be forked on this platform")
+        self.workers = workers
+        # Workers must share the tracker of shared memory segments with
+        # this process; otherwise each one would consider segments it
+        # attached to as leaked, and remove them on exit
+        resource_tracker.ensure_running()
+        self.pool = FORK.Pool(workers, initializer=_init_worker, initargs=(nodes,))
+        self.users = 1
+        self.ring = dict()
+        self.lock = threading.Lock()
+
+    def receive(self, result):
+        if result is None or isinstance(result, np.ndarray):
+            return result
+        if result[0] == 'once':
+            _, name, shape, dtype = result
+            memory = shared_memory.SharedMemory(name=name)
+            try:
+                array = np.ndarray(shape, dtype=dtype, buffer=memory.buf).copy()
+            finally:
+                memory.close()
+                memory.unlink()
+            return array
+        _, slot, name, shape, dtype = result
+        with self.lock:
+            memory = self.ring.get(slot)
+            if memory is None or memory.name != name:
+                if memory is not None:
+                    memory.close()
+                memory = self.ring[slot] = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=RING_HEADER).copy()
+        memory.buf[0] = 0
+        return array
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            self.pool.terminate()
+            self.pool.join()
+            # Segments of the workers' rings outlive their processes
+            for memory in self.ring.values():
+                memory.close()
+                try:
+                    memory.unlink()
+                except FileNotFoundError:
+                    pass
+            self.ring.clear()
+
+class SdfProcessPool(object):
+    """
+    Pool of worker processes evaluating SDF trees, for trees whose
+    evaluation holds the GIL (Python callbacks, easing functions, generic
+    fields). Trees (one tree, or a list of them) are passed to workers
+    once: when the pool starts (without pickling, as processes are
+    forked), or, if workers of another pool are given (`shared`), pickled
+    into a shared memory segment which the workers read when they get
+    the first job for these trees. Points are passed through shared
+    memory; only their names and index ranges are sent per call. Results
+    are written into a ring of segments of each worker, which are reused
+    between calls. Evaluation of points uses the first tree.
+    """
+    def __init__(self, nodes, workers=WORKERS, shared=None):
+        if isinstance(nodes, (list, tuple)):
+            nodes = list(nodes)
+        else:
+            nodes = [nodes]
+        self.nodes = nodes
+        self.node = nodes[0]
+        self.dim = self.node.dim
+        self.workers = workers
+        if shared is None:
+            self.trees = None
+            self.memory = None
+            self.processes = SdfWorkers(nodes, workers)
+        else:
+            # Raises if trees can not be pickled
+            data = pickle.dumps(nodes)
+            self.memory = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+            self.memory.buf[:len(data)] = data
+            self.trees = (self.memory.name, len(data))
+            self.processes = shared.processes
+            with self.processes.lock:
+                self.processes.users += 1
+
+    @property
+    def pool(self):
+        return self.processes.pool
+
+    def close(self):
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+        self.processes.release()
+
+    def evaluate_chunked(self, coords, dtype=np.float64, chunk_size=None):
+        """
+        Evaluate SDF at points given by separate coordinate arrays
+        (xs, ys[, zs]), splitting them into ranges of at most chunk_size
+        points between workers.
+        """
+        dtype = np.dtype(dtype)
+        shape = np.shape(coords[0])
+        n = int(np.prod(shape))
+        step = -(-n // self.workers)
+        if chunk_size is not None:
+            step = min(step, chunk_size)
+        step = max(step, 1)
+        size = max(n * dtype.itemsize, 1)
+        points_memory = shared_memory.SharedMemory(create=True, size=size * self.dim)
+        result_memory = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            points = np.ndarray((n, self.dim), dtype=dtype, buffer=points_memory.buf)
+            for j, cs in enumerate(coords):
+                points[:,j] = np.ravel(cs)
+            del points
+            jobs = [(self.trees, points_memory.name, result_memory.name, n, self.dim, dtype.str, start, min(start + step, n))
+                        for start in range(0, n, step)]
+            self.pool.map(_evaluate_range, jobs)
+            result = np.ndarray(n, dtype=dtype, buffer=result_memory.buf).copy()
+        finally:
+            points_memory.close()
+            points_memory.unlink()
+            result_memory.close()
+            result_memory.unlink()
+        return result.reshape(shape)
+
+    def imap(self, func, jobs, chunksize=1):
+        """
+        Call func(nodes[index], *args) in workers for each (index, args)
+        pair in jobs, where func is a module-level function returning an
+        array or None.
+        Large arrays are passed back through the ring segments of the
+        worker, or, if all of them still wait to be copied, through a
+        segment which is removed once copied. Yield results in the order
+        of jobs.
+        """
+        results = self.pool.imap(_call, [(func, self.trees, index, args) for index, args in jobs], chunksize)
+        try:
+            for result in results:
+                yield self.processes.receive(result)
+        finally:
+            # Drain results which were not consumed (after an error), so
+            # that their segments are released as well
+            while True:
+                try:
+                    self.processes.receive(next(results))
+                except StopIteration:
+                    break
+                except Exception:
+                    pass
+
+    def __call__(self, points, out=None, dtype=np.float64):
+        result = self.evaluate_chunked(np.asarray(points).T, dtype)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+_pools = OrderedDict()
+_pools_lock = threading.Lock()
+
+def _trees_key(nodes):
+    # Trees are identified by their structure where possible, since they
+    # are rebuilt by every update of the node tree
+    hashes = tuple(node.structural_hash() for node in nodes)
+    if all(h is not None for h in hashes):
+        return ('hash', hashes)
+    return ('id', tuple(id(node) for node in nodes))
+
+def get_process_pool(nodes, workers=WORKERS):
+    """
+    Return process pool evaluating the SDF tree (or the list of trees);
+    pools are reused while the same trees (or trees of the same structure)
+    are evaluated, and least recently used ones are closed. New trees
+    are sent to the running worker processes; new processes are started
+    only if there are none with this number of workers.
+    Return None if the trees should be evaluated in threads: where
+    processes can not be forked, or if the trees can not be pickled
+    for the running workers (trees with Python callbacks are rebuilt by
+    every update, and forking new workers for each version of them
+    would cost more than evaluation itself).
+    """
+    if in_worker() or FORK is None:
+        return None
+    if not isinstance(nodes, (list, tuple)):
+        nodes = [nodes]
+    trees_key = _trees_key(nodes)
+    key = (trees_key, workers)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None and (trees_key[0] == 'hash' or all(a is b for a, b in zip(pool.nodes, nodes))):
+            _pools.move_to_end(key)
+            return pool
+        pool = None
+        shared = next((other for other in reversed(_pools.values()) if other.workers == workers), None)
+        if shared is not None:
+            try:
+                pool = SdfProcessPool(nodes, workers, shared=shared)
+            except Exception as e:
+                debug("SDF trees can not be sent to running workers, evaluating in threads: %s", e)
+                return None
+        else:
+            try:
+                pool = SdfProcessPool(nodes, workers)
+            except Exception as e:
+                exception("Can't start SDF worker processes: %s", e)
+                return None
+            debug("Started %s SDF worker processes", workers)
+        old = _pools.pop(key, None)
+        if old is not None:
+            old.close()
+        _pools[key] = pool
+        while len(_pools) > MAX_POOLS:
+            _, old = _pools.popitem(last=False)
+            old.close()
+        return pool
+
+def shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+atexit.register(shutdown_pools)
@@ -0,0 +1,2951 @@
+
+import hashlib
+import itertools
+import numbers
+import threading
+import types
+import weakref
+from collections import defaultdict
+
+import numpy as np
+
+from sverchok_extra.dependencies import sdf, numba, scipy
+from sverchok_extra.utils.sdf_jit import compile_jit
+from sverchok_extra.utils.sdf_pool import get_process_pool, MIN_POINTS
+if sdf is not None:
+    from sdf import mesh, ease
+if scipy is not None:
+    from scipy.spatial import cKDTree
+
+__all__ = [
+    'CHUNK_SIZE', 'ORIGIN', 'X', 'Y', 'Z', 'UP',
+    'SdfCompiler', 'SdfKernel', 'SdfNode', 'SdfOpaque', 'SdfFieldLeaf',
+    'SdfSphere', 'SdfCircle', 'SdfPlane', 'SdfSlab', 'SdfBox', 'SdfRoundedBox',
+    'SdfTorus', 'SdfCapsule', 'SdfCappedCylinder', 'SdfRoundedCylinder',
+    'SdfPointTransform', 'SdfTranslate', 'SdfScale', 'SdfRotate', 'SdfTwist',
+    'SdfBendLinear', 'SdfDilate', 'SdfShell',
+    'SdfBinary', 'SdfUnion', 'SdfIntersection', 'SdfDifference',
+    'SdfNaryIntersection', 'SdfBlend', 'SdfTransitionLinear', 'SdfTransitionRadial',
+    'SdfSlice', 'SdfExtrude', 'SdfExtrudeTo', 'SdfRevolve',
+    'SdfBvh', 'SdfCulledUnion', 'SdfSegments', 'SdfInstances', 'SdfBeamLattice',
+    'subdivide_boxes', 'interval_bounds', 'tree_bounds', 'deduplicate', 'changed_region',
+]
+
+# Default number of points evaluated at once by SdfKernel.evaluate_chunked
+CHUNK_SIZE = 256 * 1024
+
+ORIGIN = np.array((0, 0, 0))
+X = np.array((1, 0, 0))
+Y = np.array((0, 1, 0))
+Z = np.array((0, 0, 1))
+UP = Z
+
+def _normalize(v):
+    return v / np.linalg.norm(v)
+
+def _length(v, out):
+    np.einsum('ij,ij->i', v, v, out=out)
+    return np.sqrt(out, out=out)
+
+def _perpendicular(v):
+    if v[1] == 0 and v[2] == 0:
+        if v[0] == 0:
+            raise ValueError("Zero vector")
+        return np.cross(v, [0, 1, 0])
+    return np.cross(v, [1, 0, 0])
+
+def _easing(e):
+    # Linear easing is an identity, there is no need to call it
+    if e is None or (sdf is not None and e is ease.linear):
+        return None
+    return e
+
+def _rotation_matrix(angle, vector):
+    x, y, z = _normalize(np.asarray(vector, dtype=np.float64))
+    s = np.sin(angle)
+    c = np.cos(angle)
+    m = 1 - c
+    return np.array([
+        [m*x*x + c, m*x*y + z*s, m*z*x - y*s],
+        [m*x*y - z*s, m*y*y + c, m*y*z + x*s],
+        [m*z*x + y*s, m*y*z - x*s, m*z*z + c],
+    ]).T
+
+# Bounding boxes are pairs of arrays (min corner, max corner);
+# None stands for a box which is unknown or infinite.
+
+def _box_union(boxes):
+    if any(box is None for box in boxes):
+        return None
+    return (np.min([box[0] for box in boxes], axis=0),
+            np.max([box[1] for box in boxes], axis=0))
+
+def _box_intersection(boxes):
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return (np.max([box[0] for box in boxes], axis=0),
+            np.min([box[1] for box in boxes], axis=0))
+
+def _box_expand(box, r):
+    if box is None:
+        return None
+    return (box[0] - r, box[1] + r)
+
+def _box_corners(box):
+    return np.array(list(itertools.product(*zip(*box))))
+
+def _box_distance(q0, q1, lo, hi):
+    # Distances from boxes (q0, q1) to the box (lo, hi); zero if they intersect
+    q = np.maximum(lo - q1, q0 - hi)
+    np.maximum(q, 0, out=q)
+    return np.sqrt(np.einsum('ij,ij->i', q, q))
+
+def _box_farthest(q0, q1, lo, hi):
+    # Largest distances between points of boxes (q0, q1) and the box (lo, hi)
+    q = np.maximum(np.abs(q1 - lo), np.abs(q0 - hi))
+    return np.sqrt(np.einsum('ij,ij->i', q, q))
+
+# Intervals of SDF values over boxes are pairs of arrays (lower bounds,
+# upper bounds); boxes are given by arrays of their min and max corners.
+
+def _infinite(n):
+    return (np.full(n, -np.inf), np.full(n, np.inf))
+
+def _interval_abs(lo, hi):
+    inside = (lo <= 0) & (hi >= 0)
+    return (np.where(inside, 0, np.minimum(np.abs(lo), np.abs(hi))),
+            np.maximum(np.abs(lo), np.abs(hi)))
+
+def _interval_dot(lo, hi, v):
+    # Range of dot(p, v) over boxes
+    a = lo * v
+    b = hi * v
+    return (np.minimum(a, b).sum(axis=1), np.maximum(a, b).sum(axis=1))
+
+def _interval_extrusion(dlo, dhi, lo, hi, h):
+    # Extrusion distance is monotonic in both 2D distance and |z| - h/2
+    zlo, zhi = _interval_abs(lo[:,2], hi[:,2])
+    def extrusion(d, w):
+        return np.minimum(np.maximum(d, w), 0) + np.hypot(np.maximum(d, 0), np.maximum(w, 0))
+    return (extrusion(dlo, zlo - h / 2), extrusion(dhi, zhi - h / 2))
+
+def _lse_temperature(k):
+    # Temperature of log-sum-exp smooth maximum or minimum, such that for
+    # two equal values it differs from them by k/4, as the polynomial one
+    return (k or 0) / (4 * np.log(2))
+
+def _smooth_min(d1, d2, k):
+    h = np.clip(0.5 + 0.5 * (d2 - d1) / k, 0, 1)
+    return d2 + (d1 - d2) * h - k * h * (1 - h)
+
+# Helpers of gradient evaluation. Gradients are (n, dim) arrays; at points
+# where SDF is not differentiable, one of one-sided gradients is returned.
+
+def _nonzero(v):
+    # Safe divisor for normalization of zero-length vectors
+    return np.where(v > 0, v, 1)
+
+def _sign(v):
+    return np.where(v < 0, -1.0, 1.0)
+
+def _ramp(t, e=None):
+    # t clipped to [0, 1] and eased, and its derivative by t
+    inside = (t > 0) & (t < 1)
+    t = np.clip(t, 0, 1)
+    if e is None:
+        return t, inside.astype(np.float64)
+    h = SdfNode.GRADIENT_STEP
+    return e(t), (e(t + h) - e(t - h)) / (2 * h) * inside
+
+def _box_gradient(q):
+    # Distance to a box and its gradient by q, given coordinates of points
+    # relative to faces of the box (|p - center| - half size)
+    outside = np.maximum(q, 0)
+    length = np.linalg.norm(outside, axis=1)
+    d = length + np.minimum(q.max(axis=1), 0)
+    g = outside / _nonzero(length)[:,np.newaxis]
+    inside = np.flatnonzero(length == 0)
+    g[inside, np.argmax(q[inside], axis=1)] = 1
+    return d, g
+
+def _min_gradient(d1, g1, d2, g2, k):
+    # Minimum (smooth one if k is set) of two SDFs with gradients;
+    # derivatives of the smooth minimum by d1 and d2 are h and 1 - h
+    if not k:
+        first = d1 <= d2
+        return np.where(first, d1, d2), np.where(first[:,np.newaxis], g1, g2)
+    h = np.clip(0.5 + 0.5 * (d2 - d1) / k, 0, 1)
+    d = d2 + (d1 - d2) * h - k * h * (1 - h)
+    h = h[:,np.newaxis]
+    return d, g1 * h + g2 * (1 - h)
+
+def _extrusion_gradient(p, d, g, h):
+    # Combine 2D distance d (with gradient g by 3D points) with distance along Z axis
+    e, de = _box_gradient(np.stack([d, np.abs(p[:,2]) - h / 2], axis=1))
+    g = g * de[:,:1]
+    g[:,2] += de[:,1] * _sign(p[:,2])
+    return e, g
+
+def _hash_value(value, h):
+    # Feed the value into hashlib object h; return False if the value
+    # can not be identified in a way which is stable between sessions
+    if isinstance(value, SdfNode):
+        child = value.structural_hash()
+        if child is None:
+            return False
+        h.update(child.encode())
+    elif isinstance(value, (list, tuple)):
+        h.update(b'(%d' % len(value))
+        return all(_hash_value(item, h) for item in value)
+    elif isinstance(value, np.ndarray):
+        h.update(str((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif value is None or isinstance(value, (bool, str)):
+        h.update(repr(value).encode())
+    elif isinstance(value, numbers.Real):
+        h.update(repr(float(value)).encode())
+    elif isinstance(value, types.FunctionType) and value.__closure__ is None \
+            and '<' not in value.__qualname__:
+        # Module-level functions, like easing functions, are identified by name
+        h.update(f"{value.__module__}.{value.__qualname__}".encode())
+    else:
+        return False
+    return True
+
+def _copy_step(d, r):
+    r[...] = d
+
+class SdfCompiler(object):
+    """
+    Translates an SDF tree into a flat list of steps. Each step operates
+    in-place on a fixed set of registers (scratch buffers); registers are
+    recycled as soon as the value they hold is not needed anymore, so
+    the number of buffers depends on the tree shape, not on its size.
+    Register 0 always holds the input points.
+    If jit is True, the largest subtrees that can be translated to Numba
+    code are compiled into single parallel steps.
+    Subtrees which are shared by several parents (the same node object)
+    are evaluated once for the same points; the result is kept in a
+    register until the last consumer, and others get copies of it.
+    """
+    def __init__(self, dim, dtype=np.float64, jit=False):
+        self.dtype = np.dtype(dtype)
+        self.jit = jit
+        self.widths = [dim]
+        self.free = defaultdict(list)
+        self.steps = []
+        self.uses = defaultdict(int)
+        # (node id, points register) -> [result register, remaining uses]
+        self.memo = dict()
+
+    def count_uses(self, root):
+        """
+        Count references to each node of the tree from its parents.
+        """
+        seen = {id(root)}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for child in node.children():
+                self.uses[id(child)] += 1
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+
+    def _compile(self, node, p):
+        if self.jit and node.jittable():
+            d = compile_jit(node, self, p)
+            if d is not None:
+                return d
+        return node.compile(self, p)
+
+    def compile(self, node, p):
+        if self.uses[id(node)] < 2:
+            return self._compile(node, p)
+        key = (id(node), p)
+        entry = self.memo.get(key)
+        if entry is None:
+            entry = self.memo[key] = [self._compile(node, p), self.uses[id(node)]]
+        entry[1] -= 1
+        if entry[1] == 0:
+            # The last consumer takes the register itself
+            del self.memo[key]
+            return entry[0]
+        d = self.alloc()
+        self.emit(_copy_step, entry[0], d)
+        return d
+
+    def alloc(self, width=1):
+        free = self.free[width]
+        if free:
+            return free.pop()
+        self.widths.append(width)
+        return len(self.widths) - 1
+
+    def release(self, *regs):
+        for reg in regs:
+            if reg != 0:
+                self.free[self.widths[reg]].append(reg)
+                # Values memoized for points in this register become stale
+                for key in [key for key in self.memo if key[1] == reg]:
+                    self.release(self.memo.pop(key)[0])
+
+    def const(self, value):
+        return np.asarray(value, dtype=self.dtype)
+
+    def emit(self, step, *regs):
+        self.steps.append((step, regs))
+
+class SdfKernel(object):
+    """
+    Fused evaluation kernel for an SDF tree. Scratch buffers are allocated
+    once per thread and reused between calls, as long as the number of
+    points does not grow.
+    """
+    def __init__(self, node, dtype=np.float64, jit=None):
+        if jit is None:
+            jit = numba is not None
+        self.dim = node.dim
+        self.dtype = np.dtype(dtype)
+        compiler = SdfCompiler(node.dim, self.dtype, jit)
+        compiler.count_uses(node)
+        self.result = compiler.compile(node, 0)
+        self.steps = compiler.steps
+        self.widths = compiler.widths
+        self._local = threading.local()
+
+    def _registers(self, points):
+        n = len(points)
+        capacity = getattr(self._local, 'capacity', -1)
+        if n > capacity:
+            self._local.buffers = [np.empty((n, w) if w > 1 else n, dtype=self.dtype) for w in self.widths[1:]]
+            self._local.capacity = n
+        return [points] + [buffer[:n] for buffer in self._local.buffers]
+
+    def __call__(self, points, out=None):
+        points = np.ascontiguousarray(points, dtype=self.dtype).reshape((-1, self.dim))
+        regs = self._registers(points)
+        for step, args in self.steps:
+            step(*[regs[i] for i in args])
+        result = regs[self.result]
+        if out is None:
+            return result.copy()
+        out[...] = result
+        return out
+
+    def evaluate_chunked(self, coords, chunk_size=CHUNK_SIZE):
+        """
+        Evaluate the kernel at points given by separate coordinate arrays
+        (xs, ys[, zs]). Points are copied into one contiguous buffer chunk
+        by chunk, so memory used does not depend on the number of points,
+        except for the result array.
+        """
+        shape = np.shape(coords[0])
+        coords = [np.ravel(cs) for cs in coords]
+        n = len(coords[0])
+        result = np.empty(n, dtype=self.dtype)
+        buffer = np.empty((min(n, chunk_size), self.dim), dtype=self.dtype)
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            points = buffer[:end - start]
+            for j, cs in enumerate(coords):
+                points[:,j] = cs[start:end]
+            self(points, out=result[start:end])
+        return result.reshape(shape)
+
+class SdfNode(object):
+    """
+    Base class for nodes of SDF expression tree. Each node knows how to
+    compile itself into steps of SdfKernel. The interface of fogleman's
+    SDF3 / SDF2 objects is mimicked, so instances can be passed to
+    functions of `sdf` library directly.
+    """
+    dim = 3
+    # Whether the node itself can be translated into Numba code
+    jit = False
+    # Whether the node is an exact distance field, so that its value
+    # changes not faster than the distance between points
+    exact = False
+
+    def children(self):
+        return []
+
+    def compile(self, c, p):
+        """
+        Emit steps which calculate SDF values for points stored in register p.
+        Return the register with results; the caller owns that register.
+        The register p must not be modified.
+        """
+        raise NotImplementedError
+
+    def jittable(self):
+        return self.jit and all(child.jittable() for child in self.children())
+
+    def jit_source(self, g, p):
+        """
+        Emit lines of Numba code, which calculate SDF value for the point
+        with coordinates stored in variables p. Return name of the variable
+        with the result.
+        """
+        raise NotImplementedError
+
+    def bounds(self):
+        """
+        Return conservative axis-aligned bounding box of the surface, as
+        (min corner, max corner) pair of arrays; None if it is unknown
+        or infinite. Children are assumed to be exact distance fields.
+        """
+        return None
+
+    def interval(self, lo, hi):
+        """
+        Return conservative lower and upper bounds of SDF values over boxes
+        (lo[i], hi[i]), as a pair of arrays. The bounds are infinite for
+        nodes which can not estimate their values.
+        """
+        if not self.exact:
+            return _infinite(len(lo))
+        center = (lo + hi) / 2
+        r = np.linalg.norm(hi - lo, axis=1) / 2
+        d = self.f(center)
+        return (d - r, d + r)
+
+    # Step of central differences, used by nodes which do not know
+    # derivatives of their values
+    GRADIENT_STEP = 1e-6
+
+    def evaluate_with_gradient(self, points):
+        """
+        Return SDF values and gradients at points, as arrays of shapes (n,)
+        and (n, dim), calculated in one pass through the tree. Nodes
+        without analytic derivatives (opaque leaves) fall back to central
+        differences of their own values, so other nodes of the tree are
+        not evaluated again.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        n, dim = points.shape
+        offsets = np.eye(dim) * SdfNode.GRADIENT_STEP
+        shifted = np.concatenate([points] + [points + v for v in offsets] + [points - v for v in offsets])
+        values = self.f(shifted).reshape((2 * dim + 1, n))
+        g = (values[1:dim+1] - values[dim+1:]).T / (2 * SdfNode.GRADIENT_STEP)
+        return values[0], g
+
+    # Attributes which are derived from others, and do not identify the node
+    hash_exclude = ()
+
+    def structural_hash(self):
+        """
+        Return hash of the tree: types of nodes, their parameters and
+        hashes of children, as a hex string; it is stable between sessions.
+        Return None if the tree contains leaves which can not be
+        identified (opaque functions, generic fields).
+        """
+        if '_hash' not in self.__dict__:
+            h = hashlib.sha1(type(self).__name__.encode())
+            for name, value in sorted(self.__dict__.items()):
+                if name.startswith('_') or name in self.hash_exclude:
+                    continue
+                h.update(name.encode())
+                if not _hash_value(value, h):
+                    h = None
+                    break
+            self.__dict__['_hash'] = h.hexdigest() if h is not None else None
+        return self.__dict__['_hash']
+
+    def __getstate__(self):
+        # Compiled kernels are rebuilt on demand after unpickling
+        state = self.__dict__.copy()
+        state.pop('_kernels', None)
+        return state
+
+    def kernel(self, dtype=np.float64):
+        dtype = np.dtype(dtype)
+        kernels = self.__dict__.setdefault('_kernels', dict())
+        kernel = kernels.get(dtype)
+        if kernel is None:
+            kernel = kernels[dtype] = SdfKernel(self, dtype)
+        return kernel
+
+    def f(self, points):
+        return self.kernel()(points)
+
+    def __call__(self, points):
+        return self.f(points).reshape((-1, 1))
+
+    def translate(self, offset):
+        return SdfTranslate(self, offset)
+
+    def scale(self, factor):
+        return SdfScale(self, factor)
+
+    def rotate(self, angle, vector=Z):
+        return SdfRotate(self, angle, vector)
+
+    def orient(self, axis):
+        a = UP.astype(np.float64)
+        b = _normalize(np.asarray(axis, dtype=np.float64))
+        dot = np.dot(b, a)
+        if dot == 1:
+            return self
+        if dot == -1:
+            return SdfRotate(self, np.pi, _perpendicular(a))
+        angle = np.arccos(dot)
+        v = _normalize(np.cross(b, a))
+        return SdfRotate(self, angle, v)
+
+    def twist(self, k):
+        return SdfTwist(self, k)
+
+    def bend_linear(self, p0, p1, v, e=None):
+        return SdfBendLinear(self, p0, p1, v, e)
+
+    def dilate(self, r):
+        return SdfDilate(self, r)
+
+    def erode(self, r):
+        return SdfDilate(self, -r)
+
+    def shell(self, thickness):
+        return SdfShell(self, thickness)
+
+    def union(self, *others, k=None):
+        result = self
+        for other in others:
+            result = SdfUnion(result, other, k)
+        return result
+
+    def intersection(self, *others, k=None):
+        result = self
+        for other in others:
+            result = SdfIntersection(result, other, k)
+        return result
+
+    def difference(self, *others, k=None):
+        result = self
+        for other in others:
+            result = SdfDifference(result, other, k)
+        return result
+
+    def blend(self, *others, k=0.5):
+        result = self
+        for other in others:
+            result = SdfBlend(result, other, k)
+        return result
+
+    def slice(self):
+        return SdfSlice(self)
+
+    def extrude(self, h):
+        return SdfExtrude(self, h)
+
+    def revolve(self, offset=0):
+        return SdfRevolve(self, offset)
+
+    def generate(self, *args, **kwargs):
+        return mesh.generate(self, *args, **kwargs)
+
+## Leaves
+
+class SdfOpaque(SdfNode):
+    """
+    Leaf wrapping an arbitrary SDF function (for example, fogleman's SDF3
+    object), which can not be looked into. If the caller knows a bounding
+    box of its surface, it can be given as (min corner, max corner).
+    """
+    def __init__(self, sdf, dim=3, box=None):
+        self.sdf = sdf
+        self.dim = dim
+        if box is not None:
+            box = (np.asarray(box[0], dtype=np.float64), np.asarray(box[1], dtype=np.float64))
+        self.box = box
+
+    def structural_hash(self):
+        return None
+
+    def bounds(self):
+        return self.box
+
+    def compile(self, c, p):
+        function = getattr(self.sdf, 'f', self.sdf)
+        d = c.alloc()
+        def step(p, d):
+            d[...] = np.reshape(function(p), -1)
+        c.emit(step, p, d)
+        return d
+
+class SdfFieldLeaf(SdfNode):
+    """
+    Leaf wrapping a generic Sverchok scalar field.
+    If processes is nonzero, large point sets are evaluated by a pool
+    of that many worker processes.
+    """
+    def __init__(self, field, iso_value=0, dim=3, processes=0):
+        self.field = field
+        self.iso_value = iso_value
+        self.dim = dim
+        self.processes = processes
+
+    def structural_hash(self):
+        return None
+
+    def compile(self, c, p):
+        field = self.field
+        iso_value = self.iso_value
+        processes = self.processes
+        dtype = c.dtype
+        d = c.alloc()
+        if self.dim == 3:
+            def evaluate(p, d):
+                d[...] = field.evaluate_grid(p[:,0], p[:,1], p[:,2])
+                d -= iso_value
+        else:
+            def evaluate(p, d):
+                d[...] = field.evaluate_grid(p[:,0], p[:,1], np.zeros(len(p)))
+                d -= iso_value
+        def step(p, d):
+            pool = None
+            if processes and len(p) >= MIN_POINTS:
+                pool = get_process_pool(self, processes)
+            if pool is not None:
+                pool(p, out=d, dtype=dtype)
+            else:
+                evaluate(p, d)
+        c.emit(step, p, d)
+        return d
+
+    def evaluate_with_gradient(self, points):
+        xs, ys = points[:,0], points[:,1]
+        zs = points[:,2] if self.dim == 3 else np.zeros(len(points))
+        d = self.field.evaluate_grid(xs, ys, zs) - self.iso_value
+        g = np.stack(self.field.gradient_grid(xs, ys, zs), axis=1)
+        return d, g[:,:self.dim]
+
+## Primitives
+
+class SdfSphere(SdfNode):
+    jit = True
+
+    def __init__(self, radius=1, center=ORIGIN):
+        self.radius = radius
+        self.center = np.asarray(center, dtype=np.float64)
+
+    def compile(self, c, p):
+        center = c.const(self.center)
+        radius = self.radius
+        q = c.alloc(self.dim)
+        d = c.alloc()
+        def step(p, q, d):
+            np.subtract(p, center, out=q)
+            _length(q, d)
+            d -= radius
+        c.emit(step, p, q, d)
+        c.release(q)
+        return d
+
+    def bounds(self):
+        return (self.center - self.radius, self.center + self.radius)
+
+    def interval(self, lo, hi):
+        center = self.center
+        return (_box_distance(lo, hi, center, center) - self.radius,
+                _box_farthest(lo, hi, center, center) - self.radius)
+
+    def evaluate_with_gradient(self, points):
+        q = points - self.center
+        r = np.linalg.norm(q, axis=1)
+        return r - self.radius, q / _nonzero(r)[:,np.newaxis]
+
+    def jit_source(self, g, p):
+        qs = [g.assign(f"{x} - {g.param(v)}") for x, v in zip(p, self.center)]
+        return g.assign(f"sqrt({g.dot(qs, qs)}) - {g.param(self.radius)}")
+
+class SdfCircle(SdfSphere):
+    dim = 2
+
+    def __init__(self, radius=1, center=ORIGIN[:2]):
+        super().__init__(radius, center)
+
+class SdfPlane(SdfNode):
+    jit = True
+
+    def __init__(self, normal=UP, point=ORIGIN):
+        self.normal = _normalize(np.asarray(normal, dtype=np.float64))
+        self.point = np.asarray(point, dtype=np.float64)
+
+    def compile(self, c, p):
+        normal = c.const(self.normal)
+        offset = np.dot(self.point, self.normal)
+        d = c.alloc()
+        def step(p, d):
+            np.dot(p, normal, out=d)
+            np.subtract(offset, d, out=d)
+        c.emit(step, p, d)
+        return d
+
+    def interval(self, lo, hi):
+        offset = np.dot(self.point, self.normal)
+        dlo, dhi = _interval_dot(lo, hi, self.normal)
+        return (offset - dhi, offset - dlo)
+
+    def evaluate_with_gradient(self, points):
+        d = np.dot(self.point, self.normal) - np.dot(points, self.normal)
+        return d, np.broadcast_to(-self.normal, points.shape).copy()
+
+    def jit_source(self, g, p):
+        offset = g.param(np.dot(self.point, self.normal))
+        return g.assign(f"{offset} - ({g.dot(p, g.params(self.normal))})")
+
+class SdfSlab(SdfNode):
+    jit = True
+
+    def __init__(self, x0=None, y0=None, z0=None, x1=None, y1=None, z1=None):
+        # Each bound is a half-space; store it as (axis, sign, value),
+        # so that distance = sign * (p[axis] - value).
+        self.planes = []
+        for axis, (v0, v1) in enumerate([(x0, x1), (y0, y1), (z0, z1)]):
+            if v0 is not None:
+                self.planes.append((axis, -1.0, v0))
+            if v1 is not None:
+                self.planes.append((axis, 1.0, v1))
+        if not self.planes:
+            raise Exception("At least one of slab bounds must be specified")
+
+    def compile(self, c, p):
+        planes = self.planes
+        d = c.alloc()
+        t = c.alloc()
+        def step(p, d, t):
+            axis, sign, value = planes[0]
+            np.subtract(p[:,axis], value, out=d)
+            d *= sign
+            for axis, sign, value in planes[1:]:
+                np.subtract(p[:,axis], value, out=t)
+                t *= sign
+                np.maximum(d, t, out=d)
+        c.emit(step, p, d, t)
+        c.release(t)
+        return d
+
+    def bounds(self):
+        if len(self.planes) < 6:
+            return None
+        lo = np.empty(3)
+        hi = np.empty(3)
+        for axis, sign, value in self.planes:
+            if sign < 0:
+                lo[axis] = value
+            else:
+                hi[axis] = value
+        return (lo, hi)
+
+    def interval(self, lo, hi):
+        intervals = []
+        for axis, sign, value in self.planes:
+            if sign > 0:
+                intervals.append((lo[:,axis] - value, hi[:,axis] - value))
+            else:
+                intervals.append((value - hi[:,axis], value - lo[:,axis]))
+        return (np.max([i[0] for i in intervals], axis=0),
+                np.max([i[1] for i in intervals], axis=0))
+
+    def evaluate_with_gradient(self, points):
+        values = np.stack([sign * (points[:,axis] - value) for axis, sign, value in self.planes], axis=1)
+        nearest = np.argmax(values, axis=1)
+        axes = np.array([axis for axis, _, _ in self.planes])
+        signs = np.array([sign for _, sign, _ in self.planes])
+        idx = np.arange(len(points))
+        g = np.zeros(points.shape)
+        g[idx, axes[nearest]] = signs[nearest]
+        return values[idx, nearest], g
+
+    def jit_source(self, g, p):
+        terms = [f"{sign} * ({p[axis]} - {g.param(value)})" for axis, sign, value in self.planes]
+        return g.assign(g.nested('max', terms))
+
+class SdfBox(SdfNode):
+    jit = True
+    exact = True
+
+    def __init__(self, size=1, center=ORIGIN):
+        self.size = np.asarray(size, dtype=np.float64)
+        self.center = np.asarray(center, dtype=np.float64)
+
+    def compile(self, c, p):
+        center = c.const(self.center)
+        half = c.const(self.size / 2)
+        q = c.alloc(3)
+        d = c.alloc()
+        t = c.alloc()
+        def step(p, q, d, t):
+            np.subtract(p, center, out=q)
+            np.abs(q, out=q)
+            q -= half
+            np.amax(q, axis=1, out=t)
+            np.minimum(t, 0, out=t)
+            np.maximum(q, 0, out=q)
+            _length(q, d)
+            d += t
+        c.emit(step, p, q, d, t)
+        c.release(q, t)
+        return d
+
+    def bounds(self):
+        return (self.center - self.size / 2, self.center + self.size / 2)
+
+    def evaluate_with_gradient(self, points):
+        q = points - self.center
+        d, g = _box_gradient(np.abs(q) - self.size / 2)
+        return d, g * _sign(q)
+
+    def jit_source(self, g, p):
+        half = np.broadcast_to(self.size / 2, (3,))
+        qs = [g.assign(f"abs({x} - {g.param(v)}) - {g.param(h)}") for x, v, h in zip(p, self.center, half)]
+        return g.box_distance(qs)
+
+class SdfRoundedBox(SdfNode):
+    jit = True
+    exact = True
+
+    def __init__(self, size, radius):
+        self.size = np.asarray(size, dtype=np.float64)
+        self.radius = radius
+
+    def compile(self, c, p):
+        shift = c.const(self.size / 2 - self.radius)
+        radius = self.radius
+        q = c.alloc(3)
+        d = c.alloc()
+        t = c.alloc()
+        def step(p, q, d, t):
+            np.abs(p, out=q)
+            q -= shift
+            np.amax(q, axis=1, out=t)
+            np.minimum(t, 0, out=t)
+            np.maximum(q, 0, out=q)
+            _length(q, d)
+            d += t
+            d -= radius
+        c.emit(step, p, q, d, t)
+        c.release(q, t)
+        return d
+
+    def bounds(self):
+        half = np.broadcast_to(self.size / 2, (3,))
+        return (-half, half)
+
+    def evaluate_with_gradient(self, points):
+        d, g = _box_gradient(np.abs(points) - (self.size / 2 - self.radius))
+        return d - self.radius, g * _sign(points)
+
+    def jit_source(self, g, p):
+        shift = np.broadcast_to(self.size / 2 - self.radius, (3,))
+        qs = [g.assign(f"abs({x}) - {g.param(v)}") for x, v in zip(p, shift)]
+        d = g.box_distance(qs)
+        return g.assign(f"{d} - {g.param(self.radius)}")
+
+class SdfTorus(SdfNode):
+    jit = True
+    exact = True
+
+    def __init__(self, r1, r2):
+        self.r1 = r1
+        self.r2 = r2
+
+    def compile(self, c, p):
+        r1, r2 = self.r1, self.r2
+        d = c.alloc()
+        t = c.alloc()
+        def step(p, d, t):
+            np.hypot(p[:,0], p[:,1], out=t)
+            t -= r1
+            np.hypot(t, p[:,2], out=d)
+            d -= r2
+        c.emit(step, p, d, t)
+        c.release(t)
+        return d
+
+    def bounds(self):
+        r = self.r1 + self.r2
+        return (np.array((-r, -r, -self.r2)), np.array((r, r, self.r2)))
+
+    def evaluate_with_gradient(self, points):
+        x, y, z = points.T
+        r = np.hypot(x, y)
+        t = r - self.r1
+        d = np.hypot(t, z)
+        s = t / _nonzero(d) / _nonzero(r)
+        return d - self.r2, np.stack([s * x, s * y, z / _nonzero(d)], axis=1)
+
+    def jit_source(self, g, p):
+        x, y, z = p
+        t = g.assign(f"hypot({x}, {y}) - {g.param(self.r1)}")
+        return g.assign(f"hypot({t}, {z}) - {g.param(self.r2)}")
+
+class SdfCapsule(SdfNode):
+    jit = True
+    exact = True
+
+    def __init__(self, a, b, radius):
+        self.a = np.asarray(a, dtype=np.float64)
+        self.b = np.asarray(b, dtype=np.float64)
+        self.radius = radius
+
+    def compile(self, c, p):
+        a = c.const(self.a)
+        ba = c.const(self.b - self.a)
+        inv_baba = 1.0 / np.dot(self.b - self.a, self.b - self.a)
+        radius = self.radius
+        q = c.alloc(3)
+        r = c.alloc(3)
+        d = c.alloc()
+        def step(p, q, r, d):
+            np.subtract(p, a, out=q)
+            np.dot(q, ba, out=d)
+            d *= inv_baba
+            np.clip(d, 0, 1, out=d)
+            np.multiply(d[:,np.newaxis], ba, out=r)
+            q -= r
+            _length(q, d)
+            d -= radius
+        c.emit(step, p, q, r, d)
+        c.release(q, r)
+        return d
+
+    def bounds(self):
+        return (np.minimum(self.a, self.b) - self.radius,
+                np.maximum(self.a, self.b) + self.radius)
+
+    def evaluate_with_gradient(self, points):
+        ba = self.b - self.a
+        q = points - self.a
+        t = np.clip(np.dot(q, ba) / np.dot(ba, ba), 0, 1)
+        w = q - t[:,np.newaxis] * ba
+        d = np.linalg.norm(w, axis=1)
+        return d - self.radius, w / _nonzero(d)[:,np.newaxis]
+
+    def jit_source(self, g, p):
+        ba = g.params(self.b - self.a)
+        inv_baba = g.param(1.0 / np.dot(self.b - self.a, self.b - self.a))
+        pa = [g.assign(f"{x} - {g.param(v)}") for x, v in zip(p, self.a)]
+        h = g.assign(f"min(max(({g.dot(pa, ba)}) * {inv_baba}, 0.0), 1.0)")
+        ws = [g.assign(f"{v} - {u} * {h}") for v, u in zip(pa, ba)]
+        return g.assign(f"sqrt({g.dot(ws, ws)}) - {g.param(self.radius)}")
+
+class SdfCappedCylinder(SdfNode):
+    jit = True
+    exact = True
+
+    def __init__(self, a, b, radius):
+        self.a = np.asarray(a, dtype=np.float64)
+        self.b = np.asarray(b, dtype=np.float64)
+        self.radius = radius
+
+    def compile(self, c, p):
+        a = c.const(self.a)
+        ba = c.const(self.b - self.a)
+        baba = float(np.dot(self.b - self.a, self.b - self.a))
+        radius = self.radius
+        q = c.alloc(3)
+        r = c.alloc(3)
+        x = c.alloc()
+        y = c.alloc()
+        t = c.alloc()
+        d = c.alloc()
+        def step(p, q, r, x, y, t, d):
+            np.subtract(p, a, out=q)
+            np.dot(q, ba, out=y)
+            np.multiply(y[:,np.newaxis], ba, out=r)
+            q *= baba
+            q -= r
+            _length(q, x)
+            x -= radius * baba
+            y -= baba * 0.5
+            np.abs(y, out=y)
+            y -= baba * 0.5
+            # inside: d = -min(x^2, y^2 * baba)
+            np.multiply(x, x, out=d)
+            np.multiply(y, y, out=t)
+            t *= baba
+            np.minimum(d, t, out=t)
+            np.negative(t, out=t)
+            inside = np.maximum(x, y, out=d) < 0
+            # outside: d = max(x,0)^2 + max(y,0)^2 * baba
+            np.maximum(x, 0, out=x)
+            np.maximum(y, 0, out=y)
+            np.multiply(x, x, out=d)
+            y *= y
+            y *= baba
+            d += y
+            np.copyto(d, t, where=inside)
+            np.sign(d, out=t)
+            np.abs(d, out=d)
+            np.sqrt(d, out=d)
+            d *= t
+            d /= baba
+        c.emit(step, p, q, r, x, y, t, d)
+        c.release(q, r, x, y, t)
+        return d
+
+    def bounds(self):
+        # Extent of the end discs along each axis
+        axis = _normalize(self.b - self.a)
+        e = self.radius * np.sqrt(np.maximum(1 - axis * axis, 0))
+        return (np.minimum(self.a, self.b) - e, np.maximum(self.a, self.b) + e)
+
+    def evaluate_with_gradient(self, points):
+        # Distance to the rectangle in (radial, axial) coordinates
+        length = np.linalg.norm(self.b - self.a)
+        axis = (self.b - self.a) / length
+        q = points - self.a
+        y = np.dot(q, axis) - length / 2
+        radial = q - (y + length / 2)[:,np.newaxis] * axis
+        r = np.linalg.norm(radial, axis=1)
+        d, g = _box_gradient(np.stack([r - self.radius, np.abs(y) - length / 2], axis=1))
+        g = (g[:,:1] * radial / _nonzero(r)[:,np.newaxis] +
+                (g[:,1] * _sign(y))[:,np.newaxis] * axis)
+        return d, g
+
+    def jit_source(self, g, p):
+        ba = g.params(self.b - self.a)
+        baba = g.param(np.dot(self.b - self.a, self.b - self.a))
+        pa = [g.assign(f"{v} - {g.param(a)}") for v, a in zip(p, self.a)]
+        paba = g.assign(g.dot(pa, ba))
+        ws = [g.assign(f"{v} * {baba} - {u} * {paba}") for v, u in zip(pa, ba)]
+        x = g.assign(f"sqrt({g.dot(ws, ws)}) - {g.param(self.radius)} * {baba}")
+        y = g.assign(f"abs({paba} - {baba} * 0.5) - {baba} * 0.5")
+        x2 = g.assign(f"{x} * {x}")
+        y2 = g.assign(f"{y} * {y} * {baba}")
+        d = g.assign(f"-min({x2}, {y2}) if max({x}, {y}) < 0.0 else ({x2} if {x} > 0.0 else 0.0) + ({y2} if {y} > 0.0 else 0.0)")
+        return g.assign(f"copysign(sqrt(abs({d})), {d}) / {baba}")
+
+class SdfRoundedCylinder(SdfNode):
+    jit = True
+    exact = True
+
+    def __init__(self, ra, rb, h):
+        self.ra = ra
+        self.rb = rb
+        self.h = h
+
+    def compile(self, c, p):
+        ra, rb, h = self.ra, self.rb, self.h
+        x = c.alloc()
+        y = c.alloc()
+        d = c.alloc()
+        def step(p, x, y, d):
+            np.hypot(p[:,0], p[:,1], out=x)
+            x -= ra - rb
+            np.abs(p[:,2], out=y)
+            y -= h / 2 - rb
+            np.maximum(x, y, out=d)
+            np.minimum(d, 0, out=d)
+            np.maximum(x, 0, out=x)
+            np.maximum(y, 0, out=y)
+            np.hypot(x, y, out=x)
+            d += x
+            d -= rb
+        c.emit(step, p, x, y, d)
+        c.release(x, y)
+        return d
+
+    def bounds(self):
+        r, h = self.ra, self.h / 2
+        return (np.array((-r, -r, -h)), np.array((r, r, h)))
+
+    def evaluate_with_gradient(self, points):
+        x, y, z = points.T
+        r = np.hypot(x, y)
+        q = np.stack([r - (self.ra - self.rb), np.abs(z) - (self.h / 2 - self.rb)], axis=1)
+        d, g = _box_gradient(q)
+        s = g[:,0] / _nonzero(r)
+        return d - self.rb, np.stack([s * x, s * y, g[:,1] * _sign(z)], axis=1)
+
+    def jit_source(self, g, p):
+        x, y, z = p
+        rb = g.param(self.rb)
+        a = g.assign(f"hypot({x}, {y}) - {g.param(self.ra)} + {rb}")
+        b = g.assign(f"abs({z}) - {g.param(self.h / 2)} + {rb}")
+        return g.assign(f"min(max({a}, {b}), 0.0) + hypot(max({a}, 0.0), max({b}, 0.0)) - {rb}")
+
+## Operations
+
+class SdfPointTransform(SdfNode):
+    """
+    Base class for operations which only transform query points
+    before passing them to the child SDF.
+    """
+    jit = True
+
+    def __init__(self, child):
+        self.child = child
+        self.dim = child.dim
+
+    def children(self):
+        return [self.child]
+
+    def compile_transform(self, c, p, q):
+        raise NotImplementedError
+
+    def transform_bounds(self, box):
+        """
+        Return bounding box of the points which the transformation maps
+        into the box of the child.
+        """
+        return None
+
+    def bounds(self):
+        box = self.child.bounds()
+        if box is None:
+            return None
+        return self.transform_bounds(box)
+
+    def transform_interval(self, lo, hi):
+        """
+        Return boxes in the space of the child, which contain images of
+        boxes (lo, hi) under the transformation; None if unknown.
+        """
+        return None
+
+    def interval(self, lo, hi):
+        boxes = self.transform_interval(lo, hi)
+        if boxes is None:
+            return _infinite(len(lo))
+        return self.child.interval(*boxes)
+
+    def transform_points(self, p):
+        """
+        Return points p mapped into the space of the child.
+        """
+        raise NotImplementedError
+
+    def transform_gradient(self, p, q, g):
+        """
+        Return gradient by points p, given gradient g of the child at
+        the transformed points q (product of g and Jacobian of the
+        transformation).
+        """
+        raise NotImplementedError
+
+    def evaluate_with_gradient(self, points):
+        q = self.transform_points(points)
+        d, g = self.child.evaluate_with_gradient(q)
+        return d, self.transform_gradient(points, q, g)
+
+    def compile(self, c, p):
+        q = c.alloc(self.child.dim)
+        self.compile_transform(c, p, q)
+        d = c.compile(self.child, q)
+        c.release(q)
+        return d
+
+    def jit_transform(self, g, p):
+        raise NotImplementedError
+
+    def jit_source(self, g, p):
+        q = self.jit_transform(g, p)
+        return g.source(self.child, q)
+
+class SdfTranslate(SdfPointTransform):
+    def __init__(self, child, offset):
+        super().__init__(child)
+        self.offset = np.asarray(offset, dtype=np.float64)
+
+    def compile_transform(self, c, p, q):
+        offset = c.const(self.offset)
+        def step(p, q):
+            np.subtract(p, offset, out=q)
+        c.emit(step, p, q)
+
+    def transform_bounds(self, box):
+        return (box[0] + self.offset, box[1] + self.offset)
+
+    def transform_interval(self, lo, hi):
+        return (lo - self.offset, hi - self.offset)
+
+    def transform_points(self, p):
+        return p - self.offset
+
+    def transform_gradient(self, p, q, g):
+        return g
+
+    def jit_transform(self, g, p):
+        return [g.assign(f"{x} - {g.param(v)}") for x, v in zip(p, self.offset)]
+
+class SdfScale(SdfPointTransform):
+    def __init__(self, child, factor):
+        super().__init__(child)
+        factor = np.asarray(factor, dtype=np.float64)
+        if factor.ndim == 0:
+            factor = np.full(self.dim, factor)
+        self.factor = factor
+
+    def compile_transform(self, c, p, q):
+        factor = c.const(self.factor)
+        def step(p, q):
+            np.divide(p, factor, out=q)
+        c.emit(step, p, q)
+
+    def compile(self, c, p):
+        d = super().compile(c, p)
+        m = self.factor.min()
+        def step(d):
+            d *= m
+        c.emit(step, d)
+        return d
+
+    def transform_bounds(self, box):
+        lo, hi = box[0] * self.factor, box[1] * self.factor
+        return (np.minimum(lo, hi), np.maximum(lo, hi))
+
+    def transform_interval(self, lo, hi):
+        lo, hi = lo / self.factor, hi / self.factor
+        return (np.minimum(lo, hi), np.maximum(lo, hi))
+
+    def interval(self, lo, hi):
+        dlo, dhi = super().interval(lo, hi)
+        m = self.factor.min()
+        return (np.minimum(dlo * m, dhi * m), np.maximum(dlo * m, dhi * m))
+
+    def transform_points(self, p):
+        return p / self.factor
+
+    def transform_gradient(self, p, q, g):
+        return g / self.factor
+
+    def evaluate_with_gradient(self, points):
+        d, g = super().evaluate_with_gradient(points)
+        m = self.factor.min()
+        return d * m, g * m
+
+    def jit_transform(self, g, p):
+        return [g.assign(f"{x} / {g.param(v)}") for x, v in zip(p, self.factor)]
+
+    def jit_source(self, g, p):
+        d = super().jit_source(g, p)
+        return g.assign(f"{d} * {g.param(self.factor.min())}")
+
+class SdfRotate(SdfPointTransform):
+    def __init__(self, child, angle, vector=Z):
+        super().__init__(child)
+        self.angle = angle
+        self.vector = np.asarray(vector, dtype=np.float64)
+        self.matrix = _rotation_matrix(angle, vector)
+
+    def compile_transform(self, c, p, q):
+        matrix = c.const(self.matrix)
+        def step(p, q):
+            np.dot(p, matrix, out=q)
+        c.emit(step, p, q)
+
+    def transform_bounds(self, box):
+        corners = np.dot(_box_corners(box), self.matrix.T)
+        return (corners.min(axis=0), corners.max(axis=0))
+
+    def transform_interval(self, lo, hi):
+        ranges = [_interval_dot(lo, hi, column) for column in self.matrix.T]
+        return (np.stack([r[0] for r in ranges], axis=1),
+                np.stack([r[1] for r in ranges], axis=1))
+
+    def transform_points(self, p):
+        return np.dot(p, self.matrix)
+
+    def transform_gradient(self, p, q, g):
+        return np.dot(g, self.matrix.T)
+
+    def jit_transform(self, g, p):
+        return [g.assign(g.dot(p, g.params(column))) for column in self.matrix.T]
+
+class SdfTwist(SdfPointTransform):
+    def __init__(self, child, k):
+        super().__init__(child)
+        self.k = k
+
+    def compile_transform(self, c, p, q):
+        k = self.k
+        cos = c.alloc()
+        sin = c.alloc()
+        t = c.alloc()
+        def step(p, q, cos, sin, t):
+            np.multiply(p[:,2], k, out=t)
+            np.cos(t, out=cos)
+            np.sin(t, out=sin)
+            np.multiply(cos, p[:,0], out=q[:,0])
+            np.multiply(sin, p[:,1], out=t)
+            q[:,0] -= t
+            np.multiply(sin, p[:,0], out=q[:,1])
+            np.multiply(cos, p[:,1], out=t)
+            q[:,1] += t
+            q[:,2] = p[:,2]
+        c.emit(step, p, q, cos, sin, t)
+        c.release(cos, sin, t)
+
+    def transform_bounds(self, box):
+        # Any rotation around Z axis stays within the cylinder
+        r = np.linalg.norm(_box_corners(box)[:,:2], axis=1).max()
+        return (np.array((-r, -r, box[0][2])), np.array((r, r, box[1][2])))
+
+    def transform_interval(self, lo, hi):
+        r = _box_farthest(lo[:,:2], hi[:,:2], ORIGIN[:2], ORIGIN[:2])
+        return (np.stack([-r, -r, lo[:,2]], axis=1), np.stack([r, r, hi[:,2]], axis=1))
+
+    def transform_points(self, p):
+        x, y, z = p.T
+        cos, sin = np.cos(self.k * z), np.sin(self.k * z)
+        return np.stack([cos * x - sin * y, sin * x + cos * y, z], axis=1)
+
+    def transform_gradient(self, p, q, g):
+        # Rotation by angle k*z: derivative by z is rotated (-y, x) times k
+        z = p[:,2]
+        cos, sin = np.cos(self.k * z), np.sin(self.k * z)
+        g0, g1, g2 = g.T
+        return np.stack([cos * g0 + sin * g1, cos * g1 - sin * g0,
+                    g2 + self.k * (q[:,0] * g1 - q[:,1] * g0)], axis=1)
+
+    def jit_transform(self, g, p):
+        x, y, z = p
+        t = g.assign(f"{g.param(self.k)} * {z}")
+        cos = g.assign(f"cos({t})")
+        sin = g.assign(f"sin({t})")
+        return [g.assign(f"{cos} * {x} - {sin} * {y}"), g.assign(f"{sin} * {x} + {cos} * {y}"), z]
+
+class SdfBendLinear(SdfPointTransform):
+    def __init__(self, child, p0, p1, v, e=None):
+        super().__init__(child)
+        self.p0 = np.asarray(p0, dtype=np.float64)
+        self.p1 = np.asarray(p1, dtype=np.float64)
+        self.v = -np.asarray(v, dtype=np.float64)
+        self.e = _easing(e)
+
+    def jittable(self):
+        return self.e is None and super().jittable()
+
+    def compile_transform(self, c, p, q):
+        p0 = c.const(self.p0)
+        ab = c.const(self.p1 - self.p0)
+        inv_abab = 1.0 / np.dot(self.p1 - self.p0, self.p1 - self.p0)
+        v = c.const(self.v)
+        e = self.e
+        t = c.alloc()
+        def step(p, q, t):
+            np.subtract(p, p0, out=q)
+            np.dot(q, ab, out=t)
+            t *= inv_abab
+            np.clip(t, 0, 1, out=t)
+            if e is not None:
+                t[...] = e(t)
+            np.multiply(t[:,np.newaxis], v, out=q)
+            q += p
+        c.emit(step, p, q, t)
+        c.release(t)
+
+    def transform_bounds(self, box):
+        # Points are shifted by t*v, 0 <= t <= 1, before evaluation;
+        # some easing functions overshoot that range.
+        if self.e is not None:
+            return None
+        return _box_union([box, (box[0] - self.v, box[1] - self.v)])
+
+    def transform_interval(self, lo, hi):
+        if self.e is not None:
+            return None
+        ab = self.p1 - self.p0
+        tlo, thi = _interval_dot(lo - self.p0, hi - self.p0, ab / np.dot(ab, ab))
+        shifts = np.stack([np.clip(tlo, 0, 1), np.clip(thi, 0, 1)])[:,:,np.newaxis] * self.v
+        return (lo + shifts.min(axis=0), hi + shifts.max(axis=0))
+
+    def _shift(self, p):
+        # Shift parameter t at points and its gradient
+        ab = self.p1 - self.p0
+        abab = np.dot(ab, ab)
+        t, dt = _ramp(np.dot(p - self.p0, ab) / abab, self.e)
+        return t, dt[:,np.newaxis] * ab / abab
+
+    def transform_points(self, p):
+        t, _ = self._shift(p)
+        return p + t[:,np.newaxis] * self.v
+
+    def transform_gradient(self, p, q, g):
+        _, dt = self._shift(p)
+        return g + np.dot(g, self.v)[:,np.newaxis] * dt
+
+    def jit_transform(self, g, p):
+        ab = self.p1 - self.p0
+        qs = [g.assign(f"{x} - {g.param(v)}") for x, v in zip(p, self.p0)]
+        t = g.assign(f"min(max(({g.dot(qs, g.params(ab))}) * {g.param(1.0 / np.dot(ab, ab))}, 0.0), 1.0)")
+        return [g.assign(f"{x} + {t} * {g.param(v)}") for x, v in zip(p, self.v)]
+
+class SdfDilate(SdfNode):
+    jit = True
+
+    def __init__(self, child, r):
+        self.child = child
+        self.dim = child.dim
+        self.r = r
+
+    def children(self):
+        return [self.child]
+
+    def compile(self, c, p):
+        r = self.r
+        d = c.compile(self.child, p)
+        def step(d):
+            d -= r
+        c.emit(step, d)
+        return d
+
+    def bounds(self):
+        return _box_expand(self.child.bounds(), max(self.r, 0))
+
+    def interval(self, lo, hi):
+        dlo, dhi = self.child.interval(lo, hi)
+        return (dlo - self.r, dhi - self.r)
+
+    def evaluate_with_gradient(self, points):
+        d, g = self.child.evaluate_with_gradient(points)
+        return d - self.r, g
+
+    def jit_source(self, g, p):
+        d = g.source(self.child, p)
+        return g.assign(f"{d} - {g.param(self.r)}")
+
+class SdfShell(SdfNode):
+    jit = True
+
+    def __init__(self, child, thickness):
+        self.child = child
+        self.dim = child.dim
+        self.thickness = thickness
+
+    def children(self):
+        return [self.child]
+
+    def compile(self, c, p):
+        half = self.thickness / 2
+        d = c.compile(self.child, p)
+        def step(d):
+            np.abs(d, out=d)
+            d -= half
+        c.emit(step, d)
+        return d
+
+    def bounds(self):
+        return _box_expand(self.child.bounds(), max(self.thickness / 2, 0))
+
+    def interval(self, lo, hi):
+        dlo, dhi = _interval_abs(*self.child.interval(lo, hi))
+        return (dlo - self.thickness / 2, dhi - self.thickness / 2)
+
+    def evaluate_with_gradient(self, points):
+        d, g = self.child.evaluate_with_gradient(points)
+        return np.abs(d) - self.thickness / 2, g * _sign(d)[:,np.newaxis]
+
+    def jit_source(self, g, p):
+        d = g.source(self.child, p)
+        return g.assign(f"abs({d}) - {g.param(self.thickness / 2)}")
+
+class SdfBinary(SdfNode):
+    """
+    Base class for operations combining values of two SDFs at the same points.
+    """
+    jit = True
+
+    def __init__(self, a, b, k=None):
+        self.a = a
+        self.b = b
+        self.dim = a.dim
+        self.k = k
+
+    def children(self):
+        return [self.a, self.b]
+
+    def compile_combine(self, c, p, d1, d2):
+        raise NotImplementedError
+
+    def bounds(self):
+        # Combination of two positive distances is positive (for
+        # union, blend and transitions)
+        return _box_union([self.a.bounds(), self.b.bounds()])
+
+    def combine_interval(self, lo, hi, i1, i2):
+        """
+        Return interval of the combination, given intervals i1 and i2
+        of children over boxes (lo, hi).
+        """
+        # The combination is a value between the two (for transitions)
+        return (np.minimum(i1[0], i2[0]), np.maximum(i1[1], i2[1]))
+
+    def interval(self, lo, hi):
+        return self.combine_interval(lo, hi, self.a.interval(lo, hi), self.b.interval(lo, hi))
+
+    def combine_gradient(self, p, d1, g1, d2, g2):
+        """
+        Return values and gradients of the combination at points p, given
+        values and gradients of children.
+        """
+        raise NotImplementedError
+
+    def evaluate_with_gradient(self, points):
+        d1, g1 = self.a.evaluate_with_gradient(points)
+        d2, g2 = self.b.evaluate_with_gradient(points)
+        return self.combine_gradient(points, d1, g1, d2, g2)
+
+    def compile(self, c, p):
+        d1 = c.compile(self.a, p)
+        d2 = c.compile(self.b, p)
+        self.compile_combine(c, p, d1, d2)
+        c.release(d2)
+        return d1
+
+    def jit_combine(self, g, p, d1, d2):
+        raise NotImplementedError
+
+    def jit_source(self, g, p):
+        d1 = g.source(self.a, p)
+        d2 = g.source(self.b, p)
+        return self.jit_combine(g, p, d1, d2)
+
+class SdfUnion(SdfBinary):
+    def bounds(self):
+        # Smooth minimum is less than the minimum by k/4 at most
+        return _box_expand(super().bounds(), (self.k or 0) / 4)
+
+    def combine_interval(self, lo, hi, i1, i2):
+        return (np.minimum(i1[0], i2[0]) - (self.k or 0) / 4, np.minimum(i1[1], i2[1]))
+
+    def combine_gradient(self, p, d1, g1, d2, g2):
+        return _min_gradient(d1, g1, d2, g2, self.k)
+
+    def compile_combine(self, c, p, d1, d2):
+        K = self.k
+        if not K:
+            def step(d1, d2):
+                np.minimum(d1, d2, out=d1)
+            c.emit(step, d1, d2)
+        else:
+            h = c.alloc()
+            def step(d1, d2, h):
+                np.subtract(d2, d1, out=h)
+                h *= 0.5 / K
+                h += 0.5
+                np.clip(h, 0, 1, out=h)
+                np.subtract(d1, d2, out=d1)
+                d1 *= h
+                d1 += d2
+                np.subtract(1, h, out=d2)
+                d2 *= h
+                d2 *= K
+                d1 -= d2
+            c.emit(step, d1, d2, h)
+            c.release(h)
+
+    def jit_combine(self, g, p, d1, d2):
+        if not self.k:
+            return g.assign(f"min({d1}, {d2})")
+        K = g.param(self.k)
+        h = g.assign(f"min(max(0.5 + ({d2} - {d1}) * {g.param(0.5 / self.k)}, 0.0), 1.0)")
+        return g.assign(f"{d2} + ({d1} - {d2}) * {h} - {K} * {h} * (1.0 - {h})")
+
+class SdfIntersection(SdfBinary):
+    def bounds(self):
+        return _box_intersection([self.a.bounds(), self.b.bounds()])
+
+    def combine_interval(self, lo, hi, i1, i2):
+        return (np.maximum(i1[0], i2[0]), np.maximum(i1[1], i2[1]) + (self.k or 0) / 4)
+
+    def combine_gradient(self, p, d1, g1, d2, g2):
+        d, g = _min_gradient(-d1, -g1, -d2, -g2, self.k)
+        return -d, -g
+
+    def compile_combine(self, c, p, d1, d2):
+        K = self.k
+        if not K:
+            def step(d1, d2):
+                np.maximum(d1, d2, out=d1)
+            c.emit(step, d1, d2)
+        else:
+            h = c.alloc()
+            def step(d1, d2, h):
+                np.subtract(d2, d1, out=h)
+                h *= -0.5 / K
+                h += 0.5
+                np.clip(h, 0, 1, out=h)
+                np.subtract(d1, d2, out=d1)
+                d1 *= h
+                d1 += d2
+                np.subtract(1, h, out=d2)
+                d2 *= h
+                d2 *= K
+                d1 += d2
+            c.emit(step, d1, d2, h)
+            c.release(h)
+
+    def jit_combine(self, g, p, d1, d2):
+        if not self.k:
+            return g.assign(f"max({d1}, {d2})")
+        K = g.param(self.k)
+        h = g.assign(f"min(max(0.5 + ({d2} - {d1}) * {g.param(-0.5 / self.k)}, 0.0), 1.0)")
+        return g.assign(f"{d2} + ({d1} - {d2}) * {h} + {K} * {h} * (1.0 - {h})")
+
+class SdfDifference(SdfBinary):
+    def bounds(self):
+        return self.a.bounds()
+
+    def combine_interval(self, lo, hi, i1, i2):
+        return (np.maximum(i1[0], -i2[1]), np.maximum(i1[1], -i2[0]) + (self.k or 0) / 4)
+
+    def combine_gradient(self, p, d1, g1, d2, g2):
+        # Smooth maximum of d1 and -d2
+        d, g = _min_gradient(-d1, -g1, d2, g2, self.k)
+        return -d, -g
+
+    def compile_combine(self, c, p, d1, d2):
+        K = self.k
+        if not K:
+            def step(d1, d2):
+                np.negative(d2, out=d2)
+                np.maximum(d1, d2, out=d1)
+            c.emit(step, d1, d2)
+        else:
+            h = c.alloc()
+            def step(d1, d2, h):
+                np.add(d2, d1, out=d2)
+                np.multiply(d2, -0.5 / K, out=h)
+                h += 0.5
+                np.clip(h, 0, 1, out=h)
+                d2 *= h
+                d1 -= d2
+                np.subtract(1, h, out=d2)
+                d2 *= h
+                d2 *= K
+                d1 += d2
+            c.emit(step, d1, d2, h)
+            c.release(h)
+
+    def jit_combine(self, g, p, d1, d2):
+        if not self.k:
+            return g.assign(f"max({d1}, -{d2})")
+        K = g.param(self.k)
+        s = g.assign(f"{d2} + {d1}")
+        h = g.assign(f"min(max(0.5 + {s} * {g.param(-0.5 / self.k)}, 0.0), 1.0)")
+        return g.assign(f"{d1} - {s} * {h} + {K} * {h} * (1.0 - {h})")
+
+class SdfNaryIntersection(SdfNode):
+    """
+    Intersection of many SDFs in one node, instead of a chain of pairwise
+    intersections: results of children are copied into rows of one
+    (BLOCK_SIZE, n) buffer, and each block of rows is reduced at once.
+    If subtract is True, all children but the first are subtracted
+    from it (difference). Smooth intersection (k) folds children in
+    their order, with the same results as the chain of pairwise ones.
+    """
+    BLOCK_SIZE = 16
+
+    def __init__(self, children, k=None, subtract=False):
+        self.items = list(children)
+        self.dim = self.items[0].dim
+        self.k = k
+        self.subtract = subtract
+
+    def children(self):
+        return self.items
+
+    def _signs(self):
+        signs = np.ones(len(self.items))
+        if self.subtract:
+            signs[1:] = -1
+        return signs
+
+    def bounds(self):
+        if self.subtract:
+            return self.items[0].bounds()
+        return _box_intersection([child.bounds() for child in self.items])
+
+    def interval(self, lo, hi):
+        dlos, dhis = [], []
+        for child, sign in zip(self.items, self._signs()):
+            dlo, dhi = child.interval(lo, hi)
+            if sign < 0:
+                dlo, dhi = -dhi, -dlo
+            dlos.append(dlo)
+            dhis.append(dhi)
+        # Each smooth maximum is larger than the maximum by k/4 at most
+        bump = (len(self.items) - 1) * (self.k or 0) / 4
+        return (np.maximum.reduce(dlos), np.maximum.reduce(dhis) + bump)
+
+    def evaluate_with_gradient(self, points):
+        d, g = None, None
+        for child, sign in zip(self.items, self._signs()):
+            d2, g2 = child.evaluate_with_gradient(points)
+            d2, g2 = d2 * sign, g2 * sign
+            if d is None:
+                d, g = d2, g2
+            else:
+                d, g = _min_gradient(-d, -g, -d2, -g2, self.k)
+                d, g = -d, -g
+        return d, g
+
+    def _compile_smooth(self, c, p):
+        K = self.k
+        d = c.compile(self.items[0], p)
+        h = c.alloc()
+        for child, sign in zip(self.items[1:], self._signs()[1:]):
+            r = c.compile(child, p)
+            def step(d, r, h, sign=sign):
+                if sign < 0:
+                    np.negative(r, out=r)
+                # Smooth maximum, as in SdfIntersection
+                np.subtract(r, d, out=h)
+                h *= -0.5 / K
+                h += 0.5
+                np.clip(h, 0, 1, out=h)
+                np.subtract(d, r, out=d)
+                d *= h
+                d += r
+                np.subtract(1, h, out=r)
+                r *= h
+                r *= K
+                d += r
+            c.emit(step, d, r, h)
+            c.release(r)
+        c.release(h)
+        return d
+
+    def compile(self, c, p):
+        if self.k:
+            return self._compile_smooth(c, p)
+        width = max(min(len(self.items), SdfNaryIntersection.BLOCK_SIZE), 2)
+        columns = c.alloc(width)
+        d = c.alloc()
+        signs = self._signs()
+        for start in range(0, len(self.items), width):
+            block = self.items[start:start+width]
+            for j, child in enumerate(block):
+                r = c.compile(child, p)
+                def copy(r, columns, j=j, sign=signs[start + j]):
+                    # The register is used as (width, n) array, so
+                    # that each row is contiguous
+                    row = columns.reshape((width, -1))[j]
+                    if sign < 0:
+                        np.negative(r, out=row)
+                    else:
+                        row[...] = r
+                c.emit(copy, r, columns)
+                c.release(r)
+            def reduce(columns, d, m=len(block), first=(start == 0)):
+                block = columns.reshape((width, -1))[:m]
+                if first:
+                    np.maximum.reduce(block, axis=0, out=d)
+                else:
+                    np.maximum(d, np.maximum.reduce(block, axis=0), out=d)
+            c.emit(reduce, columns, d)
+        c.release(columns)
+        return d
+
+class SdfBlend(SdfBinary):
+    def __init__(self, a, b, k=0.5):
+        super().__init__(a, b, k)
+
+    def combine_interval(self, lo, hi, i1, i2):
+        K = self.k
+        if K == 0:
+            return i1
+        if K == 1:
+            return i2
+        a = (i1[0] * (1 - K), i1[1] * (1 - K))
+        b = (i2[0] * K, i2[1] * K)
+        return (np.minimum(*a) + np.minimum(*b), np.maximum(*a) + np.maximum(*b))
+
+    def combine_gradient(self, p, d1, g1, d2, g2):
+        K = self.k
+        return d1 * (1 - K) + d2 * K, g1 * (1 - K) + g2 * K
+
+    def compile_combine(self, c, p, d1, d2):
+        K = self.k
+        def step(d1, d2):
+            d1 *= 1 - K
+            d2 *= K
+            d1 += d2
+        c.emit(step, d1, d2)
+
+    def jit_combine(self, g, p, d1, d2):
+        return g.assign(f"{d1} * {g.param(1 - self.k)} + {d2} * {g.param(self.k)}")
+
+class SdfTransitionLinear(SdfBinary):
+    def __init__(self, a, b, p0=-Z, p1=Z, e=None):
+        super().__init__(a, b)
+        self.p0 = np.asarray(p0, dtype=np.float64)
+        self.p1 = np.asarray(p1, dtype=np.float64)
+        self.e = _easing(e)
+
+    def jittable(self):
+        return self.e is None and super().jittable()
+
+    def bounds(self):
+        # Some easing functions overshoot, the result is not between children then
+        if self.e is not None:
+            return None
+        return super().bounds()
+
+    def interval(self, lo, hi):
+        if self.e is not None:
+            return _infinite(len(lo))
+        return super().interval(lo, hi)
+
+    def compile_combine(self, c, p, d1, d2):
+        p0 = c.const(self.p0)
+        ab = c.const(self.p1 - self.p0)
+        inv_abab = 1.0 / np.dot(self.p1 - self.p0, self.p1 - self.p0)
+        e = self.e
+        q = c.alloc(self.dim)
+        t = c.alloc()
+        def step(p, d1, d2, q, t):
+            np.subtract(p, p0, out=q)
+            np.dot(q, ab, out=t)
+            t *= inv_abab
+            np.clip(t, 0, 1, out=t)
+            if e is not None:
+                t[...] = e(t)
+            d2 -= d1
+            d2 *= t
+            d1 += d2
+        c.emit(step, p, d1, d2, q, t)
+        c.release(q, t)
+
+    def combine_gradient(self, p, d1, g1, d2, g2):
+        ab = self.p1 - self.p0
+        abab = np.dot(ab, ab)
+        t, dt = _ramp(np.dot(p - self.p0, ab) / abab, self.e)
+        g = g1 + (g2 - g1) * t[:,np.newaxis] + ((d2 - d1) * dt)[:,np.newaxis] * ab / abab
+        return d1 + (d2 - d1) * t, g
+
+    def jit_combine(self, g, p, d1, d2):
+        ab = self.p1 - self.p0
+        qs = [g.assign(f"{x} - {g.param(v)}") for x, v in zip(p, self.p0)]
+        t = g.assign(f"min(max(({g.dot(qs, g.params(ab))}) * {g.param(1.0 / np.dot(ab, ab))}, 0.0), 1.0)")
+        return g.assign(f"{d1} + ({d2} - {d1}) * {t}")
+
+class SdfTransitionRadial(SdfBinary):
+    def __init__(self, a, b, r0=0, r1=1, e=None):
+        super().__init__(a, b)
+        self.r0 = r0
+        self.r1 = r1
+        self.e = _easing(e)
+
+    def jittable(self):
+        return self.e is None and super().jittable()
+
+    def bounds(self):
+        if self.e is not None:
+            return None
+        return super().bounds()
+
+    def interval(self, lo, hi):
+        if self.e is not None:
+            return _infinite(len(lo))
+        return super().interval(lo, hi)
+
+    def compile_combine(self, c, p, d1, d2):
+        r0 = self.r0
+        inv_dr = 1.0 / (self.r1 - self.r0)
+        e = self.e
+        t = c.alloc()
+        def step(p, d1, d2, t):
+            np.hypot(p[:,0], p[:,1], out=t)
+            t -= r0
+            t *= inv_dr
+            np.clip(t, 0, 1, out=t)
+            if e is not None:
+                t[...] = e(t)
+            d2 -= d1
+            d2 *= t
+            d1 += d2
+        c.emit(step, p, d1, d2, t)
+        c.release(t)
+
+    def combine_gradient(self, p, d1, g1, d2, g2):
+        dr = self.r1 - self.r0
+        r = np.hypot(p[:,0], p[:,1])
+        t, dt = _ramp((r - self.r0) / dr, self.e)
+        s = (d2 - d1) * dt / dr / _nonzero(r)
+        g = g1 + (g2 - g1) * t[:,np.newaxis]
+        g[:,0] += s * p[:,0]
+        g[:,1] += s * p[:,1]
+        return d1 + (d2 - d1) * t, g
+
+    def jit_combine(self, g, p, d1, d2):
+        r = g.assign(f"(hypot({p[0]}, {p[1]}) - {g.param(self.r0)}) * {g.param(1.0 / (self.r1 - self.r0))}")
+        t = g.assign(f"min(max({r}, 0.0), 1.0)")
+        return g.assign(f"{d1} + ({d2} - {d1}) * {t}")
+
+## Dimension changing operations
+
+class SdfSlice(SdfPointTransform):
+    def __init__(self, child):
+        super().__init__(child)
+        self.dim = 2
+
+    def compile_transform(self, c, p, q):
+        def step(p, q):
+            q[:,:2] = p
+            q[:,2] = 0
+        c.emit(step, p, q)
+
+    def transform_bounds(self, box):
+        return (box[0][:2], box[1][:2])
+
+    def transform_interval(self, lo, hi):
+        zeros = np.zeros((len(lo), 1))
+        return (np.hstack((lo, zeros)), np.hstack((hi, zeros)))
+
+    def transform_points(self, p):
+        return np.hstack((p, np.zeros((len(p), 1))))
+
+    def transform_gradient(self, p, q, g):
+        return g[:,:2]
+
+    def jit_transform(self, g, p):
+        return [p[0], p[1], "0.0"]
+
+def _compile_extrusion(c, p, d, h):
+    # Combine 2D distance d with distance along Z axis; result goes to d.
+    w = c.alloc()
+    t = c.alloc()
+    def step(p, d, w, t):
+        np.abs(p[:,2], out=w)
+        w -= h / 2
+        np.maximum(d, w, out=t)
+        np.minimum(t, 0, out=t)
+        np.maximum(d, 0, out=d)
+        np.maximum(w, 0, out=w)
+        np.hypot(d, w, out=d)
+        d += t
+    c.emit(step, p, d, w, t)
+    c.release(w, t)
+
+def _jit_extrusion(g, p, d, h):
+    w = g.assign(f"abs({p[2]}) - {g.param(h / 2)}")
+    return g.assign(f"min(max({d}, {w}), 0.0) + hypot(max({d}, 0.0), max({w}, 0.0))")
+
+class SdfExtrude(SdfPointTransform):
+    def __init__(self, child, h):
+        super().__init__(child)
+        self.dim = 3
+        self.h = h
+
+    def compile_transform(self, c, p, q):
+        def step(p, q):
+            q[...] = p[:,:2]
+        c.emit(step, p, q)
+
+    def transform_bounds(self, box):
+        h = self.h / 2
+        return (np.append(box[0], -h), np.append(box[1], h))
+
+    def transform_interval(self, lo, hi):
+        return (lo[:,:2], hi[:,:2])
+
+    def interval(self, lo, hi):
+        dlo, dhi = super().interval(lo, hi)
+        return _interval_extrusion(dlo, dhi, lo, hi, self.h)
+
+    def transform_points(self, p):
+        return p[:,:2]
+
+    def transform_gradient(self, p, q, g):
+        return np.hstack((g, np.zeros((len(g), 1))))
+
+    def evaluate_with_gradient(self, points):
+        d, g = super().evaluate_with_gradient(points)
+        return _extrusion_gradient(points, d, g, self.h)
+
+    def compile(self, c, p):
+        d = super().compile(c, p)
+        _compile_extrusion(c, p, d, self.h)
+        return d
+
+    def jit_transform(self, g, p):
+        return p[:2]
+
+    def jit_source(self, g, p):
+        d = super().jit_source(g, p)
+        return _jit_extrusion(g, p, d, self.h)
+
+class SdfExtrudeTo(SdfBinary):
+    def __init__(self, a, b, h, e=None):
+        super().__init__(a, b)
+        self.dim = 3
+        self.h = h
+        self.e = _easing(e)
+
+    def jittable(self):
+        return self.e is None and super().jittable()
+
+    def bounds(self):
+        if self.e is not None:
+            return None
+        box = _box_union([self.a.bounds(), self.b.bounds()])
+        if box is None:
+            return None
+        h = self.h / 2
+        return (np.append(box[0], -h), np.append(box[1], h))
+
+    def interval(self, lo, hi):
+        if self.e is not None:
+            return _infinite(len(lo))
+        dlo, dhi = self.combine_interval(lo, hi, self.a.interval(lo[:,:2], hi[:,:2]),
+                        self.b.interval(lo[:,:2], hi[:,:2]))
+        return _interval_extrusion(dlo, dhi, lo, hi, self.h)
+
+    def evaluate_with_gradient(self, points):
+        q = points[:,:2]
+        d1, g1 = self.a.evaluate_with_gradient(q)
+        d2, g2 = self.b.evaluate_with_gradient(q)
+        t, dt = _ramp(points[:,2] / self.h + 0.5, self.e)
+        g = np.empty(points.shape)
+        g[:,:2] = g1 + (g2 - g1) * t[:,np.newaxis]
+        g[:,2] = (d2 - d1) * dt / self.h
+        return _extrusion_gradient(points, d1 + (d2 - d1) * t, g, self.h)
+
+    def compile(self, c, p):
+        q = c.alloc(2)
+        def step(p, q):
+            q[...] = p[:,:2]
+        c.emit(step, p, q)
+        d1 = c.compile(self.a, q)
+        d2 = c.compile(self.b, q)
+        c.release(q)
+
+        h = self.h
+        e = self.e
+        t = c.alloc()
+        def step(p, d1, d2, t):
+            np.divide(p[:,2], h, out=t)
+            np.clip(t, -0.5, 0.5, out=t)
+            t += 0.5
+            if e is not None:
+                t[...] = e(t)
+            d2 -= d1
+            d2 *= t
+            d1 += d2
+        c.emit(step, p, d1, d2, t)
+        c.release(d2, t)
+        _compile_extrusion(c, p, d1, h)
+        return d1
+
+    def jit_source(self, g, p):
+        d1 = g.source(self.a, p[:2])
+        d2 = g.source(self.b, p[:2])
+        t = g.assign(f"min(max({p[2]} / {g.param(self.h)}, -0.5), 0.5) + 0.5")
+        d = g.assign(f"{d1} + ({d2} - {d1}) * {t}")
+        return _jit_extrusion(g, p, d, self.h)
+
+class SdfRevolve(SdfPointTransform):
+    def __init__(self, child, offset=0):
+        super().__init__(child)
+        self.dim = 3
+        self.offset = offset
+
+    def compile_transform(self, c, p, q):
+        offset = self.offset
+        def step(p, q):
+            np.hypot(p[:,0], p[:,1], out=q[:,0])
+            q[:,0] -= offset
+            q[:,1] = p[:,2]
+        c.emit(step, p, q)
+
+    def transform_bounds(self, box):
+        r = max(self.offset + box[1][0], 0)
+        return (np.array((-r, -r, box[0][1])), np.array((r, r, box[1][1])))
+
+    def transform_interval(self, lo, hi):
+        origin = ORIGIN[:2]
+        rlo = _box_distance(lo[:,:2], hi[:,:2], origin, origin)
+        rhi = _box_farthest(lo[:,:2], hi[:,:2], origin, origin)
+        return (np.stack([rlo - self.offset, lo[:,2]], axis=1),
+                np.stack([rhi - self.offset, hi[:,2]], axis=1))
+
+    def transform_points(self, p):
+        return np.stack([np.hypot(p[:,0], p[:,1]) - self.offset, p[:,2]], axis=1)
+
+    def transform_gradient(self, p, q, g):
+        s = g[:,0] / _nonzero(np.hypot(p[:,0], p[:,1]))
+        return np.stack([s * p[:,0], s * p[:,1], g[:,1]], axis=1)
+
+    def jit_transform(self, g, p):
+        x, y, z = p
+        return [g.assign(f"hypot({x}, {y}) - {g.param(self.offset)}"), z]
+
+def subdivide_boxes(lo, hi):
+    """
+    Split each box into 2^dim equal boxes.
+    """
+    dim = lo.shape[1]
+    mid = (lo + hi) / 2
+    los, his = [], []
+    for corner in itertools.product((False, True), repeat=dim):
+        corner = np.array(corner)
+        los.append(np.where(corner, mid, lo))
+        his.append(np.where(corner, hi, mid))
+    return np.concatenate(los), np.concatenate(his)
+
+def interval_bounds(node, size=1e9, tolerance=1.0/32, max_boxes=2**16):
+    """
+    Estimate bounding box of the surface by interval evaluation over an
+    octree (a quadtree for 2D SDF): starting from a cube of the given
+    half-size, boxes which can not contain the surface are discarded, and
+    the rest are subdivided, until boxes are smaller than `tolerance` of
+    the bounding box of the remaining ones. Unlike sampling, the result
+    can not miss thin features.
+    Return ((x0, y0, z0), (x1, y1, z1)); None if the node can not estimate
+    its values or there is no surface.
+    """
+    dim = node.dim
+    lo = np.full((1, dim), -size, dtype=np.float64)
+    hi = np.full((1, dim), size, dtype=np.float64)
+    while True:
+        dlo, dhi = node.interval(lo, hi)
+        if (np.isinf(dlo) & np.isinf(dhi)).any():
+            return None
+        keep = (dlo <= 0) & (dhi >= 0)
+        lo, hi = lo[keep], hi[keep]
+        if not len(lo):
+            return None
+        bounds = (lo.min(axis=0), hi.max(axis=0))
+        if np.all(hi[0] - lo[0] <= (bounds[1] - bounds[0]) * tolerance):
+            break
+        if len(lo) * 2**dim > max_boxes:
+            break
+        lo, hi = subdivide_boxes(lo, hi)
+    return (tuple(float(v) for v in bounds[0]), tuple(float(v) for v in bounds[1]))
+
+def tree_bounds(node):
+    """
+    Return bounding box of the surface: propagated analytically from
+    primitives through operations (see SdfNode.bounds), or, if some node
+    can not do that, estimated by interval evaluation (see interval_bounds).
+    Return ((x0, y0, z0), (x1, y1, z1)); None if both methods fail.
+    """
+    box = node.bounds()
+    if box is not None and np.isfinite(box[0]).all() and np.isfinite(box[1]).all():
+        return (tuple(float(v) for v in box[0]), tuple(float(v) for v in box[1]))
+    return interval_bounds(node)
+
+_canonical_nodes = weakref.WeakValueDictionary()
+_canonical_lock = threading.Lock()
+
+def deduplicate(node):
+    """
+    Replace subtrees of the tree which are structurally equal to subtrees
+    seen before (in this tree or in trees passed earlier) with one shared
+    instance, so that they are compiled and evaluated once per batch of
+    points. Children are replaced in place, which does not change values.
+    Return the canonical instance of the node itself.
+    """
+    def canonical(value):
+        if isinstance(value, SdfNode):
+            return deduplicate(value)
+        if isinstance(value, list):
+            return [canonical(item) for item in value]
+        return value
+
+    if node.__dict__.get('_deduplicated'):
+        return node
+    for name, value in list(node.__dict__.items()):
+        if not name.startswith('_'):
+            node.__dict__[name] = canonical(value)
+    node.__dict__['_deduplicated'] = True
+    key = node.structural_hash()
+    if key is None:
+        return node
+    with _canonical_lock:
+        return _canonical_nodes.setdefault(key, node)
+
+def _same_tree(old, new):
+    if old is new:
+        return True
+    key = old.structural_hash()
+    return key is not None and key == new.structural_hash()
+
+def _same_parameters(old, new):
+    # Whether nodes are of the same type and have the same parameters,
+    # not counting their children
+    if type(old) is not type(new):
+        return False
+    for name in set(old.__dict__) | set(new.__dict__):
+        if name.startswith('_') or name in old.hash_exclude:
+            continue
+        values = [old.__dict__.get(name), new.__dict__.get(name)]
+        if all(isinstance(value, SdfNode) for value in values):
+            continue
+        if all(isinstance(value, list) and all(isinstance(item, SdfNode) for item in value) for value in values):
+            continue
+        hashes = [hashlib.sha1(), hashlib.sha1()]
+        if not all(_hash_value(value, h) for value, h in zip(values, hashes)):
+            return False
+        if hashes[0].digest() != hashes[1].digest():
+            return False
+    return True
+
+def _changed_union_region(old, new, margin):
+    old_items = dict()
+    for item in old.items:
+        old_items.setdefault(item.structural_hash() or id(item), []).append(item)
+    changed, same = [], []
+    for item in new.items:
+        items = old_items.get(item.structural_hash() or id(item))
+        if items:
+            items.pop()
+            same.append(item)
+        else:
+            changed.append(item)
+    changed.extend(item for items in old_items.values() for item in items)
+    boxes = [item.bounds() for item in changed]
+    if any(box is None for box in boxes):
+        return None
+    k = old.k or 0
+    if not k:
+        return [_box_expand(box, margin) for box in boxes]
+    # A changed child matters only where it is within k of the union of
+    # the children before it; each of the following children within k
+    # of the union can lower the value by k more. Count children which
+    # can be that near to the surface in the region, until the count
+    # does not grow.
+    result = []
+    for i, box in enumerate(boxes):
+        others = [child.bounds() for child in same + changed[:i] + changed[i+1:]]
+        unbounded = sum(1 for other in others if other is None)
+        others = [other for other in others if other is not None]
+        lo = np.array([other[0] for other in others]).reshape((-1, old.dim))
+        hi = np.array([other[1] for other in others]).reshape((-1, old.dim))
+        count = unbounded
+        while True:
+            region = _box_expand(box, margin + k * (1.25 + count))
+            r = margin + k * (1 + count)
+            near = np.all((lo - r <= region[1]) & (hi + r >= region[0]), axis=1)
+            new_count = unbounded + np.count_nonzero(near)
+            if new_count <= count:
+                break
+            count = new_count
+        result.append(region)
+    return result
+
+def changed_region(old, new, margin=0):
+    """
+    Find where the SDF tree `new` (next version of tree `old`) can have
+    different values near its surface. Common parts of the trees are
+    matched from the root: the region is made of bounding boxes of
+    subtrees which differ, so when one child of a large union is
+    modified, only the boxes of its old and new versions are returned.
+    Values which are larger than margin in both trees are not considered.
+    Return list of boxes (empty, if trees are the same); None if the
+    region is unknown or infinite.
+    """
+    if _same_tree(old, new):
+        return []
+    if _same_parameters(old, new):
+        if isinstance(old, (SdfTranslate, SdfRotate)):
+            boxes = changed_region(old.child, new.child, margin)
+            if boxes is None:
+                return None
+            return [old.transform_bounds(box) for box in boxes]
+        if isinstance(old, SdfDilate):
+            return changed_region(old.child, new.child, margin + abs(old.r))
+        if isinstance(old, SdfShell):
+            return changed_region(old.child, new.child, margin + abs(old.thickness) / 2)
+        if isinstance(old, (SdfUnion, SdfIntersection, SdfDifference)):
+            # Smooth minimum differs from the minimum by k/4 at most, and
+            # only where values of children are within k of each other
+            margin += 1.25 * (old.k or 0)
+            boxes = []
+            for a, b in [(old.a, new.a), (old.b, new.b)]:
+                child_boxes = changed_region(a, b, margin)
+                if child_boxes is None:
+                    return None
+                boxes.extend(child_boxes)
+            return boxes
+        if isinstance(old, SdfCulledUnion):
+            return _changed_union_region(old, new, margin)
+        if isinstance(old, SdfNaryIntersection) and len(old.items) == len(new.items):
+            # Same as the chain of pairwise intersections
+            margin += 1.25 * (old.k or 0) * (len(old.items) - 1)
+            boxes = []
+            for a, b in zip(old.items, new.items):
+                child_boxes = changed_region(a, b, margin)
+                if child_boxes is None:
+                    return None
+                boxes.extend(child_boxes)
+            return boxes
+    box = _box_union([old.bounds(), new.bounds()])
+    if box is None:
+        return None
+    return [_box_expand(box, margin)]
+
+## Bounding volume hierarchy
+
+class SdfBvh(object):
+    """
+    Bounding volume hierarchy over a list of axis-aligned boxes. Built by
+    splitting boxes at the median of their centers along the longest axis;
+    leaves hold up to LEAF_SIZE boxes.
+    """
+    LEAF_SIZE = 4
+
+    def __init__(self, boxes):
+        self.lo = np.array([box[0] for box in boxes], dtype=np.float64)
+        self.hi = np.array([box[1] for box in boxes], dtype=np.float64)
+        self.root = self._build(np.arange(len(boxes)))
+
+    def _build(self, items):
+        lo = self.lo[items].min(axis=0)
+        hi = self.hi[items].max(axis=0)
+        if len(items) <= SdfBvh.LEAF_SIZE:
+            return (lo, hi, items, None)
+        centers = (self.lo[items] + self.hi[items]) / 2
+        axis = np.argmax(np.ptp(centers, axis=0))
+        items = items[np.argsort(centers[:, axis], kind='stable')]
+        half = len(items) // 2
+        return (lo, hi, None, (self._build(items[:half]), self._build(items[half:])))
+
+    def query(self, q0, q1, margin=0):
+        """
+        For each query box (q0[i], q1[i]), find boxes which may contain
+        the surface nearest to some of its points. Distance between boxes
+        is a lower bound of the distance to the surface inside, and the
+        largest distance between their points is an upper bound; a box is
+        skipped for a query if its lower bound exceeds the least upper
+        bound found plus margin.
+        Return list of (box index, indices of queries) pairs, ordered by
+        box index.
+        """
+        best = np.full(len(q0), np.inf)
+        found = []
+        stack = [(self.root, np.arange(len(q0)))]
+        while stack:
+            (lo, hi, items, children), idx = stack.pop()
+            near = _box_distance(q0[idx], q1[idx], lo, hi)
+            idx = idx[near <= best[idx] + margin]
+            if not len(idx):
+                continue
+            if children is not None:
+                # Visit the nearer child first, to tighten the upper bound early
+                center = ((q0[idx] + q1[idx]) / 2).mean(axis=0)[np.newaxis]
+                left, right = children
+                if _box_distance(center, center, left[0], left[1])[0] < \
+                        _box_distance(center, center, right[0], right[1])[0]:
+                    stack.extend([(right, idx), (left, idx)])
+                else:
+                    stack.extend([(left, idx), (right, idx)])
+                continue
+            for item in items:
+                lo, hi = self.lo[item], self.hi[item]
+                near = _box_distance(q0[idx], q1[idx], lo, hi)
+                item_idx = idx[near <= best[idx] + margin]
+                if not len(item_idx):
+                    continue
+                far = _box_farthest(q0[item_idx], q1[item_idx], lo, hi)
+                best[item_idx] = np.minimum(best[item_idx], far)
+                found.append((item, item_idx))
+
+        # The upper bound could decrease after a box was visited
+        result = []
+        for item, idx in sorted(found, key=lambda pair: pair[0]):
+            near = _box_distance(q0[idx], q1[idx], self.lo[item], self.hi[item])
+            idx = idx[near <= best[idx] + margin]
+            if len(idx):
+                result.append((item, idx))
+        return result
+
+    def overlaps(self, q0, q1):
+        """
+        Return numbers of boxes which intersect each of query boxes
+        (q0[i], q1[i]).
+        """
+        counts = np.zeros(len(q0), dtype=np.int64)
+        stack = [(self.root, np.arange(len(q0)))]
+        while stack:
+            (lo, hi, items, children), idx = stack.pop()
+            idx = idx[np.all((q0[idx] <= hi) & (q1[idx] >= lo), axis=1)]
+            if not len(idx):
+                continue
+            if children is not None:
+                stack.extend((child, idx) for child in children)
+                continue
+            for item in items:
+                hit = np.all((q0[idx] <= self.hi[item]) & (q1[idx] >= self.lo[item]), axis=1)
+                counts[idx[hit]] += 1
+        return counts
+
+def _split_cells(points, size):
+    """
+    Group points into cells of a regular grid, with about `size` points
+    per cell. Return (order, starts): points[order] are sorted by cell,
+    and starts are indices of the first point of each nonempty cell.
+    """
+    n = len(points)
+    lo = points.min(axis=0)
+    extent = points.max(axis=0) - lo
+    count = max(n // size, 1)
+    # Cells are about cubic; flat point sets get one cell along thin axes
+    cell = (np.prod(extent[extent > 0]) / count) ** (1.0 / max(np.count_nonzero(extent), 1))
+    if not cell > 0:
+        return np.arange(n), np.array([0])
+    shape = np.maximum(np.ceil(extent / cell), 1).astype(np.int64)
+    cells = np.minimum(((points - lo) / cell).astype(np.int64), shape - 1)
+    keys = np.ravel_multi_index(tuple(cells.T), shape)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return order, starts
+
+def _fold_smooth_union(pairs, n, dim, k, gradient=False):
+    """
+    Smooth union of candidate values at each of n points, folded in
+    ascending order of values; pairs are (point indices, values[,
+    gradients]) of the candidates, each point must have some. The
+    accumulated value is never larger than the minimum, so candidates
+    which are not less than the minimum plus k do not change the result.
+    Return (values, gradients or None).
+    """
+    idx = np.concatenate([pair[0] for pair in pairs])
+    values = np.concatenate([pair[1] for pair in pairs])
+    order = np.lexsort((values, idx))
+    idx, values = idx[order], values[order]
+    grads = np.concatenate([pair[2] for pair in pairs])[order] if gradient else None
+    first = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+    rank = np.arange(len(idx)) - np.repeat(first, np.diff(np.append(first, len(idx))))
+    d = np.zeros(n, dtype=values.dtype)
+    g = np.zeros((n, dim)) if gradient else None
+    # Pairs of the same rank belong to different points
+    by_rank = np.argsort(rank, kind='stable')
+    starts = np.searchsorted(rank[by_rank], np.arange(rank.max() + 2))
+    for r in range(rank.max() + 1):
+        sel = by_rank[starts[r]:starts[r+1]]
+        points_idx = idx[sel]
+        if r == 0:
+            d[points_idx] = values[sel]
+            if gradient:
+                g[points_idx] = grads[sel]
+        elif gradient:
+            d[points_idx], g[points_idx] = _min_gradient(d[points_idx], g[points_idx], values[sel], grads[sel], k)
+        else:
+            d[points_idx] = _smooth_min(d[points_idx], values[sel], k)
+    return d, g
+
+class SdfCulledUnion(SdfNode):
+    """
+    Union of many SDFs. Children with known bounds are put into a BVH.
+    Query points are grouped into small spatial cells, and each cell
+    evaluates only the children which are near enough to change the
+    minimum (within k of it, for smooth union); children without bounds
+    are evaluated everywhere. Smooth union folds values of the children
+    at each point in ascending order: the accumulated value is not larger
+    than the minimum then, so skipped children would not change it, and
+    values do not depend on which points are evaluated together. For two
+    children it is the same as pairwise smooth union.
+    Children are evaluated by their own kernels, so this node is not
+    compiled into Numba kernels, and subtrees of its children are not
+    shared with the rest of the tree by the compiler (equal children are
+    still shared by deduplicate).
+    """
+    CELL_SIZE = 256
+    hash_exclude = ('bvh', 'bounded', 'unbounded', 'count')
+
+    def __init__(self, children, k=None):
+        self.items = list(children)
+        self.dim = self.items[0].dim
+        self.k = k
+        boxes = [child.bounds() for child in self.items]
+        self.unbounded = [i for i, box in enumerate(boxes) if box is None]
+        self.bounded = [i for i, box in enumerate(boxes) if box is not None]
+        if self.bounded:
+            self.bvh = SdfBvh([boxes[i] for i in self.bounded])
+        else:
+            self.bvh = None
+        # Smooth union step changes the minimum only where the values
+        # differ by less than k, so at most `count` children, whose boxes
+        # expanded by k overlap, are folded at any point
+        self.count = len(self.unbounded)
+        if self.bvh is not None:
+            if k:
+                self.count += int(self.bvh.overlaps(self.bvh.lo - 2 * k, self.bvh.hi + 2 * k).max())
+            else:
+                self.count += len(self.bounded)
+
+    def children(self):
+        # Children are evaluated by their own kernels, they are not
+        # compiled into the kernel of the union
+        return []
+
+    def bounds(self):
+        box = _box_union([child.bounds() for child in self.items])
+        # Each smooth union step can lower the minimum by k/4
+        return _box_expand(box, (self.count - 1) * (self.k or 0) / 4)
+
+    def interval(self, lo, hi):
+        intervals = [child.interval(lo, hi) for child in self.items]
+        # Each smooth union step can lower the minimum by k/4
+        dlo = np.min([i[0] for i in intervals], axis=0) - (self.count - 1) * (self.k or 0) / 4
+        return (dlo, np.min([i[1] for i in intervals], axis=0))
+
+    def candidates(self, points):
+        """
+        Return list of (child index, indices of points) pairs, ordered
+        by child index.
+        """
+        n = len(points)
+        result = [(i, np.arange(n)) for i in self.unbounded]
+        if self.bvh is not None and n > 0:
+            order, starts = _split_cells(points, SdfCulledUnion.CELL_SIZE)
+            sorted_points = points[order]
+            q0 = np.minimum.reduceat(sorted_points, starts, axis=0)
+            q1 = np.maximum.reduceat(sorted_points, starts, axis=0)
+            cells = np.split(order, starts[1:])
+            for item, idx in self.bvh.query(q0, q1, self.k or 0):
+                if len(idx) == len(cells):
+                    points_idx = np.arange(n)
+                else:
+                    points_idx = np.concatenate([cells[i] for i in idx])
+                result.append((self.bounded[item], points_idx))
+        result.sort(key=lambda pair: pair[0])
+        return result
+
+    def evaluate(self, points, out):
+        dtype = out.dtype
+        if not self.k:
+            out[...] = np.inf
+            for i, idx in self.candidates(points):
+                out[idx] = np.minimum(out[idx], self.items[i].kernel(dtype)(points[idx]))
+            return out
+        pairs = [(idx, self.items[i].kernel(dtype)(points[idx])) for i, idx in self.candidates(points)]
+        out[...] = _fold_smooth_union(pairs, len(points), self.dim, self.k)[0]
+        return out
+
+    def evaluate_with_gradient(self, points):
+        pairs = [(idx,) + self.items[i].evaluate_with_gradient(points[idx]) for i, idx in self.candidates(points)]
+        if not self.k:
+            d = np.full(len(points), np.inf)
+            g = np.zeros((len(points), self.dim))
+            for idx, d2, g2 in pairs:
+                d[idx], g[idx] = _min_gradient(d[idx], g[idx], d2, g2, None)
+            return d, g
+        return _fold_smooth_union(pairs, len(points), self.dim, self.k, gradient=True)
+
+    def compile(self, c, p):
+        d = c.alloc()
+        def step(p, d):
+            self.evaluate(p, d)
+        c.emit(step, p, d)
+        return d
+
+class SdfSegments(SdfNode):
+    """
+    Several SDF trees evaluated by one kernel call: points are split into
+    consecutive segments of `size` points, and each tree is evaluated at
+    points of its own segment, by its own kernel. Used to sample lattices
+    of many trees at once.
+    """
+    def __init__(self, children, size):
+        self.items = list(children)
+        self.dim = self.items[0].dim
+        self.size = size
+
+    def children(self):
+        # Children are evaluated by their own kernels, each for its own
+        # segment of points
+        return []
+
+    def evaluate(self, points, out):
+        size = self.size
+        for i, child in enumerate(self.items):
+            child.kernel(out.dtype)(points[i * size : (i + 1) * size], out=out[i * size : (i + 1) * size])
+        return out
+
+    def compile(self, c, p):
+        d = c.alloc()
+        def step(p, d):
+            self.evaluate(p, d)
+        c.emit(step, p, d)
+        return d
+
+class SdfInstances(SdfNode):
+    """
+    Union of copies of one SDF, placed by affine matrices ((m, 4, 4)
+    array). Centers of bounding spheres of the copies are put into a
+    KD-tree. Each query point evaluates the child for the nearest copy,
+    and for other copies within reach (twice the bounding radius) which
+    can change the minimum (within k of it, for smooth union), so the
+    cost does not grow with the number of copies. Values are exact
+    where they are not larger than the bounding radius; farther from
+    the surface they can be larger than the distance. Smooth union folds
+    values of copies at each point in ascending order, as SdfCulledUnion
+    does, so the result does not depend on the order of matrices. Values of scaled copies are multiplied by the smallest scale
+    factor, as SdfScale does. Copies by degenerate matrices (scaled to
+    zero along some axis) have no volume and are skipped. Requires SciPy.
+    """
+    hash_exclude = ('inverses', 'offsets', 'scales', 'ratio', 'centers', 'radius', 'reach', 'tree', 'count')
+
+    # Matrices with ratio of the smallest and the largest scale factors
+    # below this are degenerate
+    DEGENERATE = 1e-9
+
+    def __init__(self, child, matrices, k=None):
+        if child.dim != 3:
+            raise ValueError("SDF Instances require a 3D SDF")
+        self.child = child
+        self.dim = child.dim
+        self.k = k
+        matrices = np.asarray(matrices, dtype=np.float64).reshape((-1, 4, 4))
+        singular = np.linalg.svd(matrices[:,:3,:3], compute_uv=False)
+        valid = singular[:,-1] > singular[:,0] * SdfInstances.DEGENERATE
+        if not valid.any():
+            raise ValueError("SDF Instances require at least one non-degenerate matrix")
+        matrices = matrices[valid]
+        singular = singular[valid]
+        self.matrices = matrices
+        linear = matrices[:,:3,:3]
+        self.offsets = matrices[:,:3,3]
+        self.inverses = np.linalg.inv(linear)
+        self.scales = singular.min(axis=1)
+        # Positive values of non-uniformly scaled copies are smaller than
+        # the distance by this factor at most
+        self.ratio = (singular.min(axis=1) / singular.max(axis=1)).min()
+
+        box = child.bounds()
+        m = len(matrices)
+        if box is None:
+            self.centers = self.offsets
+            self.radius = np.inf
+        else:
+            center = (box[0] + box[1]) / 2
+            self.centers = np.einsum('mij,j->mi', linear, center) + self.offsets
+            self.radius = np.linalg.norm(box[1] - box[0]) / 2 * singular.max()
+        self.reach = 2 * self.radius + (k or 0)
+        self.tree = cKDTree(self.centers)
+        # Points within reach of several copies are within twice the
+        # reach from the centers of each of them
+        if np.isfinite(self.reach) and m > 1:
+            neighbours = self.tree.query_ball_point(self.centers, 2 * self.reach, return_length=True)
+            self.count = int(min(neighbours.max(), m))
+        else:
+            self.count = m
+
+    def children(self):
+        # The child is evaluated by its own kernel for each group of
+        # points, it is not compiled into the kernel of this node
+        return []
+
+    def bounds(self):
+        box = self.child.bounds()
+        if box is None:
+            return None
+        corners = np.einsum('mij,cj->mci', self.matrices[:,:3,:3], _box_corners(box)) + self.offsets[:,np.newaxis,:]
+        corners = corners.reshape((-1, 3))
+        # Each smooth union step can lower the minimum by k/4, and at most
+        # `count` copies are folded at any point
+        smooth = (self.count - 1) * (self.k or 0) / 4
+        return _box_expand((corners.min(axis=0), corners.max(axis=0)), smooth)
+
+    def lower_bound(self, distance):
+        """
+        Return lower bound of values of copies, given distances from
+        their centers.
+        """
+        d = distance - self.radius
+        return np.where(d > 0, d * self.ratio, d)
+
+    def candidates(self, points, values):
+        """
+        Generate (copy indices, indices of points) pairs, for nearest
+        copies in order of distance. Pairs after the first one include
+        only points where the copy can change the union, given the
+        smallest values so far (array which is updated by the caller
+        between pairs).
+        """
+        count = self.count
+        distances, copies = self.tree.query(points, k=count)
+        distances = distances.reshape((len(points), count))
+        copies = copies.reshape((len(points), count))
+        yield copies[:,0], np.arange(len(points))
+        margin = self.k or 0
+        for j in range(1, count):
+            # Lower bounds grow with j, and values do not, so once no
+            # point needs the copy, farther copies are not needed either
+            idx = np.flatnonzero((distances[:,j] <= self.reach) &
+                        (self.lower_bound(distances[:,j]) < values + margin))
+            if not len(idx):
+                break
+            yield copies[idx, j], idx
+
+    def transform(self, copies, points):
+        """
+        Map points into the space of the child by inverse matrices of copies.
+        """
+        return np.einsum('nij,nj->ni', self.inverses[copies], points - self.offsets[copies])
+
+    def evaluate(self, points, out):
+        kernel = self.child.kernel(out.dtype)
+        # Smallest values so far, which prune farther copies
+        best = np.full(len(points), np.inf, dtype=out.dtype)
+        pairs = []
+        for copies, idx in self.candidates(points, best):
+            q = self.transform(copies, points[idx]).astype(out.dtype, copy=False)
+            d = kernel(q) * self.scales[copies]
+            best[idx] = np.minimum(best[idx], d)
+            pairs.append((idx, d))
+        if not self.k:
+            out[...] = best
+        else:
+            out[...] = _fold_smooth_union(pairs, len(points), self.dim, self.k)[0]
+        return out
+
+    def evaluate_with_gradient(self, points):
+        best = np.full(len(points), np.inf)
+        pairs = []
+        for copies, idx in self.candidates(points, best):
+            d, g = self.child.evaluate_with_gradient(self.transform(copies, points[idx]))
+            scales = self.scales[copies]
+            d = d * scales
+            # Gradient by world points: transposed inverse linear part
+            g = np.einsum('nj,nji->ni', g, self.inverses[copies]) * scales[:,np.newaxis]
+            best[idx] = np.minimum(best[idx], d)
+            pairs.append((idx, d, g))
+        return _fold_smooth_union(pairs, len(points), self.dim, self.k or 0, gradient=True)
+
+    def interval(self, lo, hi):
+        center = (lo + hi) / 2
+        half = np.linalg.norm(hi - lo, axis=1) / 2
+        smooth = (self.count - 1) * (self.k or 0) / 4
+        distance, nearest = self.tree.query(center)
+        # Surfaces of copies are inside of their bounding spheres
+        dlo = self.lower_bound(distance - half) - smooth
+        # Values at points of the box are not larger than of the copy
+        # nearest to its center, if it is within reach of all of them
+        dhi = np.full(len(lo), np.inf)
+        near = distance + half <= self.reach
+        if near.any():
+            copies = nearest[near]
+            corners = np.stack([np.where(corner, hi[near], lo[near])
+                        for corner in itertools.product((False, True), repeat=3)], axis=1)
+            q = np.einsum('nij,ncj->nci', self.inverses[copies], corners - self.offsets[copies][:,np.newaxis,:])
+            clo, chi = self.child.interval(q.min(axis=1), q.max(axis=1))
+            dhi[near] = chi * self.scales[copies]
+        return (dlo, dhi)
+
+    def compile(self, c, p):
+        d = c.alloc()
+        def step(p, d):
+            self.evaluate(p, d)
+        c.emit(step, p, d)
+        return d
+
+class SdfBeamLattice(SdfNode):
+    """
+    Union of capsules (struts) along edges of a mesh, with radius given
+    for each edge. Smooth union (k) uses log-sum-exp, scaled so that for
+    two equal values it is less than the minimum by k/4, as the pairwise
+    one, so struts are blended at the nodes of the lattice.
+    Struts are listed in cells of a uniform grid which are within
+    `reach` of their capsules (radius of the thickest strut plus the
+    distance where smoothing stops to matter); points near the surface
+    test only struts of their own cell. Farther points find the nearest
+    struts by a BVH over bounding boxes of the capsules, so values are
+    distances everywhere.
+    """
+    exact = True
+    # Struts, which are farther than this number of log-sum-exp
+    # temperatures from the minimum, change smooth union by less than
+    # exp(-8) of the temperature
+    SMOOTH_CUTOFF = 8
+    # Maximum number of (point, strut) pairs evaluated at once
+    PAIRS_CHUNK = 1024 * 1024
+    # Maximum number of grid cells along one axis
+    MAX_GRID = 1024
+    hash_exclude = ('reach', 'origin', 'cell', 'shape', 'keys', 'starts', 'struts', 'max_count', 'bvh')
+
+    def __init__(self, verts, edges, radius, k=None):
+        self.verts = np.asarray(verts, dtype=np.float64).reshape((-1, 3))
+        self.edges = np.asarray(edges, dtype=np.int64).reshape((-1, 2))
+        if not len(self.edges):
+            raise ValueError("Beam lattice requires at least one edge")
+        self.radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(self.edges),)).copy()
+        self.k = k
+        self.reach = self.radius.max() + SdfBeamLattice.SMOOTH_CUTOFF * _lse_temperature(k)
+        self._build_grid()
+        a = self.verts[self.edges[:,0]]
+        b = self.verts[self.edges[:,1]]
+        pad = self.radius[:,np.newaxis]
+        self.bvh = SdfBvh(list(zip(np.minimum(a, b) - pad, np.maximum(a, b) + pad)))
+
+    def _build_grid(self):
+        a = self.verts[self.edges[:,0]]
+        b = self.verts[self.edges[:,1]]
+        pad = self.radius + self.reach
+        lo = np.minimum(a, b) - pad[:,np.newaxis]
+        hi = np.maximum(a, b) + pad[:,np.newaxis]
+        self.origin = lo.min(axis=0)
+        # Typical strut spans a few cells; grid is never finer than
+        # MAX_GRID cells along the largest side of the lattice
+        cell = max(np.median((hi - lo).max(axis=1)) / 2, (hi.max(axis=0) - self.origin).max() / SdfBeamLattice.MAX_GRID)
+        self.cell = cell if cell > 0 else 1.0
+        # Samples along each strut, not farther than one cell apart; a
+        # point within pad of the strut is within pad + cell/2 of some
+        # sample, so cells around samples cover the strut without the
+        # rest of its bounding box
+        length = np.linalg.norm(b - a, axis=1)
+        samples = np.ceil(length / self.cell).astype(np.int64) + 1
+        struts = np.repeat(np.arange(len(self.edges)), samples)
+        local = np.arange(len(struts)) - np.repeat(np.cumsum(samples) - samples, samples)
+        t = local / np.maximum(samples[struts] - 1, 1)
+        centers = a[struts] + (b - a)[struts] * t[:,np.newaxis]
+        half = (pad[struts] + self.cell / 2)[:,np.newaxis]
+        i0 = np.floor((centers - half - self.origin) / self.cell).astype(np.int64)
+        i1 = np.floor((centers + half - self.origin) / self.cell).astype(np.int64)
+        i0 = np.maximum(i0, 0)
+        self.shape = tuple(i1.max(axis=0) + 1)
+        sizes = i1 - i0 + 1
+        counts = sizes.prod(axis=1)
+        blocks = np.repeat(np.arange(len(struts)), counts)
+        # Position of each cell within the block of cells of its sample
+        local = np.arange(len(blocks)) - np.repeat(np.cumsum(counts) - counts, counts)
+        nx, ny = sizes[blocks,0], sizes[blocks,1]
+        cells = i0[blocks] + np.stack([local % nx, (local // nx) % ny, local // (nx * ny)], axis=1)
+        keys = np.ravel_multi_index(tuple(cells.T), self.shape)
+        # Blocks of neighbouring samples overlap; each (cell, strut) pair
+        # is kept once, sorted by cell
+        pairs = np.unique(keys * len(self.edges) + struts[blocks])
+        keys = pairs // len(self.edges)
+        self.struts = pairs % len(self.edges)
+        first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        self.keys = keys[first]
+        self.starts = np.append(first, len(keys))
+        self.max_count = int(np.diff(self.starts).max())
+
+    def children(self):
+        return []
+
+    def bounds(self):
+        a = self.verts[self.edges[:,0]]
+        b = self.verts[self.edges[:,1]]
+        r = self.radius[:,np.newaxis]
+        box = ((np.minimum(a, b) - r).min(axis=0), (np.maximum(a, b) + r).max(axis=0))
+        # Smooth union is less than the minimum by T*log(count) at most
+        return _box_expand(box, _lse_temperature(self.k) * np.log(self.max_count))
+
+    def pairs(self, points):
+        """
+        Return (point indices, strut indices) arrays of pairs to be
+        evaluated; point indices are sorted.
+        """
+        cells = np.floor((points - self.origin) / self.cell).astype(np.int64)
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        keys = np.ravel_multi_index(tuple(np.where(inside[:,np.newaxis], cells, 0).T), self.shape)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = inside & (self.keys[pos] == keys)
+        counts = np.where(found, self.starts[pos + 1] - self.starts[pos], 0)
+        point_idx = np.repeat(np.arange(len(points)), counts)
+        local = np.arange(len(point_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+        strut_idx = self.struts[np.repeat(self.starts[pos], counts) + local]
+        return point_idx, strut_idx
+
+    def far_pairs(self, points):
+        """
+        Same as pairs(), for points which are farther than `reach` from
+        the struts of their cells: struts are found by the BVH.
+        """
+        margin = SdfBeamLattice.SMOOTH_CUTOFF * _lse_temperature(self.k)
+        found = self.bvh.query(points, points, margin)
+        point_idx = np.concatenate([idx for item, idx in found])
+        strut_idx = np.concatenate([np.full(len(idx), item) for item, idx in found])
+        order = np.argsort(point_idx, kind='stable')
+        return point_idx[order], strut_idx[order]
+
+    def _chunks(self, points):
+        # Groups of points with bounded number of pairs
+        n = len(points)
+        step = max(SdfBeamLattice.PAIRS_CHUNK // max(self.max_count, 1), 1)
+        for start in range(0, n, step):
+            yield start, min(start + step, n)
+
+    def _reduce(self, points, point_idx, strut_idx, gradient):
+        # Union of struts given by pairs; return indices of points which
+        # have pairs, their values, and gradients
+        a = self.verts[self.edges[strut_idx,0]]
+        ba = self.verts[self.edges[strut_idx,1]] - a
+        pa = points[point_idx] - a
+        h = np.clip(np.einsum('ij,ij->i', pa, ba) / _nonzero(np.einsum('ij,ij->i', ba, ba)), 0, 1)
+        v = pa - ba * h[:,np.newaxis]
+        length = np.linalg.norm(v, axis=1)
+        d = length - self.radius[strut_idx]
+
+        first = np.flatnonzero(np.r_[True, point_idx[1:] != point_idx[:-1]])
+        owners = point_idx[first]
+        sizes = np.diff(np.append(first, len(d)))
+        dmin = np.minimum.reduceat(d, first)
+        T = _lse_temperature(self.k)
+        if T:
+            e = np.exp((np.repeat(dmin, sizes) - d) / T)
+            total = np.add.reduceat(e, first)
+            result = dmin - T * np.log(total)
+        else:
+            result = dmin
+
+        g = None
+        if gradient:
+            g = v / _nonzero(length)[:,np.newaxis]
+            if T:
+                w = e / np.repeat(total, sizes)
+                g = np.add.reduceat(g * w[:,np.newaxis], first)
+            else:
+                # Gradient of the nearest strut of each point
+                nearest = np.flatnonzero(d == np.repeat(dmin, sizes))
+                owner = point_idx[nearest]
+                keep = np.r_[True, owner[1:] != owner[:-1]]
+                g = v[nearest[keep]] / _nonzero(length[nearest[keep]])[:,np.newaxis]
+        return owners, dmin, result, g
+
+    def _evaluate(self, points, gradient=False):
+        # Values (and gradients) at points of one chunk
+        n = len(points)
+        values = np.empty(n)
+        grads = np.empty((n, 3)) if gradient else None
+        far = np.ones(n, dtype=bool)
+        point_idx, strut_idx = self.pairs(points)
+        if len(point_idx):
+            owners, dmin, result, g = self._reduce(points, point_idx, strut_idx, gradient)
+            # Cells list all struts within reach, so the nearest strut
+            # and the ones which change smooth union are there, unless
+            # the nearest one is farther than the thickest radius
+            near = dmin <= self.reach - SdfBeamLattice.SMOOTH_CUTOFF * _lse_temperature(self.k)
+            owners = owners[near]
+            values[owners] = result[near]
+            if gradient:
+                grads[owners] = g[near]
+            far[owners] = False
+        far = np.flatnonzero(far)
+        if len(far):
+            point_idx, strut_idx = self.far_pairs(points[far])
+            owners, dmin, result, g = self._reduce(points[far], point_idx, strut_idx, gradient)
+            values[far[owners]] = result
+            if gradient:
+                grads[far[owners]] = g
+        return values, grads
+
+    def evaluate(self, points, out):
+        for start, end in self._chunks(points):
+            out[start:end] = self._evaluate(np.asarray(points[start:end], dtype=np.float64))[0]
+        return out
+
+    def evaluate_with_gradient(self, points):
+        values = np.empty(len(points))
+        grads = np.empty((len(points), 3))
+        for start, end in self._chunks(points):
+            values[start:end], grads[start:end] = self._evaluate(points[start:end], gradient=True)
+        return values, grads
+
+    def compile(self, c, p):
+        d = c.alloc()
+        def step(p, d):
+            self.evaluate(p, d)
+        c.emit(step, p, d)
+        return d